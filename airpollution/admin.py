@@ -2,16 +2,25 @@ from django.contrib import admin
 
 # Register your models here.
 from airpollution.models import ObservationStationReading, ObservationStation, Measurement, Pollutant, Target
-from airpollution.models.models import EUStat, ChartViz
-from airpollution.models.models_copernicus import SatelliteImageFiles
-from airpollution.models.models_nuts import NutsRegions, EUCountries
-from airpollution.models.models_eea import EEADataModel
+from airpollution.models.models import EUStat, ChartViz, RenderedChart
+from airpollution.models.models_copernicus import SatelliteImageFiles, SatelliteRegionalAggregate
+from airpollution.models.models_nuts import NutsRegions, NutsRegionsSimplified, EUCountries
+from airpollution.models.models_eea import EEADataModel, SectorGroup, EmissionsCube
 from airpollution.models.models_eurostat_population import EurostatDataModel
+from airpollution.models.models_datasets import DatasetVersion
 
 admin.site.register(EUStat)
 admin.site.register(ChartViz)
 
 
+class RenderedChartAdmin(admin.ModelAdmin):
+    list_display = ('url', 'etag', 'content_type', 'rendered')
+    exclude = ('payload',)
+
+
+admin.site.register(RenderedChart, RenderedChartAdmin)
+
+
 class EurostatDataModelAdmin(admin.ModelAdmin):
     list_display = ('year', 'population', 'nutsRegionStr', 'nutsRegion')
     list_filter = ('year', 'nutsRegionStr', 'nutsRegion')
@@ -33,6 +42,15 @@ class EEADataModelAdmin(admin.ModelAdmin):
 
 
 admin.site.register(EEADataModel, EEADataModelAdmin)
+admin.site.register(SectorGroup)
+
+
+class EmissionsCubeAdmin(admin.ModelAdmin):
+    list_display = ('year', 'pollutant_name', 'pollutant', 'country', 'sector_group', 'emissions')
+    list_filter = ('pollutant', 'country', 'sector_group')  # will allow items to be filtered
+
+
+admin.site.register(EmissionsCube, EmissionsCubeAdmin)
 
 
 class SatelliteImageFilesAdmin(admin.ModelAdmin):
@@ -43,6 +61,14 @@ class SatelliteImageFilesAdmin(admin.ModelAdmin):
 admin.site.register(SatelliteImageFiles, SatelliteImageFilesAdmin)
 
 
+class SatelliteRegionalAggregateAdmin(admin.ModelAdmin):
+    list_display = ('date_time', 'pollutant', 'region', 'nuts_level', 'mean', 'max', 'area_over_target', 'cell_count')
+    list_filter = ('date_time', 'pollutant', 'nuts_level')  # will allow items to be filtered
+
+
+admin.site.register(SatelliteRegionalAggregate, SatelliteRegionalAggregateAdmin)
+
+
 class ObservationStationReadingAdmin(admin.ModelAdmin):
     list_display = ('date_time', 'country_code', 'air_quality_station', 'pollutant', 'value', 'validity', 'verification')
     list_filter = ('date_time', 'country_code', 'pollutant', 'validity', 'verification')  # will allow items to be filtered
@@ -67,6 +93,14 @@ class NutsRegionsAdmin(admin.ModelAdmin):
 admin.site.register(NutsRegions, NutsRegionsAdmin)
 
 
+class NutsRegionsSimplifiedAdmin(admin.ModelAdmin):
+    list_display = ('key', 'region', 'tolerance')
+    list_filter = ('tolerance', 'region__LEVL_CODE', 'region__CNTR_CODE')  # will allow items to be filtered
+
+
+admin.site.register(NutsRegionsSimplified, NutsRegionsSimplifiedAdmin)
+
+
 class MeasurementAdmin(admin.ModelAdmin):
     list_display = ('measurement', 'description')  # field will be displayed in column
 
@@ -91,3 +125,10 @@ admin.site.register(Target, TargetAdmin)
 
 
 
+
+
+class DatasetVersionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'version', 'updated')
+
+
+admin.site.register(DatasetVersion, DatasetVersionAdmin)
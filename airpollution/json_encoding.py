@@ -0,0 +1,106 @@
+"""
+JSON encoding of the api responses and the GeoJSON of the maps.
+orjson is used when it is installed.  It is several times faster than the json module and serializes
+NumPy types natively.  Coordinates of GeoJSON payloads are rounded to GEOJSON_COORDINATE_PRECISION decimals.
+"""
+import json
+import math
+
+import geopandas as gpd
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from eugreendeal.settings import GEOJSON_COORDINATE_PRECISION
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _replace_non_finite(data):
+    """
+    Replace NaN and infinite floats with None, as orjson does.
+    """
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {k: _replace_non_finite(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_replace_non_finite(v) for v in data]
+    return data
+
+
+class NumpyJSONEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder that also serializes NumPy scalars and arrays.
+    """
+    def default(self, o):
+        if isinstance(o, np.integer):
+            return int(o)
+        if isinstance(o, np.floating):
+            return _replace_non_finite(float(o))
+        if isinstance(o, np.ndarray):
+            return _replace_non_finite(o.tolist())
+        return super().default(o)
+
+
+def dumps(data) -> bytes:
+    """
+    Serialize data to JSON.  NaN and infinite values are serialized as null.
+    :param data: Data to serialize.  Dictionaries may have non-string keys (eg: years).
+    :return: JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=NumpyJSONEncoder().default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+    # the json module writes NaN and Infinity, which are not valid JSON
+    return json.dumps(_replace_non_finite(data), cls=NumpyJSONEncoder, allow_nan=False).encode()
+
+
+class ApiJsonResponse(HttpResponse):
+    """
+    JsonResponse of the api.  Any JSON serializable data is accepted (safe=False).
+    """
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def _round_coordinates(coords, precision: int):
+    if len(coords) == 0:
+        return coords
+
+    # a position
+    if isinstance(coords[0], (int, float)):
+        return [round(c, precision) for c in coords]
+
+    # a list of positions
+    if isinstance(coords[0][0], (int, float)):
+        return np.round(np.asarray(coords, dtype=float), precision).tolist()
+
+    return [_round_coordinates(c, precision) for c in coords]
+
+
+def to_geojson(gdf: gpd.GeoDataFrame, precision: int = GEOJSON_COORDINATE_PRECISION) -> str:
+    """
+    Serialize a GeoDataFrame to a GeoJSON string with coordinates rounded to a number of decimals.
+    :param gdf: GeoDataFrame to serialize
+    :param precision: Optional. Number of decimals of the coordinates.  Defaults to GEOJSON_COORDINATE_PRECISION.
+    :return: GeoJSON string
+    """
+    geo = gdf.__geo_interface__
+
+    for feature in geo['features']:
+        geometry = feature.get('geometry')
+        if geometry is not None and 'coordinates' in geometry:
+            geometry['coordinates'] = _round_coordinates(geometry['coordinates'], precision)
+        if 'bbox' in feature:
+            feature['bbox'] = _round_coordinates(feature['bbox'], precision)
+
+    if 'bbox' in geo:
+        geo['bbox'] = _round_coordinates(geo['bbox'], precision)
+
+    return dumps(geo).decode()
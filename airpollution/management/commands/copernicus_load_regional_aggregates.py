@@ -0,0 +1,49 @@
+"""
+This module will calculate the regional statistics of satellite images that are already loaded.
+Statistics of new images are calculated when images are loaded.
+Usage: python manage.py copernicus_load_regional_aggregates
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from airpollution.models.models_copernicus import SatelliteImageFiles, SatelliteRegionalAggregate
+from airpollution.models.models_datasets import DATASET_COPERNICUS
+from dataingestor.DataSource import bump_dataset_versions
+
+
+class Command(BaseCommand):
+    help = "Calculate NUTS regional statistics of loaded satellite images.  " \
+           "--all = recalculate images that already have statistics.  --nuts_levels = nuts levels (def: 0 1 2 3)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+        parser.add_argument('--nuts_levels', nargs='+', type=int, default=[0, 1, 2, 3])
+
+    def handle(self, *args, **options):
+
+        # set verbosity
+        verbosity = options.get('verbosity', 0)
+        v_map = {0: logging.ERROR, 1: logging.INFO, 2: logging.DEBUG}
+        options.update({'verbosity': v_map.get(verbosity, 0)})
+
+        logger = logging.getLogger("load_regional_aggregates")
+        logger.setLevel(level=options.get('verbosity', logging.ERROR))
+
+        images = SatelliteImageFiles.objects.all()
+        if not options.get('all'):
+            images = images.filter(regional_aggregates__isnull=True)
+
+        count = 0
+        for image_record in tqdm(images, desc='calculating regional aggregates'):
+            try:
+                count += SatelliteRegionalAggregate.load_for_image(image_record,
+                                                                   nuts_levels=options.get('nuts_levels'))
+            except Exception as e:
+                logger.error(f"Regional aggregates not loaded for {image_record.key}. {e}")
+
+        if count > 0:
+            bump_dataset_versions((DATASET_COPERNICUS,))
+
+        logger.info(f"Loaded {count} regional aggregates.")
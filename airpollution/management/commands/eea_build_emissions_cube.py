@@ -0,0 +1,18 @@
+"""
+This module will rebuild the emissions cube from the EEA emissions that are already loaded.
+The cube is rebuilt when EEA data is loaded.
+Usage: python manage.py eea_build_emissions_cube
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from airpollution.models.models_eea import EmissionsCube
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pre-aggregated emissions cube from the loaded EEA data."
+
+    def handle(self, *args, **options):
+        count = EmissionsCube.rebuild()
+        logging.info(f"Emissions cube rebuilt with {count} records.")
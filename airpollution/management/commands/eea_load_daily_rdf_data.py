@@ -1,23 +1,34 @@
 """
 author: Hemant Bajpai
 This module will load RDF data from EEA source.
-This command takes couple of hours to run so it is supposed to be done once a day.
-Usage: python manage.py eea_load_daily_rdf_data
+The RDF dump is streamed and parsed once for all the requested years, pollutants and countries.
+A csv file is written for each year.
+Usage: python manage.py eea_load_daily_rdf_data --years 2013-2017 --pollutants NOx PM2.5 --countries DE FR
+       python manage.py eea_load_daily_rdf_data --all
 """
 import os
 from django.core.management.base import BaseCommand
 from eugreendeal.settings import MEDIA_ROOT
-from dataingestor.EEA.EEADataSource import EEADataSource
+from dataingestor.EEA.EEADataSource import EEADataSource, parse_years, RDF_YEAR, RDF_POLLUTANTS, RDF_COUNTRIES
 
 
 class Command(BaseCommand):
-    help = "Load daily EEA rdf data into the database."
+    help = "Load daily EEA rdf data into csv files.  " \
+           f"--years, --pollutants and --countries select the records to extract " \
+           f"(def: {RDF_YEAR}, {' '.join(RDF_POLLUTANTS)} and {' '.join(RDF_COUNTRIES)}).  " \
+           "--all extracts all records of the filters that are not given."
 
     def add_arguments(self, parser):
         def_path = os.path.join(MEDIA_ROOT, 'media')
         parser.add_argument('-d', '--target_dir', nargs='?', type=str, default=def_path)
+        parser.add_argument('-s', '--source_file', nargs='?', type=str, default=None)  # local copy of the .rdf.gz dump
+        parser.add_argument('-y', '--years', nargs='+', type=str, default=None)  # YYYY or YYYY-YYYY
+        parser.add_argument('-p', '--pollutants', nargs='+', type=str, default=None)
+        parser.add_argument('-c', '--countries', nargs='+', type=str, default=None)
+        parser.add_argument('-a', '--all', action='store_true')
 
     def handle(self, *args, **options):
         print(f"Saving files to: {options['target_dir']}")
+        options.update({'years': parse_years(options.get('years'))})
         api = EEADataSource(name='EEA Data Source')
         api.load_data(**options)
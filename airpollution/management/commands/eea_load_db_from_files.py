@@ -2,24 +2,37 @@
 author: Hemant Bajpai
 This module will load the application database to include EEA data
 based on files that are already available.
-Usage: python manage.py eea_load_db_from_files
+Usage: python manage.py eea_load_db_from_files --years 2013-2017
 """
 import os
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from eugreendeal.settings import MEDIA_ROOT
-from dataingestor.EEA.EEADataSource import EEADataSource
-from airpollution.models.models_eea import EEADataModel
+from dataingestor.EEA.EEADataSource import EEADataSource, get_partition_file, get_partition_files, parse_years
 
 
 class Command(BaseCommand):
-    help = "Load existing EEA data files into the database."
+    help = "Load existing EEA data files into the database.  --years = years to load (def: all files available).  " \
+           "Only the records of the loaded years are replaced.  " \
+           "--processes = number of processes loading the files (def: 1)."
 
-    def handle(self, *args, **options):
-        for cop_obj in EEADataModel.objects.all():
-            cop_obj.delete()
+    def add_arguments(self, parser):
+        parser.add_argument('-y', '--years', nargs='+', type=str, default=None)  # YYYY or YYYY-YYYY
+        parser.add_argument('-p', '--processes', type=int, default=1)
 
+    def handle(self, *args, **options):
         def_path = os.path.join(MEDIA_ROOT, 'media')
-        fpath = os.path.join(def_path, "EEA_RDF_Complete_DATA.csv")
+        years = parse_years(options.get('years'))
+
+        if years is not None:
+            missing = [y for y in years if not os.path.exists(get_partition_file(def_path, y))]
+            if missing:
+                raise CommandError(f"No EEA data files for years: {', '.join(missing)}")
+
+        fpaths = get_partition_files(def_path, years=years)
+
+        # files written before the data was partitioned by year
+        if len(fpaths) == 0:
+            fpaths = [os.path.join(def_path, "EEA_RDF_Complete_DATA.csv")]
 
         api = EEADataSource(name='EEA Data Source')
-        api.load_db_from_file(fpath)
+        api.load_db_from_files(fpaths, processes=options.get('processes'), years=years)
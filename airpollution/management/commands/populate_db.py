@@ -9,7 +9,6 @@ from eugreendeal.settings import MEDIA_ROOT
 
 from airpollution.models.models import EUStat, EUCountryCode
 from dataingestor.copernicus.CopernicusDataSource import TARGET_DIR
-from dataingestor.EEA.EEADataSource import EEADataSource
 
 
 class Command(BaseCommand):
@@ -90,8 +89,5 @@ class Command(BaseCommand):
 
         # LOAD DATA FROM LOCAL EEA FILES
         logging.info("######### Loading EEA data ... ")
-        def_path = os.path.join(MEDIA_ROOT, 'media')
-        fpath = os.path.join(def_path, "EEA_RDF_Complete_DATA.csv")
-        api = EEADataSource(name='EEA Data Source')
-        api.load_db_from_file(fpath)
+        call_command('eea_load_db_from_files')
         logging.info("######### Done loading EEA data!")
@@ -0,0 +1,31 @@
+"""
+This module will render the charts of the persona and default dashboards from the loaded data.
+Charts are rendered when a data source finishes loading data.
+Usage: python manage.py prerender_charts
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+
+from airpollution.models.models import RenderedChart
+from airpollution.views.chart_prerender import prerender_charts
+
+
+class Command(BaseCommand):
+    help = "Render the charts of the persona and default dashboards.  --all = also render charts that are current."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        # set verbosity
+        verbosity = options.get('verbosity', 0)
+        v_map = {0: logging.ERROR, 1: logging.INFO, 2: logging.DEBUG}
+
+        logger = logging.getLogger("prerender_charts")
+        logger.setLevel(level=v_map.get(verbosity, logging.ERROR))
+
+        if options.get('all'):
+            RenderedChart.objects.all().delete()
+
+        prerender_charts(logger=logger)
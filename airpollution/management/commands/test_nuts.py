@@ -35,4 +35,4 @@ class Command(BaseCommand):
         for k, v in options.items():
             logging.info(f"{k}: {v}")
 
-        print(_md.df)
+        print(_md.dfs)
@@ -0,0 +1,52 @@
+"""
+Compression of the JSON responses of the api, charts and maps and the CSV exports of the api.
+"""
+import re
+
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# compression level of brotli (0 - 11).  Higher levels are too slow to compress responses in a request.
+BROTLI_QUALITY = 5
+
+re_accepts_brotli = re.compile(r'\bbr\b')
+
+# content types that are compressed
+COMPRESSED_CONTENT_TYPES = ('application/json', 'application/geo+json', 'text/csv')
+
+
+class CompressJsonMiddleware(GZipMiddleware):
+    """
+    Compresses JSON and CSV responses with brotli when the client accepts it and the brotli package is installed,
+    otherwise with gzip.  HTML pages are not compressed because they include CSRF tokens (BREACH attack).
+    """
+    def process_response(self, request, response):
+        if not response.get('Content-Type', '').startswith(COMPRESSED_CONTENT_TYPES):
+            return response
+
+        if brotli is not None and not response.streaming and not response.has_header('Content-Encoding') \
+                and len(response.content) >= 200 \
+                and re_accepts_brotli.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            patch_vary_headers(response, ('Accept-Encoding',))
+
+            compressed_content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            if len(compressed_content) >= len(response.content):
+                return response
+
+            response.content = compressed_content
+            response['Content-Length'] = str(len(response.content))
+
+            # the compressed content is a different representation of the same response
+            etag = response.get('ETag')
+            if etag and etag.startswith('"'):
+                response['ETag'] = 'W/' + etag
+            response['Content-Encoding'] = 'br'
+
+            return response
+
+        return super().process_response(request, response)
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.5 on 2020-05-20 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NutsRegionsSimplified',
+            fields=[
+                ('key', models.CharField(max_length=48, primary_key=True, serialize=False)),
+                ('tolerance', models.FloatField(db_index=True)),
+                ('geometry', models.CharField(max_length=4194304)),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simplified', to='airpollution.NutsRegions')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.5 on 2020-05-21 14:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0002_nutsregionssimplified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SatelliteRegionalAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_time', models.DateTimeField(db_index=True, null=True)),
+                ('nuts_level', models.IntegerField(db_index=True)),
+                ('mean', models.FloatField()),
+                ('max', models.FloatField()),
+                ('area_over_target', models.FloatField(null=True)),
+                ('cell_count', models.IntegerField()),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='regional_aggregates', to='airpollution.SatelliteImageFiles')),
+                ('pollutant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='satellite_aggregates', to='airpollution.Pollutant')),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='satellite_aggregates', to='airpollution.NutsRegions')),
+            ],
+            options={
+                'unique_together': {('image', 'region')},
+            },
+        ),
+    ]
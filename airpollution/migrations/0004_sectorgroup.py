@@ -0,0 +1,64 @@
+# Generated by Django 3.0.5 on 2020-05-22 10:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_sector_groups(apps, schema_editor):
+    SectorGroup = apps.get_model('airpollution', 'SectorGroup')
+    EEADataModel = apps.get_model('airpollution', 'EEADataModel')
+
+    names = EEADataModel.objects.values_list('sector_group_name', flat=True).distinct()
+    for name in names:
+        group, _ = SectorGroup.objects.get_or_create(name=name)
+        EEADataModel.objects.filter(sector_group_name=name).update(sector_group=group)
+
+
+def restore_sector_group_names(apps, schema_editor):
+    SectorGroup = apps.get_model('airpollution', 'SectorGroup')
+    EEADataModel = apps.get_model('airpollution', 'EEADataModel')
+
+    for group in SectorGroup.objects.all():
+        EEADataModel.objects.filter(sector_group=group).update(sector_group_name=group.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0003_satelliteregionalaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectorGroup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='eeadatamodel',
+            old_name='sector_group',
+            new_name='sector_group_name',
+        ),
+        migrations.AlterField(
+            model_name='eeadatamodel',
+            name='sector_group_name',
+            field=models.CharField(db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='eeadatamodel',
+            name='sector_group',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='eea_data', to='airpollution.SectorGroup'),
+        ),
+        migrations.RunPython(populate_sector_groups, restore_sector_group_names),
+        migrations.RemoveField(
+            model_name='eeadatamodel',
+            name='sector_group_name',
+        ),
+        migrations.AlterField(
+            model_name='eeadatamodel',
+            name='sector_group',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='eea_data', to='airpollution.SectorGroup'),
+        ),
+    ]
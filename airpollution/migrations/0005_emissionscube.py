@@ -0,0 +1,34 @@
+# Generated by Django 3.0.5 on 2020-05-22 15:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0004_sectorgroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmissionsCube',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(db_index=True, max_length=20)),
+                ('pollutant_name', models.CharField(max_length=20)),
+                ('year', models.IntegerField()),
+                ('emissions', models.FloatField()),
+                ('pollutant', models.ForeignKey(null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='emissions_cube', to='airpollution.Pollutant')),
+                ('sector_group', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='emissions_cube', to='airpollution.SectorGroup')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='emissionscube',
+            index=models.Index(fields=['sector_group', 'pollutant_name', 'year'], name='airpollutio_sector__012da0_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='emissionscube',
+            unique_together={('country', 'pollutant_name', 'sector_group', 'year')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2020-05-23 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0005_emissionscube'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eurostatdatamodel',
+            name='flags',
+            field=models.CharField(blank=True, default='', max_length=8),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.0.5 on 2020-05-24 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0007_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenderedChart',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.CharField(db_index=True, max_length=2048)),
+                ('etag', models.CharField(max_length=32, unique=True)),
+                ('content_type', models.CharField(max_length=100)),
+                ('payload', models.BinaryField()),
+                ('rendered', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
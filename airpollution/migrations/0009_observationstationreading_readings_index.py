@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2020-05-27 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0008_renderedchart'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='observationstationreading',
+            index=models.Index(fields=['date_time', 'air_quality_station', 'pollutant'], name='airpollutio_date_ti_9ecfc8_idx'),
+        ),
+    ]
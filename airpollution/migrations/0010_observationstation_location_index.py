@@ -0,0 +1,17 @@
+# Generated by Django 3.0.5 on 2020-05-27 15:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0009_observationstationreading_readings_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='observationstation',
+            index=models.Index(fields=['latitude', 'longitude'], name='airpollutio_latitud_61dfcc_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.5 on 2020-05-28 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airpollution', '0010_observationstation_location_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='emissionscube',
+            name='airpollutio_sector__012da0_idx',
+        ),
+        migrations.AddField(
+            model_name='emissionscube',
+            name='is_national_total',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='emissionscube',
+            unique_together={('country', 'pollutant_name', 'sector_group', 'year', 'is_national_total')},
+        ),
+        migrations.AddIndex(
+            model_name='emissionscube',
+            index=models.Index(fields=['is_national_total', 'sector_group', 'pollutant_name', 'year'], name='airpollutio_is_nati_7bc52a_idx'),
+        ),
+    ]
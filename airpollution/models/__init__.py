@@ -4,4 +4,5 @@ from .models_nuts import *
 from .models_observations import *
 from .models import *
 from .models_pollutants import *
-from .models_eurostat_population import *
\ No newline at end of file
+from .models_eurostat_population import *
+from .models_datasets import *
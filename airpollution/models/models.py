@@ -1,3 +1,5 @@
+import gzip
+
 from django.contrib.auth.models import Group
 
 from django.db import models
@@ -12,6 +14,51 @@ class ChartViz(models.Model):
     groups = models.ManyToManyField(Group, db_index=True)
 
 
+class RenderedChart(models.Model):
+    """
+    Pre-rendered response of a chart url (see airpollution/views/chart_prerender.py).
+    The etag identifies the chart and the versions of the datasets it was rendered from.
+    The payload is stored gzip compressed.
+    """
+    url = models.CharField(max_length=2048, db_index=True)
+    etag = models.CharField(max_length=32, unique=True)
+    content_type = models.CharField(max_length=100)
+    payload = models.BinaryField()
+    rendered = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.url
+
+    @staticmethod
+    def get_content(etag: str):
+        """
+        Returns the content of a pre-rendered chart.
+        :param etag: ETag of the chart request
+        :return: (content, content_type) or None if the chart was not rendered from the current data
+        """
+        rs = RenderedChart.objects.filter(etag=etag).values_list('payload', 'content_type').first()
+        if rs is None:
+            return None
+
+        payload, content_type = rs
+        return gzip.decompress(bytes(payload)), content_type
+
+    @staticmethod
+    def store(url: str, etag: str, content: bytes, content_type: str) -> None:
+        """
+        Store the rendered content of a chart url.  Renderings of the url from earlier data are removed.
+        :param url: Url of the chart including the query string
+        :param etag: ETag of the chart request
+        :param content: Response content
+        :param content_type: Response content type
+        :return: None
+        """
+        RenderedChart.objects.update_or_create(etag=etag, defaults={'url': url,
+                                                                    'content_type': content_type,
+                                                                    'payload': gzip.compress(content)})
+        RenderedChart.objects.filter(url=url).exclude(etag=etag).delete()
+
+
 class EUCountryCode(models.Model):
     country_code = models.CharField(max_length=2, db_index=True)
     country_name = models.CharField(max_length=20)
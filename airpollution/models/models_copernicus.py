@@ -3,12 +3,30 @@ Author: Mark McDonald
 This script includes models that support data
 originating from the Copernicus dataset.
 """
+import logging
+import os
+
 import netCDF4
 import numpy as np
 from django.core.validators import validate_comma_separated_integer_list
-from django.db import models
+from django.db import models, transaction
+
+from airpollution.models.models_nuts import NutsRegions, CURRENT_NUTS_VERSION, get_nuts_locator
+from airpollution.models.models_pollutants import Pollutant, Target
+from eugreendeal.settings import MEDIA_ROOT
+
+# Centers of the corner cells of the CAMS 0.1 degree grid - (minlon, minlat, maxlon, maxlat)
+# The first row of an image is the northern edge of the grid.  Images use the bounding box of their record.
+CAMS_GRID_BOUNDS = (-24.95, 30.05, 44.95, 69.95)
+
+# Decimals of the grid bounds in the cache keys of the grid labels
+GRID_BOUNDS_PRECISION = 4
+
+# Directory of the cached grid label arrays
+GRID_LABELS_DIR = os.path.join(MEDIA_ROOT, 'media', 'satellite_data', 'grid_labels')
 
-from airpollution.models.models_pollutants import Pollutant
+# Grid label arrays by (nuts_version, nuts_level, shape, grid_bounds) - avoids rasterizing regions for every image
+_grid_labels = {}
 
 
 class SatelliteImageFiles(models.Model):
@@ -141,12 +159,232 @@ class SatelliteImageFiles(models.Model):
 
         return images
 
+    def get_grid_bounds(self) -> tuple:
+        """
+        The centers of the corner cells of the image grid.  Longitudes are returned in the range -180 to 180.
+        :return: tuple (minlon, minlat, maxlon, maxlat)
+        """
+        minlon, maxlon = [lon - 360 if lon > 180 else lon for lon in (self.bbox_minlon, self.bbox_maxlon)]
+        return minlon, self.bbox_minlat, maxlon, self.bbox_maxlat
+
+    def get_image_array(self) -> np.ndarray:
+        """
+        The image of the record as a numpy array.
+        :return: 2-dimensional numpy array
+        """
+        new_shape = [int(x) for x in self.shape.split(" ")]
+        return np.array(self.image.split(" "), dtype=float).reshape(new_shape)
+
     @staticmethod
     def get_most_recent_date():
         dates = [d.get('date_time') for d in SatelliteImageFiles.objects.all().values('date_time')]
         return np.max(dates)
 
 
+class GridLabels:
+    """
+    The NUTS region of each cell of a satellite image grid.
+    Cells are sorted by region so that reductions over the regions are vectorized.
+    """
+
+    def __init__(self, keys: np.ndarray, labels: np.ndarray, weights: np.ndarray):
+        """
+        :param keys: The NUTS region keys.  The label of a cell is the index of its region in keys.
+        :param labels: Flattened array with the label of each grid cell.  -1 where a cell is not in a region.
+        :param weights: Flattened array with the relative area of each grid cell.
+        """
+        self.keys = keys
+        self.labels = labels
+        self.weights = weights
+
+    @staticmethod
+    def create(shape: tuple, nuts_level: int, nuts_version: int = CURRENT_NUTS_VERSION,
+               grid_bounds: tuple = CAMS_GRID_BOUNDS) -> 'GridLabels':
+        """
+        Rasterize a NUTS level onto a grid by locating the center of each cell.
+        :param shape: The shape of the grid images (rows, columns)
+        :param nuts_level: The nuts level of the regions
+        :param nuts_version: Optional. Defaults to the current NUTS version.
+        :param grid_bounds: Optional. Centers of the corner cells of the grid.
+        :return: GridLabels
+        """
+        minlon, minlat, maxlon, maxlat = grid_bounds
+        lats = np.linspace(maxlat, minlat, shape[0])
+        lons = np.linspace(minlon, maxlon, shape[1])
+        lon_grid, lat_grid = np.meshgrid(lons, lats)
+
+        cell_keys = get_nuts_locator(nuts_version).locate_many(lat_grid.flatten(), lon_grid.flatten(),
+                                                               nuts_level=nuts_level)
+
+        in_region = np.not_equal(cell_keys, None)
+        keys, labels = np.unique(cell_keys[in_region].astype(str), return_inverse=True)
+
+        rv_labels = np.full(len(cell_keys), -1, dtype=np.int32)
+        rv_labels[in_region] = labels
+
+        # the area of a cell is proportional to the cosine of its latitude
+        weights = np.cos(np.radians(lat_grid.flatten()))
+
+        return GridLabels(keys=keys, labels=rv_labels, weights=weights)
+
+
+def get_grid_labels(shape: tuple, nuts_level: int, nuts_version: int = CURRENT_NUTS_VERSION,
+                    grid_bounds: tuple = CAMS_GRID_BOUNDS) -> GridLabels:
+    """
+    Return the GridLabels of a NUTS level for a grid.
+    Labels are rasterized once and cached in memory and on disk.
+    :param shape: The shape of the grid images (rows, columns)
+    :param nuts_level: The nuts level of the regions
+    :param nuts_version: Optional. Defaults to the current NUTS version.
+    :param grid_bounds: Optional. Centers of the corner cells of the grid (eg: SatelliteImageFiles.get_grid_bounds()).
+    :return: GridLabels
+    """
+    shape = tuple(int(x) for x in shape)
+    grid_bounds = tuple(round(float(b), GRID_BOUNDS_PRECISION) for b in grid_bounds)
+    cache_key = (int(nuts_version), int(nuts_level), shape, grid_bounds)
+
+    if cache_key not in _grid_labels:
+        bounds_name = '_'.join(f"{b:g}" for b in grid_bounds)
+        cache_file = os.path.join(GRID_LABELS_DIR,
+                                  f"labels_{nuts_version}_{nuts_level}_{shape[0]}x{shape[1]}_{bounds_name}.npz")
+
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as f:
+                grid_labels = GridLabels(keys=f['keys'], labels=f['labels'], weights=f['weights'])
+        else:
+            grid_labels = GridLabels.create(shape, nuts_level=nuts_level, nuts_version=nuts_version,
+                                            grid_bounds=grid_bounds)
+            try:
+                os.makedirs(GRID_LABELS_DIR, exist_ok=True)
+                np.savez(cache_file, keys=grid_labels.keys, labels=grid_labels.labels, weights=grid_labels.weights)
+            except OSError as e:
+                logging.warning(f"Could not write grid labels file '{cache_file}': {e}")
+
+        _grid_labels[cache_key] = grid_labels
+
+    return _grid_labels[cache_key]
+
+
+def reset_grid_labels() -> None:
+    """
+    Discard the cached grid labels from memory and disk.  Called when NUTS regions are reloaded.
+    :return: None
+    """
+    _grid_labels.clear()
+
+    if os.path.isdir(GRID_LABELS_DIR):
+        for f in os.listdir(GRID_LABELS_DIR):
+            if f.startswith('labels_'):
+                os.remove(os.path.join(GRID_LABELS_DIR, f))
+
+
+def get_zonal_statistics(image: np.ndarray, grid_labels: GridLabels, target: float = None) -> dict:
+    """
+    Calculate the statistics of an image for each region of a grid.
+    :param image: 2-dimensional image
+    :param grid_labels: The GridLabels of the image grid
+    :param target: Optional. Target value used to calculate the area over target.
+    :return: Dictionary of numpy arrays (key, mean, max, area_over_target, cell_count) with one item per region
+    """
+    values = np.asarray(image, dtype=float).flatten()
+    valid = (grid_labels.labels >= 0) & np.isfinite(values)
+
+    labels = grid_labels.labels[valid]
+    values = values[valid]
+    weights = grid_labels.weights[valid]
+    n = len(grid_labels.keys)
+
+    cell_count = np.bincount(labels, minlength=n)
+    area = np.bincount(labels, weights=weights, minlength=n)
+    mean = np.bincount(labels, weights=values * weights, minlength=n) / np.where(area > 0, area, 1)
+
+    max_value = np.full(n, -np.inf)
+    np.maximum.at(max_value, labels, values)
+
+    if target is None:
+        area_over_target = np.full(n, np.nan)
+    else:
+        over = np.bincount(labels, weights=weights * (values > target), minlength=n)
+        area_over_target = over / np.where(area > 0, area, 1)
+
+    has_cells = cell_count > 0
+
+    return {'key': grid_labels.keys[has_cells],
+            'mean': mean[has_cells],
+            'max': max_value[has_cells],
+            'area_over_target': area_over_target[has_cells],
+            'cell_count': cell_count[has_cells]}
+
+
+class SatelliteRegionalAggregate(models.Model):
+    """
+    Statistics of a satellite image for a NUTS region.
+    Records are calculated when images are loaded.
+    """
+    image = models.ForeignKey(SatelliteImageFiles, on_delete=models.CASCADE, related_name='regional_aggregates',
+                              db_index=True)
+    region = models.ForeignKey(NutsRegions, on_delete=models.CASCADE, related_name='satellite_aggregates',
+                               db_index=True)
+    pollutant = models.ForeignKey(Pollutant, on_delete=models.CASCADE, related_name='satellite_aggregates',
+                                  db_index=True)
+    date_time = models.DateTimeField(null=True, db_index=True)
+    nuts_level = models.IntegerField(db_index=True)
+    mean = models.FloatField()
+    max = models.FloatField()
+    area_over_target = models.FloatField(null=True)
+    cell_count = models.IntegerField()
+
+    class Meta:
+        unique_together = ('image', 'region')
+
+    def __str__(self):
+        return f"{self.image_id}: {self.region_id}"
+
+    @staticmethod
+    def load_for_image(image_record: SatelliteImageFiles, image: np.ndarray = None, nuts_levels: list = (0, 1, 2, 3),
+                       nuts_version: int = CURRENT_NUTS_VERSION) -> int:
+        """
+        Calculate and save the regional statistics of a satellite image.  Existing statistics are replaced.
+        :param image_record: The SatelliteImageFiles record
+        :param image: Optional. The image array.  If None, the image is read from the record.
+        :param nuts_levels: Optional. The nuts levels for which to calculate statistics.
+        :param nuts_version: Optional. Defaults to the current NUTS version.
+        :return: Number of records saved
+        """
+        if image is None:
+            image = image_record.get_image_array()
+
+        target = Target.objects.filter(pollutant=image_record.pollutant_id, measurement='calendar_year') \
+            .values_list('value', flat=True).first()
+
+        records = []
+        for nuts_level in nuts_levels:
+            grid_labels = get_grid_labels(image.shape, nuts_level=nuts_level, nuts_version=nuts_version,
+                                          grid_bounds=image_record.get_grid_bounds())
+            stats = get_zonal_statistics(image, grid_labels, target=target)
+
+            for key, mean, max_value, area_over_target, cell_count in zip(stats['key'], stats['mean'], stats['max'],
+                                                                          stats['area_over_target'],
+                                                                          stats['cell_count']):
+                records.append(SatelliteRegionalAggregate(
+                    image=image_record,
+                    region_id=str(key),
+                    pollutant_id=image_record.pollutant_id,
+                    date_time=image_record.date_time,
+                    nuts_level=nuts_level,
+                    mean=float(mean),
+                    max=float(max_value),
+                    area_over_target=None if np.isnan(area_over_target) else float(area_over_target),
+                    cell_count=int(cell_count)))
+
+        # readers never see an image without statistics
+        with transaction.atomic():
+            SatelliteRegionalAggregate.objects.filter(image=image_record).delete()
+            SatelliteRegionalAggregate.objects.bulk_create(records, batch_size=10000)
+
+        return len(records)
+
+
 # class PollutionByLocation(models.Model):
 #     """
 #     This is for pollution data where our objective is:
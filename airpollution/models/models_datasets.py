@@ -0,0 +1,134 @@
+"""
+This script includes models that track when the data of each dataset was last loaded.
+The version of a dataset is increased every time a data source finishes loading it.
+Cached API responses include the versions of the datasets they were built from so that
+they are rebuilt after an ingest.
+"""
+import threading
+
+from django.core.signals import request_started
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+
+# names of the datasets loaded by the data sources
+DATASET_OBSERVATIONS = 'observations'
+DATASET_STATIONS = 'stations'
+DATASET_EMISSIONS = 'emissions'
+DATASET_POPULATION = 'population'
+DATASET_NUTS = 'nuts'
+DATASET_POLLUTANTS = 'pollutants'
+DATASET_COPERNICUS = 'copernicus'
+
+
+class DatasetVersion(models.Model):
+    """
+    Each record holds the version of a dataset.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+    @staticmethod
+    def bump(name: str) -> int:
+        """
+        Increase the version of a dataset.  Called when a data source finishes loading the dataset.
+        :param name: Name of the dataset (eg: DATASET_OBSERVATIONS)
+        :return: The new version of the dataset
+        """
+        with transaction.atomic():
+            version, created = DatasetVersion.objects.select_for_update().get_or_create(name=name)
+            # the increment is done by the database so that concurrent loads are not lost.
+            # update() does not set auto_now fields.
+            DatasetVersion.objects.filter(id=version.id).update(version=F('version') + 1, updated=timezone.now())
+
+        # caches of this process are checked on next use
+        DatasetCache.check_all()
+
+        return DatasetVersion.objects.values_list('version', flat=True).get(id=version.id)
+
+    @staticmethod
+    def get_versions(names: list) -> dict:
+        """
+        Returns the versions of datasets.  Datasets that were never loaded have version 0.
+        :param names: Names of the datasets
+        :return: dictionary of {name: version}
+        """
+        return {name: version for name, (version, updated) in DatasetVersion.get_version_info(names).items()}
+
+    @staticmethod
+    def get_version_info(names: list) -> dict:
+        """
+        Returns the versions of datasets and the time they were last loaded.
+        Datasets that were never loaded have version 0 and no time.
+        :param names: Names of the datasets
+        :return: dictionary of {name: (version, updated)}
+        """
+        info = dict.fromkeys(names, (0, None))
+        info.update((name, (version, updated)) for name, version, updated in
+                    DatasetVersion.objects.filter(name__in=names).values_list('name', 'version', 'updated'))
+
+        return info
+
+
+class DatasetCache:
+    """
+    A value cached by a process until the version of one of its datasets changes.  Datasets are loaded by
+    other processes (eg: management commands), so the versions are compared when the value is used.
+    The versions are queried at most once per request.
+    """
+    _caches = []
+
+    def __init__(self, *names):
+        """
+        :param names: Names of the datasets the value is built from (eg: DATASET_POLLUTANTS)
+        """
+        self.names = names
+        self.value = None
+        self.versions = None
+        self.checked = False
+        self.lock = threading.Lock()
+        DatasetCache._caches.append(self)
+
+    def get(self, build):
+        """
+        Return the cached value.  The value is built when it is not cached or a dataset was loaded.
+        :param build: Function without arguments that builds the value
+        :return: the value
+        """
+        if not self.checked:
+            versions = DatasetVersion.get_versions(self.names)
+            if versions != self.versions:
+                self.value = None
+                self.versions = versions
+            self.checked = True
+
+        value = self.value
+        if value is None:
+            with self.lock:
+                value = self.value
+                if value is None:
+                    value = build()
+                    self.value = value
+
+        return value
+
+    def reset(self) -> None:
+        """
+        Discard the value so that it is built on next use.
+        """
+        self.value = None
+
+    @staticmethod
+    def check_all(**kwargs) -> None:
+        """
+        Compare the versions of the datasets of every cache on next use.  Called when a request starts.
+        """
+        for cache in DatasetCache._caches:
+            cache.checked = False
+
+
+request_started.connect(DatasetCache.check_all)
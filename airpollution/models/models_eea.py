@@ -3,12 +3,42 @@ Author: Hemant Bajpai
 This script includes models that support data
 originating from the EEA dataset.
 """
-from django.db import models
-from django.db.models import Sum
+import pandas as pd
+from django.db import models, transaction
+from django.db.models import BooleanField, Case, Sum, Value, When
 
 from airpollution.models.models_nuts import NutsRegions
 from airpollution.models.models_pollutants import Pollutant
 
+# sector code of the reported national totals
+NATIONAL_TOTAL = 'NATIONAL_TOTAL'
+
+
+class SectorGroup(models.Model):
+    """
+    Sector groups of the EEA emissions.  Each sector code belongs to one group.
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def get_group_ids(names: list = None) -> dict:
+        """
+        Returns the ids of the sector groups.  Groups in names that do not exist are created.
+        :param names: Optional. Names of groups that must exist.
+        :return: dictionary of {name: id} of all sector groups
+        """
+        group_ids = dict(SectorGroup.objects.values_list('name', 'id'))
+
+        missing = [n for n in names or [] if n not in group_ids]
+        if missing:
+            SectorGroup.objects.bulk_create([SectorGroup(name=n) for n in missing], ignore_conflicts=True)
+            group_ids = dict(SectorGroup.objects.values_list('name', 'id'))
+
+        return group_ids
+
 
 class EEADataModel(models.Model):
     """
@@ -23,9 +53,56 @@ class EEADataModel(models.Model):
     country_code = models.ForeignKey(NutsRegions, on_delete=models.DO_NOTHING, null=True, related_name="eea_data",
                                      db_index=True)
     sector = models.CharField(max_length=20, db_index=True)
-    sector_group = models.CharField(max_length=100, db_index=True)
+    sector_group = models.ForeignKey(SectorGroup, on_delete=models.DO_NOTHING, related_name="eea_data", db_index=True)
     emissions = models.DecimalField(decimal_places=2, max_digits=25)
 
+    @staticmethod
+    def _filter_sectors(year=None, country_code=None, sector_group=None, pollutant=None):
+        """
+        Filter the records.  Each argument can be a single value or a list of values.
+        Arguments that are None or empty are not filtered.
+        :return: filtered queryset
+        """
+        qs = EEADataModel.objects.all()
+
+        for field, value in (('year', year),
+                             ('country', country_code),
+                             ('sector_group__name', sector_group),
+                             ('pollutant_name', pollutant)):
+            if value is None or value == '':
+                continue
+            if isinstance(value, (list, tuple, set)):
+                qs = qs.filter(**{f'{field}__in': value})
+            else:
+                qs = qs.filter(**{field: value})
+
+        return qs
+
+    @staticmethod
+    def get_sectors_df(years: list = None,
+                       country_codes: list = None,
+                       sector_groups: list = None,
+                       pollutants: list = None) -> pd.DataFrame:
+        """
+        Returns the total emissions by country, pollutant, sector group and year in a single query.
+        :param years: Optional. years
+        :param country_codes: Optional. country codes
+        :param sector_groups: Optional. sector group names
+        :param pollutants: Optional. pollutant names
+        :return: DataFrame with columns country, pollutant_name, sector_group, year, total_emissions
+        """
+        qs = EEADataModel._filter_sectors(year=years, country_code=country_codes, sector_group=sector_groups,
+                                          pollutant=pollutants)
+
+        rs = qs.values_list('country', 'pollutant_name', 'sector_group__name', 'year').annotate(
+            total_emissions=Sum('emissions'))
+
+        df = pd.DataFrame.from_records(rs, columns=['country', 'pollutant_name', 'sector_group', 'year',
+                                                    'total_emissions'])
+        df['total_emissions'] = df.total_emissions.astype(float)
+
+        return df
+
     @staticmethod
     def get_sectors_info(year: int = 0,
                          country_code: str = None,
@@ -39,47 +116,103 @@ class EEADataModel(models.Model):
         :param pollutant: pollutant.
         :return: The results will filter model based on these arguments.
         """
-        if sector_group:
-            qs = EEADataModel.objects.filter(sector_group=sector_group)
-        else:
-            qs = EEADataModel.objects.all()
-
-        if country_code:
-            qc = qs.filter(country=country_code)
-        else:
-            qc = qs
-
-        if type(year) == int:
-            qy = qc.filter(year=year)
-        else:
-            qy = qc
-
-        if pollutant:
-            qp = qy.filter(pollutant_name=pollutant)
-        else:
-            qp = qy
+        # only a year or a list of years is filtered (eg: year="" returns all years)
+        if type(year) != int and not isinstance(year, (list, tuple)):
+            year = None
+
+        qs = EEADataModel._filter_sectors(year=year, country_code=country_code, sector_group=sector_group,
+                                          pollutant=pollutant)
 
         # getting values based on groupby
-        query_set = qp.values('year', 'pollutant_name', 'country', 'sector_group').annotate(total_emissions=Sum('emissions'))
+        query_set = qs.values_list('country', 'year', 'pollutant_name', 'sector_group__name').annotate(
+            total_emissions=Sum('emissions'))
+
+        # creating map to return {country: {year: {pollutant: {sector_group: total_emissions}}}}
         rv = {}
+        for country, year, pollutant_name, group, total_emissions in query_set:
+            rv.setdefault(country, {}).setdefault(year, {}).setdefault(pollutant_name, {})[group] = total_emissions
 
-        # creating map to return
-        for obj in query_set:
-            if obj['country'] in rv:
-                if obj['year'] in rv[obj['country']]:
-                    if obj['pollutant_name'] in rv[obj['country']][obj['year']]:
-                        rv[obj['country']][obj['year']][obj['pollutant_name']][obj['sector_group']] = obj['total_emissions']
-                    else:
-                        rv[obj['country']][obj['year']][obj['pollutant_name']] = {}
-                        rv[obj['country']][obj['year']][obj['pollutant_name']][obj['sector_group']] = obj['total_emissions']
-                else:
-                    rv[obj['country']][obj['year']] = {}
-                    rv[obj['country']][obj['year']][obj['pollutant_name']] = {}
-                    rv[obj['country']][obj['year']][obj['pollutant_name']][obj['sector_group']] = obj['total_emissions']
-            else:
-                rv[obj['country']] = {}
-                rv[obj['country']][obj['year']] = {}
-                rv[obj['country']][obj['year']][obj['pollutant_name']] = {}
-                rv[obj['country']][obj['year']][obj['pollutant_name']][obj['sector_group']] = obj['total_emissions']
+        return rv
+
+
+class EmissionsCube(models.Model):
+    """
+    Total emissions by country, pollutant, sector group and year.
+    This is a pre-aggregated copy of EEADataModel that is rebuilt after each EEA load.
+    Pollutants are mapped to the application keys so views can read it without any lookups.
+    The reported national totals (sector NATIONAL_TOTAL) are kept apart from the other sectors of their
+    group with is_national_total, since memo items and unmapped sectors share the NATIONAL_TOTAL group.
+    """
+    country = models.CharField(max_length=20, db_index=True)
+    pollutant_name = models.CharField(max_length=20)
+    pollutant = models.ForeignKey(Pollutant, on_delete=models.DO_NOTHING, null=True, related_name="emissions_cube")
+    sector_group = models.ForeignKey(SectorGroup, on_delete=models.DO_NOTHING, related_name="emissions_cube")
+    year = models.IntegerField()
+    is_national_total = models.BooleanField(default=False)
+    emissions = models.FloatField()
+
+    class Meta:
+        unique_together = ('country', 'pollutant_name', 'sector_group', 'year', 'is_national_total')
+        indexes = [models.Index(fields=['is_national_total', 'sector_group', 'pollutant_name', 'year'])]
+
+    @staticmethod
+    def rebuild() -> int:
+        """
+        Replace the cube with the current totals of EEADataModel.
+        :return: Number of records in the cube
+        """
+        is_national_total = Case(When(sector=NATIONAL_TOTAL, then=Value(True)), default=Value(False),
+                                 output_field=BooleanField())
+        rs = EEADataModel.objects.annotate(is_national_total=is_national_total).values_list(
+            'country', 'pollutant_name', 'sector_group_id', 'year', 'is_national_total').annotate(
+            total_emissions=Sum('emissions'))
+
+        eea_lookup = {k: v.key for k, v in Pollutant.get_eea_pollutants().items()}
+
+        records = [EmissionsCube(country=country,
+                                 pollutant_name=pollutant_name,
+                                 pollutant_id=eea_lookup.get(pollutant_name),
+                                 sector_group_id=sector_group_id,
+                                 year=year,
+                                 is_national_total=national_total,
+                                 emissions=float(total_emissions))
+                   for country, pollutant_name, sector_group_id, year, national_total, total_emissions in rs]
+
+        with transaction.atomic():
+            EmissionsCube.objects.all().delete()
+            EmissionsCube.objects.bulk_create(records, batch_size=10000)
+
+        return len(records)
+
+    @staticmethod
+    def get_df(years: list = None,
+               country_codes: list = None,
+               sector_groups: list = None,
+               pollutants: list = None,
+               national_total: bool = None) -> pd.DataFrame:
+        """
+        Returns the total emissions by country, pollutant, sector group and year.
+        :param years: Optional. years
+        :param country_codes: Optional. country codes
+        :param sector_groups: Optional. sector group names
+        :param pollutants: Optional. EEA pollutant names
+        :param national_total: Optional. True for the national totals only, False for the sectors only
+        :return: DataFrame with columns country, pollutant_name, pollutant, sector_group, year, is_national_total,
+                 total_emissions (pollutant is the application key of the pollutant)
+        """
+        qs = EmissionsCube.objects.all()
+        if national_total is not None:
+            qs = qs.filter(is_national_total=national_total)
+
+        for field, values in (('year', years),
+                              ('country', country_codes),
+                              ('sector_group__name', sector_groups),
+                              ('pollutant_name', pollutants)):
+            if values is not None:
+                qs = qs.filter(**{f'{field}__in': values})
+
+        rs = qs.values_list('country', 'pollutant_name', 'pollutant_id', 'sector_group__name', 'year',
+                            'is_national_total', 'emissions')
 
-        return rv
\ No newline at end of file
+        return pd.DataFrame.from_records(rs, columns=['country', 'pollutant_name', 'pollutant', 'sector_group', 'year',
+                                                      'is_national_total', 'total_emissions'])
@@ -3,17 +3,27 @@ Author: Hemant Bajpai
 This script includes models that support data
 originating from the EEA dataset.
 """
+import pandas as pd
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
+from airpollution.models.models_datasets import DatasetCache, DATASET_POPULATION
 from airpollution.models.models_nuts import NutsRegions
 
 RECENT_VERSION = 2019
+
+# the population pivot (nuts_2_id x year) is rebuilt when the population is loaded by any process
+_population_cache = DatasetCache(DATASET_POPULATION)
+
+
 class EurostatDataModel(models.Model):
     """
     Each record holds parameters of data that are contained in a file.
     """
     year = models.IntegerField(db_index=True)
     population = models.IntegerField()
+    flags = models.CharField(max_length=8, blank=True, default='')  # eurostat flags of the value (eg: 'p' provisional)
     nutsRegionStr = models.CharField(max_length=20, db_index=True)
     nutsRegion = models.ForeignKey(NutsRegions, on_delete=models.CASCADE, related_name='nuts2_population', null=True)
 
@@ -32,4 +42,44 @@ class EurostatDataModel(models.Model):
         for r in qs:
             rv.update({nuts_2: r.population})
 
-        return rv
\ No newline at end of file
+        return rv
+
+    @staticmethod
+    def get_population_df() -> pd.DataFrame:
+        """
+        Returns the population of each NUTS 2 region by year.
+        The table is pivoted once and cached until records are saved or deleted or the population dataset
+        is loaded.
+        :return: Dataframe indexed by nuts_2_id with a column for each year
+        """
+        def build():
+            df = pd.DataFrame(EurostatDataModel.objects.all().values('year', 'nutsRegionStr', 'population'),
+                              columns=['year', 'nutsRegionStr', 'population'])
+            df = df.rename(columns={'nutsRegionStr': 'nuts_2_id'})
+            df_pivot = df.pivot_table(index='nuts_2_id', columns='year', values='population')
+            df_pivot.columns.name = None
+
+            return df_pivot
+
+        return _population_cache.get(build)
+
+    @staticmethod
+    def get_latest_population() -> pd.Series:
+        """
+        Returns the population of each NUTS 2 region for the most recent year.
+        :return: Series named 'population' indexed by nuts_2_id
+        """
+        df_pivot = EurostatDataModel.get_population_df()
+
+        if len(df_pivot.columns) == 0:
+            return pd.Series(name='population', dtype=float).rename_axis('nuts_2_id')
+
+        population = df_pivot[df_pivot.columns.max()]
+        population.name = 'population'
+
+        return population
+
+
+@receiver([post_save, post_delete], sender=EurostatDataModel)
+def _population_changed(sender, **kwargs) -> None:
+    _population_cache.reset()
@@ -3,12 +3,17 @@ Author: Mark McDonald
 This model holds nuts regions and shape geometry
 """
 import logging
+import shapely
 import shapely.wkt
-from shapely.geometry import Point
+from shapely.geometry import Point, Polygon
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 
 from django.db import models
 
 import geopandas as gpd
+import numpy as np
+import pandas as pd
 
 # Default NUTS version - 4-digit integer of year version published
 CURRENT_NUTS_VERSION = 2016
@@ -16,6 +21,43 @@ EU_ISOCODES = ['AT', 'BE', 'BG', 'HR', 'CY', 'CZ', 'DK', 'EE', 'FI',
                'FR', 'DE', 'GR', 'HU', 'IE', 'IT', 'LV', 'LT', 'LU',
                'MT', 'NL', 'PL', 'PT', 'RO', 'SK', 'SI', 'ES', 'SE', 'UK']
 
+# Bounds of the EU's main territories (excluding far off islands) - (minx, miny, maxx, maxy)
+EU_BOUNDS = (-24.95, 30.05, 44.95, 71.95)
+
+# Tolerances (in degrees) of the simplified boundaries that are precomputed for each NUTS region.
+# Ordered from the finest to the coarsest resolution.
+SIMPLIFY_TOLERANCES = (0.01, 0.05, 0.1, 0.25)
+
+# shapely 2 STRtrees answer vectorized queries
+_SHAPELY_2 = int(shapely.__version__.split('.')[0]) >= 2
+
+
+def get_eu_bounds_polygon() -> Polygon:
+    """
+    Return the EU_BOUNDS as a shapely Polygon that can be used to clip maps.
+    :return: Polygon of the EU bounds
+    """
+    minx, miny, maxx, maxy = EU_BOUNDS
+    return Polygon([(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)])
+
+
+def get_simplify_tolerance(width: int = 600, height: int = 600) -> float:
+    """
+    Return the coarsest precomputed tolerance that does not exceed the size of a single pixel
+    when the EU bounds are rendered in a map of width x height pixels.
+    :param width: Width of the rendered map in pixels
+    :param height: Height of the rendered map in pixels
+    :return: One of the values in SIMPLIFY_TOLERANCES
+    """
+    minx, miny, maxx, maxy = EU_BOUNDS
+    degrees_per_pixel = min((maxx - minx) / max(int(width), 1), (maxy - miny) / max(int(height), 1))
+
+    tolerances = [t for t in SIMPLIFY_TOLERANCES if t <= degrees_per_pixel]
+    if len(tolerances) == 0:
+        return SIMPLIFY_TOLERANCES[0]
+
+    return max(tolerances)
+
 
 class NutsRegions(models.Model):
     """
@@ -37,12 +79,14 @@ class NutsRegions(models.Model):
 
     @staticmethod
     def get_nuts_region_boundaries(nuts_level: list = None, country_codes: list = None,
-                                   year: int = CURRENT_NUTS_VERSION) -> dict:
+                                   year: int = CURRENT_NUTS_VERSION, tolerance: float = None) -> dict:
         """
         Return the basic regional information for NUTS regions.
         :param nuts_level: Nuts level for which to return data.  If None, all are returned.
         :param country_codes: List of country code for which boundaries are returned.  If None, all EU countries are returned.
         :param year: The year of the NUTS version..  Defaults to the current version.
+        :param tolerance: Optional. One of SIMPLIFY_TOLERANCES. If provided, the simplified and EU-clipped
+                          boundaries are returned instead of the full resolution boundaries.
         :return: A dictionary with the shape objects for each NUTS region.
         """
 
@@ -55,6 +99,15 @@ class NutsRegions(models.Model):
                                            'geography': r.geometry}})
             return rv
 
+        def _create_simplified_level_dict(level_qs, country_list: list) -> dict:
+            rv = {}
+            for r in level_qs.select_related('region'):
+                if r.region.CNTR_CODE in country_list:
+                    rv.update({r.region.NUTS_ID: {'name': r.region.NUTS_NAME,
+                                                  'country_code': r.region.CNTR_CODE,
+                                                  'geography': r.geometry}})
+            return rv
+
         if nuts_level is None:
             levels_list = [0, 1, 2, 3]
         else:
@@ -67,8 +120,13 @@ class NutsRegions(models.Model):
 
         rv_dict = {}
         for level in levels_list:
-            qs = NutsRegions.objects.filter(LEVL_CODE=level, year=year)
-            rv_dict.update({level: _create_level_dict(qs, country_codes)})
+            if tolerance is None:
+                qs = NutsRegions.objects.filter(LEVL_CODE=level, year=year)
+                rv_dict.update({level: _create_level_dict(qs, country_codes)})
+            else:
+                qs = NutsRegionsSimplified.objects.filter(region__LEVL_CODE=level, region__year=year,
+                                                          tolerance=tolerance)
+                rv_dict.update({level: _create_simplified_level_dict(qs, country_codes)})
 
         return rv_dict
 
@@ -158,20 +216,190 @@ class NutsRegions(models.Model):
         :return: The results records from the dataset where the lat/lon point is in.
         """
 
-        gdf = NutsRegions.get_nuts_geoframe(nuts_level=nuts_level)
-
-        point = gpd.GeoSeries(Point(lon, lat), crs=crs).to_crs(gdf.crs)[0]
+        nuts_key = get_nuts_locator(nuts_version).locate(lat, lon, nuts_level=nuts_level, crs=crs)
 
-        try:
-            nuts_key = gdf[(gdf.contains(point)) & (gdf.LEVL_CODE == nuts_level)].iloc[0].key
-        except (AttributeError, Exception) as e:
-            err = f"{e} : lat:{lat}  lon:{lon}  nuts_level:{nuts_level}  year:{nuts_version}  crs:{crs}"
-            logging.info(err)
+        if nuts_key is None:
+            logging.info(f"No NUTS region found : lat:{lat}  lon:{lon}  nuts_level:{nuts_level}  "
+                         f"year:{nuts_version}  crs:{crs}")
             return None
 
         return NutsRegions.objects.get(pk=nuts_key)
 
 
+class NutsLocator:
+    """
+    Point-in-region lookups for NUTS regions.
+    The regions of each level are loaded once and held in a shapely STRtree so that points can be
+    located without scanning every region.  Use get_nuts_locator() to get the shared instance of a NUTS version.
+    """
+
+    def __init__(self, nuts_version: int = CURRENT_NUTS_VERSION, crs: int = 4326):
+        self.nuts_version = nuts_version
+        self.crs = crs
+        self._levels = {}
+
+    def _get_level(self, nuts_level: int) -> tuple:
+        """
+        Return the STRtree, the region keys and the geometries of a nuts level.  Loaded on first use.
+        :param nuts_level: The nuts level
+        :return: tuple of (STRtree, array of keys, list of geometries)
+        """
+        if nuts_level not in self._levels:
+            rs = NutsRegions.objects.filter(LEVL_CODE=nuts_level, year=self.nuts_version).values_list('key', 'geometry')
+
+            keys = np.array([r[0] for r in rs], dtype=object)
+            geoms = [shapely.wkt.loads(r[1]) for r in rs]
+
+            self._levels[nuts_level] = (STRtree(geoms), keys, geoms)
+
+        return self._levels[nuts_level]
+
+    def _to_locator_crs(self, lats: np.ndarray, lons: np.ndarray, crs: int) -> tuple:
+        if crs == self.crs:
+            return lats, lons
+
+        points = gpd.GeoSeries(gpd.points_from_xy(lons, lats), crs=crs).to_crs(self.crs)
+        return points.y.values, points.x.values
+
+    def locate(self, lat: float, lon: float, nuts_level: int, crs: int = 4326):
+        """
+        Return the key of the NUTS region that a point is in.
+        :param lat: Latitude of the point
+        :param lon: Longitude of the point
+        :param nuts_level: The nuts level of the region to return
+        :param crs: Optional. CRS of the point.  Defaults to 4326.
+        :return: The key of the NUTS region or None if the point is not in a region
+        """
+        return self.locate_many(np.array([lat]), np.array([lon]), nuts_level=nuts_level, crs=crs)[0]
+
+    def locate_many(self, lats, lons, nuts_level: int, crs: int = 4326) -> np.ndarray:
+        """
+        Return the keys of the NUTS regions that an array of points are in.
+        :param lats: Array of latitudes
+        :param lons: Array of longitudes
+        :param nuts_level: The nuts level of the regions to return
+        :param crs: Optional. CRS of the points.  Defaults to 4326.
+        :return: Object array of NUTS region keys.  None where a point is not in a region.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        lats, lons = self._to_locator_crs(lats, lons, crs)
+
+        tree, keys, geoms = self._get_level(nuts_level)
+        rv = np.full(len(lats), None, dtype=object)
+
+        if len(keys) == 0 or len(lats) == 0:
+            return rv
+
+        if _SHAPELY_2:
+            # vectorized query - returns the indices of matching points and regions
+            point_idx, region_idx = tree.query(shapely.points(lons, lats), predicate='within')
+            # regions only share boundaries, so keep the first region found for a point
+            rv[point_idx[::-1]] = keys[region_idx[::-1]]
+        else:
+            # shapely 1.x trees return candidate geometries - test them with prepared geometries
+            index_lookup = {id(g): i for i, g in enumerate(geoms)}
+            prepared = {}
+            for n, (lat, lon) in enumerate(zip(lats, lons)):
+                point = Point(lon, lat)
+                for g in tree.query(point):
+                    i = index_lookup[id(g)]
+                    if i not in prepared:
+                        prepared[i] = prep(g)
+                    if prepared[i].contains(point):
+                        rv[n] = keys[i]
+                        break
+
+        return rv
+
+    def locate_records(self, lats, lons, nuts_level: int, crs: int = 4326) -> list:
+        """
+        Return the NUTS region records that an array of points are in.
+        :param lats: Array of latitudes
+        :param lons: Array of longitudes
+        :param nuts_level: The nuts level of the regions to return
+        :param crs: Optional. CRS of the points.  Defaults to 4326.
+        :return: List of NutsRegions records.  None where a point is not in a region.
+        """
+        keys = self.locate_many(lats, lons, nuts_level=nuts_level, crs=crs)
+        records = NutsRegions.objects.in_bulk([k for k in set(keys) if k is not None])
+
+        return [records.get(k) for k in keys]
+
+
+# NutsLocator objects by NUTS version - avoids reloading the regions for every lookup
+_locators = {}
+
+
+def get_nuts_locator(nuts_version: int = CURRENT_NUTS_VERSION) -> NutsLocator:
+    """
+    Return the shared NutsLocator of a NUTS version.
+    :param nuts_version: Optional. Defaults to the current NUTS version.
+    :return: NutsLocator
+    """
+    nuts_version = int(nuts_version)
+    if nuts_version not in _locators:
+        _locators[nuts_version] = NutsLocator(nuts_version=nuts_version)
+
+    return _locators[nuts_version]
+
+
+def reset_nuts_locators() -> None:
+    """
+    Discard the loaded NutsLocators.  Called when NUTS regions are reloaded.
+    :return: None
+    """
+    _locators.clear()
+
+
+class NutsRegionsSimplified(models.Model):
+    """
+    Simplified boundaries of NUTS regions used to render maps.
+    Each record holds the geometry of a region clipped to the EU_BOUNDS and
+    simplified at one of the SIMPLIFY_TOLERANCES.  Records are generated by load_nuts_data.
+    """
+    key = models.CharField(max_length=48, primary_key=True)
+    region = models.ForeignKey(NutsRegions, on_delete=models.CASCADE, related_name='simplified', db_index=True)
+    tolerance = models.FloatField(db_index=True)
+    geometry = models.CharField(max_length=4194304)
+
+    def __str__(self):
+        return self.key
+
+    @staticmethod
+    def get_geoframe(nuts_level: int = None, tolerance: float = SIMPLIFY_TOLERANCES[0], country_codes: list = None,
+                     nuts_version: int = CURRENT_NUTS_VERSION, crs: int = 4326) -> gpd.GeoDataFrame:
+        """
+        Return the simplified NUTS regions as a GeoDataFrame.
+        :param nuts_level: Optional.  If None, all levels are returned.
+        :param tolerance: Optional. One of SIMPLIFY_TOLERANCES.  Defaults to the finest resolution.
+        :param country_codes: Optional. List of country codes to include.  If None, all countries are returned.
+        :param nuts_version: Optional. Defaults to the current NUTS version.
+        :param crs: Optional. Default set to 4326.
+        :return: GeoPandas DataFrame with the simplified NUTS regions
+        """
+        qs = NutsRegionsSimplified.objects.filter(region__year=nuts_version, tolerance=tolerance)
+
+        if nuts_level is not None:
+            qs = qs.filter(region__LEVL_CODE=nuts_level)
+        if country_codes is not None:
+            qs = qs.filter(region__CNTR_CODE__in=[c.upper() for c in country_codes])
+
+        rs = qs.values('region__key', 'region__year', 'region__id', 'region__LEVL_CODE', 'region__NUTS_ID',
+                       'region__CNTR_CODE', 'region__NUTS_NAME', 'region__FID', 'geometry')
+
+        df = pd.DataFrame(rs, columns=['region__key', 'region__year', 'region__id', 'region__LEVL_CODE',
+                                       'region__NUTS_ID', 'region__CNTR_CODE', 'region__NUTS_NAME', 'region__FID',
+                                       'geometry'])
+        df.columns = [c.replace('region__', '') for c in df.columns]
+        df['geometry'] = [shapely.wkt.loads(g) for g in df['geometry']]
+
+        gdf = gpd.GeoDataFrame(df, geometry='geometry')
+        gdf.crs = crs  # set the projection
+
+        return gdf
+
+
 class EUCountries(models.Model):
     key = models.CharField(max_length=4, primary_key=True)
     nuts_region = models.ForeignKey(NutsRegions, on_delete=models.DO_NOTHING, null=True, related_name="EU_countries",
@@ -9,7 +9,9 @@ import logging
 import pandas as pd
 import pytz
 from django.db import models
-from django.db.models import Avg
+from django.db.models import Avg, Count, Exists, OuterRef, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 
 from airpollution.models.models_nuts import NutsRegions, EUCountries, EU_ISOCODES
 from airpollution.models.models_pollutants import Pollutant
@@ -17,6 +19,47 @@ from airpollution.models.models_pollutants import Pollutant
 model_logger = logging.getLogger("model_logger")
 model_logger.setLevel(logging.ERROR)
 
+# columns of the tables returned by ObservationStationReading.daily_df() and annual_df()
+DAILY_DF_COLUMNS = ['country_code', 'date', 'pollutant', 'day-avg-level', 'ytd-avg-level',
+                    'prior-day-avg-level', 'prior-ytd-avg-level']
+ANNUAL_DF_COLUMNS = ['country_code', 'year', 'pollutant', 'value']
+
+# ordering of the readings used for keyset pagination (see ObservationStationReading.readings())
+READINGS_KEY = ('date_time', 'air_quality_station', 'pollutant')
+DAY_MEAN_KEY = ('date', 'air_quality_station', 'pollutant')
+
+# columns of the rows returned by ObservationStation.get_stations()
+STATION_COLUMNS = ['air_quality_station', 'country_code', 'air_quality_network', 'air_quality_station_eoicode',
+                   'air_quality_station_natcode', 'projection', 'longitude', 'latitude', 'altitude', 'nuts_1',
+                   'nuts_2', 'nuts_3', 'air_quality_station_area']
+
+# nuts regions of the stations are returned as NUTS ids rather than the keys of the NutsRegions records
+STATION_FIELDS = [f'{c}__NUTS_ID' if c in ('nuts_1', 'nuts_2', 'nuts_3') else c for c in STATION_COLUMNS]
+
+# columns of the rows returned by ObservationStationReading.readings() and day_means()
+READINGS_COLUMNS = ['date_time', 'air_quality_station', 'country_code', 'pollutant', 'value', 'unit', 'validity',
+                    'verification']
+DAY_MEAN_COLUMNS = ['date', 'air_quality_station', 'country_code', 'pollutant', 'value', 'unit', 'hours']
+
+
+def _get_regions_q(regions: list, station_prefix: str = '') -> Q:
+    """
+    Return a filter of the stations or readings in nuts regions.
+    Nuts ids of each level have a different length.  Level 0 ids are country codes.
+    :param regions: Nuts ids of any level
+    :param station_prefix: Lookup of the station from the filtered model (eg: 'air_quality_station__')
+    :return: Q
+    """
+    q = Q(pk__in=[])
+    for r in regions:
+        level = len(r) - 2
+        if level == 0:
+            q |= Q(country_code=r.upper())
+        elif level in (1, 2, 3):
+            q |= Q(**{f'{station_prefix}nuts_{level}__NUTS_ID': r.upper()})
+
+    return q
+
 
 class ObservationStation(models.Model):
     """
@@ -37,6 +80,44 @@ class ObservationStation(models.Model):
     nuts_3 = models.ForeignKey(NutsRegions, on_delete=models.CASCADE, related_name='nuts3_stations', null=True)
     air_quality_station_area = models.CharField(max_length=32)
 
+    class Meta:
+        # bounding box queries of get_stations()
+        indexes = [models.Index(fields=['latitude', 'longitude'])]
+
+    @staticmethod
+    def get_stations(stations: list = None, countries: list = None, regions: list = None, area_types: list = None,
+                     pollutants: list = None, bbox: tuple = None):
+        """
+        Returns the query of the stations.  Rows are tuples of STATION_COLUMNS.  Nuts regions are NUTS ids
+        (eg: AT11).  Unless regions or pollutants are filtered, the only joins are those of the nuts regions.
+        :param stations: Optional. Station codes to include.
+        :param countries: Optional. Country codes to include.  Ignored if regions are provided.
+        :param regions: Optional. Nuts ids of any level to include.
+        :param area_types: Optional. Area types to include (eg: urban, suburban, rural).
+        :param pollutants: Optional. Only stations with readings of these pollutants are included.
+        :param bbox: Optional. (min longitude, min latitude, max longitude, max latitude) of the stations.
+        :return: QuerySet of tuples
+        """
+        qs = ObservationStation.objects.all()
+
+        if stations:
+            qs = qs.filter(air_quality_station__in=stations)
+        if regions:
+            qs = qs.filter(_get_regions_q(regions))
+        elif countries:
+            qs = qs.filter(country_code__in=[c.upper() for c in countries])
+        if area_types:
+            qs = qs.filter(air_quality_station_area__in=area_types)
+        if bbox is not None:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            qs = qs.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+        if pollutants:
+            readings = ObservationStationReading.objects.filter(air_quality_station=OuterRef('pk'),
+                                                                pollutant__in=[p.upper() for p in pollutants])
+            qs = qs.filter(Exists(readings))
+
+        return qs.order_by('air_quality_station').values_list(*STATION_FIELDS)
+
     # @staticmethod
     # def get_geoframe(crs: int = None):
     #     gdf = gpd.GeoDataFrame()
@@ -141,6 +222,98 @@ class ObservationStationReading(models.Model):
     validity = models.IntegerField()
     verification = models.IntegerField()
 
+    class Meta:
+        # ordering of the readings api (see readings())
+        indexes = [models.Index(fields=['date_time', 'air_quality_station', 'pollutant'])]
+
+    @staticmethod
+    def _filter_readings(start: datetime.datetime = None, end: datetime.datetime = None, stations: list = None,
+                         countries: list = None, regions: list = None, pollutants: list = None,
+                         valid_only: bool = False):
+        qs = ObservationStationReading.objects.all()
+
+        if start is not None:
+            qs = qs.filter(date_time__gte=start)
+        if end is not None:
+            qs = qs.filter(date_time__lte=end)
+        if stations:
+            qs = qs.filter(air_quality_station__in=stations)
+
+        if regions:
+            qs = qs.filter(_get_regions_q(regions, station_prefix='air_quality_station__'))
+        elif countries:
+            qs = qs.filter(country_code__in=[c.upper() for c in countries])
+
+        if pollutants:
+            qs = qs.filter(pollutant__in=[p.upper() for p in pollutants])
+        if valid_only:
+            qs = qs.filter(validity=1)
+
+        return qs
+
+    @staticmethod
+    def after_key(qs, key: tuple, fields: tuple = READINGS_KEY):
+        """
+        Filter a query to the rows that follow a key in the order of fields (keyset pagination).
+        :param qs: QuerySet ordered by fields
+        :param key: Values of fields of the last row of the previous page
+        :param fields: Names of the ordering fields
+        :return: QuerySet
+        """
+        q = Q(pk__in=[])
+        for i, field in enumerate(fields):
+            q |= Q(**dict(zip(fields[:i], key[:i])), **{f'{field}__gt': key[i]})
+
+        # the bound on the first field is a range condition of the index - the disjunction alone is not
+        return qs.filter(Q(**{f'{fields[0]}__gte': key[0]}) & q)
+
+    @staticmethod
+    def readings(start: datetime.datetime = None, end: datetime.datetime = None, stations: list = None,
+                 countries: list = None, regions: list = None, pollutants: list = None,
+                 valid_only: bool = False, after: tuple = None):
+        """
+        Returns the query of the hourly readings.  Rows are tuples of READINGS_COLUMNS ordered by READINGS_KEY,
+        which is the order of the composite index of the model.
+        :param start: Optional. Earliest date_time (inclusive).
+        :param end: Optional. Latest date_time (inclusive).
+        :param stations: Optional. Station codes to include.
+        :param countries: Optional. Country codes to include.  Ignored if regions are provided.
+        :param regions: Optional. Nuts ids of any level to include.
+        :param pollutants: Optional. Pollutant keys to include.
+        :param valid_only: Optional. If True, only valid readings are included.
+        :param after: Optional. READINGS_KEY values of the last row of the previous page.
+        :return: QuerySet of tuples
+        """
+        qs = ObservationStationReading._filter_readings(start, end, stations, countries, regions, pollutants,
+                                                        valid_only)
+        if after is not None:
+            qs = ObservationStationReading.after_key(qs, after)
+
+        return qs.order_by(*READINGS_KEY).values_list(*READINGS_COLUMNS)
+
+    @staticmethod
+    def day_means(start: datetime.datetime = None, end: datetime.datetime = None, stations: list = None,
+                  countries: list = None, regions: list = None, pollutants: list = None, after: tuple = None):
+        """
+        Returns the query of the daily means of the valid hourly readings of each station and pollutant.
+        Rows are tuples of DAY_MEAN_COLUMNS ordered by DAY_MEAN_KEY.  Dates are in the current time zone.
+        See readings() for the parameters.
+        :param after: Optional. DAY_MEAN_KEY values of the last row of the previous page.
+        :return: QuerySet of tuples
+        """
+        qs = ObservationStationReading._filter_readings(start, end, stations, countries, regions, pollutants,
+                                                        valid_only=True).annotate(date=TruncDate('date_time'))
+        if after is not None:
+            # limits the readings scanned by the index before filtering on the date
+            first = datetime.datetime.combine(after[0], datetime.time.min)
+            qs = qs.filter(date_time__gte=timezone.make_aware(first))
+            qs = ObservationStationReading.after_key(qs, after, DAY_MEAN_KEY)
+
+        return qs.values('date', 'air_quality_station', 'country_code', 'pollutant', 'unit') \
+            .annotate(mean_value=Avg('value'), hours=Count('value')) \
+            .order_by(*DAY_MEAN_KEY) \
+            .values_list('date', 'air_quality_station', 'country_code', 'pollutant', 'mean_value', 'unit', 'hours')
+
     @staticmethod
     def _get_rs_year_dayavg_by_country(country_code: str, year: int, logger: logging.Logger, pollutants: list = None):
         """
@@ -290,6 +463,47 @@ class ObservationStationReading(models.Model):
 
         return ObservationStationReading._combine_into_df(rs_PY, rs_CY, logger)
 
+    @staticmethod
+    def daily_df(start_date: str, end_date: str,
+                 countries: list = None, pollutants: list = None,
+                 logger: logging.Logger = model_logger) -> pd.DataFrame:
+        """
+        Returns the daily statistics of countries and pollutants as a table.  Dates must be within a single year.
+        :param logger:
+        :param start_date: YYYY-MM-DD string of start date
+        :param end_date: YYYY-MM-DD string of end date
+        :param countries: List of iso codes of countries
+        :param pollutants: List of key string values of pollutants
+        :return: DataFrame with a row per country, date (YYYY-MM-DD) and pollutant and columns DAILY_DF_COLUMNS
+        """
+        s_year, s_month, s_day = [int(s) for s in start_date.split('-')]
+        e_year, e_month, e_day = [int(s) for s in end_date.split('-')]
+
+        if s_year != e_year:
+            logger.info(f'Can only produce results an range of dates within a single year. {s_year}-{e_year}')
+            return pd.DataFrame(columns=DAILY_DF_COLUMNS)
+
+        if countries is None:
+            countries = EU_ISOCODES
+
+        if pollutants is None:
+            pollutants = Pollutant.get_keys()
+
+        df = ObservationStationReading._get_daily_countries_df(countries, e_year, pollutants, logger)
+        if len(df) == 0:
+            return pd.DataFrame(columns=DAILY_DF_COLUMNS)
+
+        # filter for countries and dates requested
+        s_date = datetime.datetime(year=s_year, month=s_month, day=s_day)
+        e_date = datetime.datetime(year=e_year, month=e_month, day=e_day)
+        df = df[df['country_code'].isin(countries) & (df['date_time_CY'] >= s_date) & (df['date_time_CY'] <= e_date)]
+
+        df = df.rename(columns={'pollutant__key': 'pollutant'})
+        df['date'] = df['date_time_CY'].dt.strftime('%Y-%m-%d')
+
+        return df[DAILY_DF_COLUMNS].drop_duplicates(subset=['country_code', 'date', 'pollutant']) \
+            .reset_index(drop=True)
+
     @staticmethod
     def daily(start_date: str, end_date: str,
               countries: list = None, pollutants: list = None,
@@ -304,10 +518,8 @@ class ObservationStationReading(models.Model):
                 :param pollutants: List of key string values of pollutants
                 :return: Dictionary with daily statistics per pollutant per country
         """
-
-        c_dict = {}
-        s_year, s_month, s_day = [int(s) for s in start_date.split('-')]
-        e_year, e_month, e_day = [int(s) for s in end_date.split('-')]
+        s_year = int(start_date.split('-')[0])
+        e_year = int(end_date.split('-')[0])
 
         # start_year and end_year must be the same year
         if s_year != e_year:
@@ -316,46 +528,28 @@ class ObservationStationReading(models.Model):
         if countries is None:
             countries = EU_ISOCODES
 
-        if pollutants is None:
-            pollutants = Pollutant.get_keys()
-
-        df = ObservationStationReading._get_daily_countries_df(countries, e_year, pollutants, logger)
+        df = ObservationStationReading.daily_df(start_date, end_date, countries, pollutants, logger)
+        groups = dict(tuple(df.groupby('country_code')))
 
+        c_dict = {}
         for c in countries:
-            c_df = df[df['country_code'] == c]
-            if len(c_df) == 0:
+            c_df = groups.get(c)
+            if c_df is None:
                 continue
 
-            # filter for dates requested
-            s_date = datetime.datetime(year=s_year, month=s_month, day=s_day)
-            e_date = datetime.datetime(year=e_year, month=e_month, day=e_day)
-            c_df = c_df[(c_df['date_time_CY'] >= s_date) & (c_df['date_time_CY'] <= e_date)]
-
-            c_pollutants = c_df['pollutant__key'].unique()
-
-            # get unique days for current year
-            cy_dates = c_df['date_time_CY'].unique()
-
-            d_dict = {}
-            for cy_date in cy_dates:
-                p_dict = {}
-                day_df = c_df[c_df['date_time_CY'] == cy_date]
-
-                for p in c_pollutants:
-                    p_df = day_df[day_df['pollutant__key'] == p]
-
-                    if len(p_df) == 0:
-                        p_dict.update({p: {'day-avg-level': None,
-                                           'ytd-avg-level': None,
-                                           'prior-day_avg_level': None,
-                                           'prior-ytd-avg-level': None}})
-                    else:
-                        p_df = p_df.iloc[0]
-                        p_dict.update({p: {'day-avg-level': p_df['day-avg-level'],
-                                           'ytd-avg-level': p_df['ytd-avg-level'],
-                                           'prior-day_avg_level': p_df['prior-day-avg-level'],
-                                           'prior-ytd-avg-level': p_df['prior-ytd-avg-level']}})
-                d_dict.update({cy_date.astype(str).split('T')[0]: p_dict})
+            # every pollutant of the country is included on each day
+            c_pollutants = c_df['pollutant'].unique()
+            d_dict = {d: {p: {'day-avg-level': None,
+                              'ytd-avg-level': None,
+                              'prior-day_avg_level': None,
+                              'prior-ytd-avg-level': None} for p in c_pollutants}
+                      for d in c_df['date'].unique()}
+
+            for d, p, day, ytd, prior_day, prior_ytd in zip(*[c_df[col].tolist() for col in DAILY_DF_COLUMNS[1:]]):
+                d_dict[d][p] = {'day-avg-level': day,
+                                'ytd-avg-level': ytd,
+                                'prior-day_avg_level': prior_day,
+                                'prior-ytd-avg-level': prior_ytd}
 
             c_dict.update({c: d_dict})
 
@@ -380,66 +574,66 @@ class ObservationStationReading(models.Model):
         return readings_df
 
     @staticmethod
-    def annual(years: list = None, countries: list = None, pollutants: list = None,
-               logger: logging.Logger = model_logger) -> dict:
+    def annual_values(years: list = None, countries: list = None, pollutants: list = None):
         """
-        Returns a dictionary of annual averages.
-        :param years: Required. Years to include.  If year is not in DB, it is excluded from return value.
-        :param countries: Optional. Countries to include.  Includes all EU countries if not provided. If country is missing from DB, it is excluded from response.
-        :param pollutants: Optional. Pollutants to include.  Includes all pollutants if not provided. If pollutant is missing from DB, it is excluded from response.
-        :param logger: Optional. Logger to display log results.
-        :return: Dictionary of annual average of pollutants by country and year.
+        Returns the query of the annual averages.  Rows are tuples of ANNUAL_DF_COLUMNS ordered by year.
+        The query is evaluated lazily so that exports can iterate over it without loading all rows.
+        :param years: Optional. Years to include.  Includes all years in the DB if not provided.
+        :param countries: Optional. Countries to include.  Includes all EU countries if not provided.
+        :param pollutants: Optional. Pollutants to include.  Includes all pollutants if not provided.
+        :return: QuerySet of tuples
         """
-
         if countries is None:
             countries = EU_ISOCODES
 
         if pollutants is None:
             pollutants = list(Pollutant.get_observation_pollutants().keys())
 
-        if years is None:
-            years = []
-            u_years_rs = ObservationStationReading.objects.filter(country_code__in=countries, validity=1,
-                                                                  pollutant__in=map(str.upper, pollutants)).values(
-                'date_time__year').distinct()
-            for item in u_years_rs:
-                years.append(list(item.values())[0])
-        years.sort()
-
-        # craete dataframe of all years
-        df = pd.DataFrame()
-        for year in years:
-            try:
-                rs = ObservationStationReading.objects.filter(country_code__in=countries,
-                                                              date_time__year=year,
-                                                              validity=1,
-                                                              pollutant__in=map(str.upper, pollutants)).values(
-                    'date_time__year',
-                    'country_code',
-                    'pollutant__key') \
-                    .annotate(Avg('value'))
-
-            except Exception as e:
-                logger.info(f"{e}")
-                continue
+        qs = ObservationStationReading.objects.filter(country_code__in=countries, validity=1,
+                                                      pollutant__in=[p.upper() for p in pollutants])
+        if years is not None:
+            qs = qs.filter(date_time__year__in=years)
 
-            if rs is None or len(rs) == 0:
-                logger.info(f"No records in {year}")
-                continue
+        return qs.values_list('country_code', 'date_time__year', 'pollutant__key').annotate(Avg('value')) \
+            .order_by('date_time__year')
+
+    @staticmethod
+    def annual_df(years: list = None, countries: list = None, pollutants: list = None,
+                  logger: logging.Logger = model_logger) -> pd.DataFrame:
+        """
+        Returns the annual averages as a table.
+        :param years: Optional. Years to include.  Includes all years in the DB if not provided.
+        :param countries: Optional. Countries to include.  Includes all EU countries if not provided.
+        :param pollutants: Optional. Pollutants to include.  Includes all pollutants if not provided.
+        :param logger: Optional. Logger to display log results.
+        :return: DataFrame with a row per country, year and pollutant and columns ANNUAL_DF_COLUMNS
+        """
+        rs = ObservationStationReading.annual_values(years=years, countries=countries, pollutants=pollutants)
+
+        df = pd.DataFrame.from_records(rs, columns=ANNUAL_DF_COLUMNS)
+        if len(df) == 0:
+            logger.info(f"No records: {countries} {years} {pollutants}")
+
+        return df
 
-            df = df.append(pd.DataFrame(rs))
+    @staticmethod
+    def annual(years: list = None, countries: list = None, pollutants: list = None,
+               logger: logging.Logger = model_logger) -> dict:
+        """
+        Returns a dictionary of annual averages.
+        :param years: Required. Years to include.  If year is not in DB, it is excluded from return value.
+        :param countries: Optional. Countries to include.  Includes all EU countries if not provided. If country is missing from DB, it is excluded from response.
+        :param pollutants: Optional. Pollutants to include.  Includes all pollutants if not provided. If pollutant is missing from DB, it is excluded from response.
+        :param logger: Optional. Logger to display log results.
+        :return: Dictionary of annual average of pollutants by country and year.
+        """
+        df = ObservationStationReading.annual_df(years=years, countries=countries, pollutants=pollutants,
+                                                 logger=logger)
 
         # create dictionary formatted per requirements
         rv_dict = {}
-        u_countries = df.country_code.unique()
-        for c in u_countries:
-            u_years = df[df.country_code == c].date_time__year.unique()
-            y_dict = {}
-
-            for y in u_years:
-                xx_df = df[(df.country_code == c) & (df.date_time__year == y)]
-                y_dict.update({int(y): dict(zip(xx_df['pollutant__key'], xx_df['value__avg']))})
-            rv_dict.update({c: y_dict})
+        for c, y, p, value in zip(*[df[col].tolist() for col in ANNUAL_DF_COLUMNS]):
+            rv_dict.setdefault(c, {}).setdefault(int(y), {})[p] = value
 
         return rv_dict
 
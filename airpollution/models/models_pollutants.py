@@ -5,14 +5,17 @@ and the pollutant targets
 """
 import logging
 import datetime
+
 import pytz
 import pandas as pd
 
 from django.db import models
-from django.db.models import Q, Avg
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Avg
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.http import JsonResponse
 
+from airpollution.models.models_datasets import DatasetCache, DATASET_POLLUTANTS
 from airpollution.models.models_nuts import EU_ISOCODES
 
 
@@ -44,8 +47,7 @@ class Pollutant(models.Model):
         Return the list of pollutant keys supported by the database
         :return:
         """
-        qs = Pollutant.objects.all()
-        return {p.key for p in qs}
+        return set(get_pollutant_registry().pollutants)
 
     @staticmethod
     def get(pollutant: str) -> str:
@@ -55,54 +57,33 @@ class Pollutant(models.Model):
         :param pollutant: Any string used to describe a pollutant
         :return: The key value used in the application for pollutant
         """
-        try:
-            rv = Pollutant.objects.get(Q(copernicus_key__iexact=pollutant) |
-                                       Q(observation_key__iexact=pollutant) |
-                                       Q(eea_key__iexact=pollutant) |
-                                       Q(key__iexact=pollutant))
-        except ObjectDoesNotExist as e:
+        rv = get_pollutant_registry().get_key(pollutant)
+        if rv is None:
             logging.info(f"'{pollutant}' is not supported.")
-            return None
 
-        return rv.key
+        return rv
 
     @staticmethod
     def get_eea_pollutants() -> dict:
-        pollutants_lookup = {}
-        pollutants = Pollutant.objects.filter(eea_key__isnull=False)
-        for p in pollutants:
-            pollutants_lookup.update({p.eea_key: p})
-
-        return pollutants_lookup
+        return get_pollutant_registry().get_lookup('eea_key')
 
     @staticmethod
     def get_copernicus_pollutants() -> dict:
-        pollutants_lookup = {}
-        pollutants = Pollutant.objects.filter(copernicus_key__isnull=False)
-        for p in pollutants:
-            pollutants_lookup.update({p.copernicus_key: p})
-
-        return pollutants_lookup
+        return get_pollutant_registry().get_lookup('copernicus_key')
 
     @staticmethod
     def get_observation_pollutants(pollutants: list = None) -> dict:
-        pollutants_lookup = {}
+        registry = get_pollutant_registry()
 
         # get all if no argument provided
         if pollutants is None:
-            p_objs = Pollutant.objects.filter(observation_key__isnull=False)
+            return registry.get_lookup('observation_key')
+
         # only get the ones in the list
         # any key may have been provided - get the object for it
-        else:
-            p_objs = Pollutant.objects.filter(Q(copernicus_key__in=pollutants) |
-                                              Q(observation_key__in=pollutants) |
-                                              Q(eea_key__in=pollutants) |
-                                              Q(key__in=pollutants))
-
-        for p in p_objs:
-            pollutants_lookup.update({p.observation_key: p})
-
-        return pollutants_lookup
+        pollutants = set(pollutants)
+        return {p.observation_key: p for p in registry.pollutants.values()
+                if pollutants.intersection(getattr(p, f) for f in PollutantRegistry.NAME_FIELDS)}
 
     @staticmethod
     def get_all_targets(years: list = None, country_codes: list = None, pollutants: list = None) -> dict:
@@ -149,6 +130,14 @@ class Pollutant(models.Model):
 
     @staticmethod
     def get_targets_df(years: list = None, country_codes: list = None, pollutants: list = None) -> pd.DataFrame:
+        """
+        Get the targets of each country and year.
+        Targets apply all countries to all years equally, so the targets are crossed with every country and year.
+        :param years: Optional. Defaults to 2016 to 2024.
+        :param country_codes: Optional. Defaults to EU countries.
+        :param pollutants: Optional. Defaults to all pollutants.
+        :return: DataFrame of the Target fields (without id) with country and year columns
+        """
         if country_codes is None:
             country_codes = EU_ISOCODES
         if pollutants is None:
@@ -156,18 +145,14 @@ class Pollutant(models.Model):
         if years is None:
             years = [y for y in range(2016, 2025)]
 
-        root_df = pd.DataFrame(Target.objects.filter(pollutant__in=pollutants).values()).drop(columns=['id'])
-        rv_df = pd.DataFrame()
-        for c in country_codes:
-            for y in years:
-                temp_df = root_df
-                temp_df['country'] = c
-                temp_df['year'] = y
-                rv_df = rv_df.append(temp_df)
+        targets_df = Target.get_targets_table()
+        targets_df = targets_df[targets_df.pollutant_id.isin(pollutants)]
 
-        rv_df = rv_df.reset_index(drop=True)
-        return rv_df
+        # cross join of countries and years with the targets
+        keys_df = pd.MultiIndex.from_product([country_codes, years], names=['country', 'year']).to_frame(index=False)
+        rv_df = keys_df.assign(_k=0).merge(targets_df.assign(_k=0), on='_k').drop(columns=['_k'])
 
+        return rv_df[list(targets_df.columns) + ['country', 'year']]
 
     @staticmethod
     def get_pollutant_dayavg_by_station_df(date_from: str, date_to: str, pollutant: str):
@@ -192,6 +177,73 @@ class Pollutant(models.Model):
         return readings_df
 
 
+class PollutantRegistry:
+    """
+    In-memory copy of the Pollutant table.  The names that each data source uses for a pollutant
+    are resolved to the application key without querying the database.
+    The registry of a process is loaded once by get_pollutant_registry() and reset when pollutants
+    are saved or deleted or the pollutants dataset is loaded by another process.
+    """
+    # fields that hold a name of the pollutant - later fields take precedence when names collide
+    NAME_FIELDS = ('copernicus_key', 'observation_key', 'eea_key', 'key')
+
+    def __init__(self, pollutants: list):
+        """
+        :param pollutants: Pollutant objects
+        """
+        self.pollutants = {p.key: p for p in pollutants}
+
+        # {lower case name: key}
+        self.aliases = {}
+        for f in self.NAME_FIELDS:
+            self.aliases.update({getattr(p, f).lower(): p.key for p in pollutants if getattr(p, f)})
+
+    def get_key(self, name: str) -> str:
+        """
+        Return the application key of a pollutant name.  The name is case insensitive.
+        :param name: Any name used to describe a pollutant
+        :return: The key of the pollutant or None if the name is not supported
+        """
+        if name is None:
+            return None
+
+        return self.aliases.get(name.lower())
+
+    def get_lookup(self, field: str) -> dict:
+        """
+        Return the pollutants by the name used in a field.  Pollutants without a name in the field are excluded.
+        :param field: One of NAME_FIELDS (eg: 'eea_key')
+        :return: dictionary of {name: Pollutant}
+        """
+        return {getattr(p, field): p for p in self.pollutants.values() if getattr(p, field) is not None}
+
+
+# the registry and targets are reloaded when pollutants are loaded by any process
+_registry = DatasetCache(DATASET_POLLUTANTS)
+_targets_cache = DatasetCache(DATASET_POLLUTANTS)
+
+
+def get_pollutant_registry() -> PollutantRegistry:
+    """
+    Return the pollutant registry of the process.  The registry is loaded on first use and
+    reloaded when the pollutants dataset is loaded.
+    :return: PollutantRegistry
+    """
+    return _registry.get(lambda: PollutantRegistry(list(Pollutant.objects.all())))
+
+
+def reset_pollutant_registry() -> None:
+    """
+    Discard the pollutant registry so that it is reloaded on next use.
+    """
+    _registry.reset()
+
+
+@receiver([post_save, post_delete], sender=Pollutant)
+def _pollutant_changed(sender, **kwargs) -> None:
+    reset_pollutant_registry()
+
+
 class Target(models.Model):
     """
     Holds pollutant targets
@@ -202,9 +254,25 @@ class Target(models.Model):
     measurement = models.ForeignKey(Measurement, on_delete=models.DO_NOTHING, related_name='targets', null=True)
     pollutant = models.ForeignKey(Pollutant, on_delete=models.DO_NOTHING, related_name='targets', null=True)
 
+    @staticmethod
+    def get_targets_table() -> pd.DataFrame:
+        """
+        Return all targets.  The table is cached until targets are saved or deleted or the pollutants
+        dataset is loaded.
+        :return: DataFrame with columns unit, value, count_limit, measurement_id, pollutant_id
+        """
+        columns = ['unit', 'value', 'count_limit', 'measurement_id', 'pollutant_id']
+
+        return _targets_cache.get(lambda: pd.DataFrame(Target.objects.all().values(*columns), columns=columns))
+
     def __str__(self):
         return f"{self.pollutant}: \n\t{'value':13}: {self.value} \n\t{'count_limit':13}: {self.count_limit}  \n\t{'measurment':13}: {self.measurement}"
 
     def get(self):
         return self.measurement.measurement, \
                {'value': self.value, 'count_limit': self.value, 'unit': self.unit}
+
+
+@receiver([post_save, post_delete], sender=Target)
+def _target_changed(sender, **kwargs) -> None:
+    _targets_cache.reset()
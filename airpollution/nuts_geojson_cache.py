@@ -0,0 +1,161 @@
+"""
+Serialized GeoJSON of the simplified NUTS boundaries used by the maps.
+Boundaries only change when NUTS regions are loaded, so the GeoJSON is serialized once by
+warm_geojson_cache() (called by load_nuts_data) and written to files under MEDIA_ROOT.
+Requests are served from an in-memory LRU cache of each process that falls back to the files on disk.
+The LRU cache is filled lazily on the first request of each map.  It is a DatasetCache of the NUTS
+dataset, so it is emptied when load_nuts_data runs in any process.  Keys of the files include the version
+of the NUTS dataset so that processes never serve boundaries loaded before the last load_nuts_data.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from airpollution.models import NutsRegionsSimplified, CURRENT_NUTS_VERSION, SIMPLIFY_TOLERANCES, DatasetCache, \
+    DATASET_NUTS
+from airpollution.json_encoding import to_geojson
+from eugreendeal.settings import MEDIA_ROOT, GEOJSON_COORDINATE_PRECISION
+
+GEOJSON_CACHE_DIR = os.path.join(MEDIA_ROOT, 'media', 'mapdata', 'geojson_cache')
+
+# maximum number of serialized GeoJSON strings held in memory
+GEOJSON_CACHE_SIZE = 64
+
+# sets of excluded countries used by the maps - these are precomputed by warm_geojson_cache()
+WARM_EXCLUDE_COUNTRIES = ([], ['TR'])
+
+# the LRU cache of the process - an OrderedDict of {key: GeoJSON string}
+_lru = DatasetCache(DATASET_NUTS)
+_lock = threading.Lock()
+
+
+def _get_cache_key(nuts_level: int, tolerance: float, exclude_countries: list, nuts_version: int,
+                   dataset_version: int) -> str:
+    """
+    Return the key used to identify a serialized GeoJSON in the cache and on disk.
+    :param nuts_level: The nuts level of the regions
+    :param tolerance: One of SIMPLIFY_TOLERANCES
+    :param exclude_countries: Country codes excluded from the map
+    :param nuts_version: The NUTS version of the regions
+    :param dataset_version: The version of the NUTS dataset
+    :return: String key
+    """
+    excluded = '-'.join(sorted({c.upper() for c in exclude_countries})) if exclude_countries else 'all'
+    return f"nuts_{nuts_version}_{nuts_level}_{tolerance}_{GEOJSON_COORDINATE_PRECISION}_{excluded}_v{dataset_version}"
+
+
+def _get_cache_file(key: str) -> str:
+    return os.path.join(GEOJSON_CACHE_DIR, f"{key}.geojson")
+
+
+def _put(lru: OrderedDict, key: str, geojson: str) -> None:
+    with _lock:
+        lru[key] = geojson
+        lru.move_to_end(key)
+        while len(lru) > GEOJSON_CACHE_SIZE:
+            lru.popitem(last=False)
+
+
+def build_geojson(nuts_level: int, tolerance: float = SIMPLIFY_TOLERANCES[0], exclude_countries: list = None,
+                  nuts_version: int = CURRENT_NUTS_VERSION) -> str:
+    """
+    Serialize the simplified boundaries of a NUTS level to GeoJSON.
+    :param nuts_level: The nuts level of the regions
+    :param tolerance: One of SIMPLIFY_TOLERANCES
+    :param exclude_countries: Optional. Country codes to exclude from the map.
+    :param nuts_version: Optional. Defaults to the current NUTS version.
+    :return: GeoJSON string
+    """
+    df = NutsRegionsSimplified.get_geoframe(nuts_level=nuts_level, tolerance=tolerance, nuts_version=nuts_version)
+
+    if exclude_countries:
+        df = df[~df.CNTR_CODE.isin([c.upper() for c in exclude_countries])]
+
+    if len(df) < 2:
+        logging.info(f"WARNING: filtered map has no points for NUTS level: {nuts_level}")
+
+    return to_geojson(df)
+
+
+def get_geojson(nuts_level: int, tolerance: float = SIMPLIFY_TOLERANCES[0], exclude_countries: list = None,
+                nuts_version: int = CURRENT_NUTS_VERSION) -> str:
+    """
+    Return the serialized GeoJSON of the simplified boundaries of a NUTS level.
+    The in-memory cache is checked first, then the cache files.  GeoJSON that was not
+    precomputed is built and written to the cache.
+    :param nuts_level: The nuts level of the regions
+    :param tolerance: One of SIMPLIFY_TOLERANCES
+    :param exclude_countries: Optional. Country codes to exclude from the map.
+    :param nuts_version: Optional. Defaults to the current NUTS version.
+    :return: GeoJSON string
+    """
+    # the version of the NUTS dataset is compared once per request
+    lru = _lru.get(OrderedDict)
+    key = _get_cache_key(nuts_level, tolerance, exclude_countries, nuts_version, _lru.versions[DATASET_NUTS])
+
+    with _lock:
+        geojson = lru.get(key)
+        if geojson is not None:
+            lru.move_to_end(key)
+            return geojson
+
+    cache_file = _get_cache_file(key)
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            geojson = f.read()
+    else:
+        geojson = build_geojson(nuts_level, tolerance, exclude_countries, nuts_version)
+        _write_cache_file(cache_file, geojson)
+
+    _put(lru, key, geojson)
+
+    return geojson
+
+
+def _write_cache_file(cache_file: str, geojson: str) -> None:
+    try:
+        os.makedirs(GEOJSON_CACHE_DIR, exist_ok=True)
+        # write to a temporary file first so that readers never see a partial file
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(geojson)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logging.warning(f"Could not write GeoJSON cache file '{cache_file}': {e}")
+
+
+def clear_geojson_cache(nuts_version: int = None) -> None:
+    """
+    Remove the cached GeoJSON from memory and disk.
+    :param nuts_version: Optional. If provided, only the files of this NUTS version are removed from disk.
+    :return: None
+    """
+    _lru.reset()
+
+    if not os.path.isdir(GEOJSON_CACHE_DIR):
+        return
+
+    prefix = f"nuts_{nuts_version}_" if nuts_version is not None else "nuts_"
+    for f in os.listdir(GEOJSON_CACHE_DIR):
+        if f.startswith(prefix):
+            os.remove(os.path.join(GEOJSON_CACHE_DIR, f))
+
+
+def warm_geojson_cache(nuts_version: int = CURRENT_NUTS_VERSION, nuts_levels: list = (0, 1, 2, 3),
+                       exclude_country_sets: list = WARM_EXCLUDE_COUNTRIES) -> None:
+    """
+    Rebuild the cached GeoJSON files for every combination of nuts level, tolerance and excluded countries.
+    Called after the NUTS regions are loaded and the version of the NUTS dataset is increased so that
+    maps never serialize boundaries in a request.
+    :param nuts_version: Optional. Defaults to the current NUTS version.
+    :param nuts_levels: Optional. The nuts levels to cache.
+    :param exclude_country_sets: Optional. The sets of excluded countries to cache.
+    :return: None
+    """
+    clear_geojson_cache(nuts_version)
+
+    for nuts_level in nuts_levels:
+        for tolerance in SIMPLIFY_TOLERANCES:
+            for exclude_countries in exclude_country_sets:
+                get_geojson(nuts_level, tolerance, exclude_countries, nuts_version)
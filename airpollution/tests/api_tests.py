@@ -0,0 +1,125 @@
+"""
+Test for the api cache, conditional requests, batch queries, prerendered charts and json encoding
+"""
+import datetime
+import json
+from unittest import mock
+
+from django.test import TestCase, Client, RequestFactory
+from django.utils import timezone
+from airpollution.models import Measurement, Pollutant, Target, DatasetVersion, DATASET_POLLUTANTS, ChartViz, \
+    RenderedChart
+from airpollution.views import aq_api_v1
+from airpollution.views.chart_prerender import prerender_charts, get_default_dashboard_urls
+from airpollution.json_encoding import to_geojson, ApiJsonResponse, dumps
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import Point
+
+
+class ApiCacheTest(TestCase):
+    def setUp(self):
+        Pollutant.objects.create(key='O3', copernicus_key='O3c', observation_key='O3o', eea_key='O3e')
+        Target.objects.create(unit='unit1', value=3.14, count_limit=10,
+                              measurement=Measurement.objects.create(measurement='m1', description='m1 reading'),
+                              pollutant=Pollutant.objects.get(key='O3'))
+
+    def test_targets_api_cache(self):
+        request = RequestFactory().get('/aq_api/targets', {'version': 'v1', 'regions': 'AT', 'years': '2020'})
+        content = aq_api_v1.targets(request).content
+        self.assertEqual(json.loads(content)['AT']['2020']['O3']['m1']['value'], 3.14)
+
+        # equivalent requests are served from the cache with a single query of the dataset versions
+        request = RequestFactory().get('/aq_api/targets', {'regions': 'AT', 'years': '2020', 'version': 'v1'})
+        with self.assertNumQueries(1):
+            response = aq_api_v1.targets(request)
+        self.assertEqual(response.content, content)
+
+        # clients that have the response are answered with 304 Not Modified
+        request = RequestFactory().get('/aq_api/targets', {'regions': 'AT', 'years': '2020', 'version': 'v1'},
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(aq_api_v1.targets(request).status_code, 304)
+        self.assertIn('must-revalidate', response['Cache-Control'])
+
+        # loading the dataset replaces the cached response
+        Target.objects.all().update(value=1)
+        Target.objects.first().save()
+        DatasetVersion.bump(DATASET_POLLUTANTS)
+        request = RequestFactory().get('/aq_api/targets', {'regions': 'AT', 'years': '2020', 'version': 'v1'},
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        response = aq_api_v1.targets(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['AT']['2020']['O3']['m1']['value'], 1)
+
+    def test_targets_api_last_modified(self):
+        DatasetVersion.bump(DATASET_POLLUTANTS)
+        DatasetVersion.objects.update(updated=timezone.now() - datetime.timedelta(hours=1))
+        request = RequestFactory().get('/aq_api/targets', {'regions': 'AT', 'years': '2020'})
+        last_modified = aq_api_v1.targets(request)['Last-Modified']
+
+        # clients that only send If-Modified-Since receive the data of a new load
+        DatasetVersion.bump(DATASET_POLLUTANTS)
+        request = RequestFactory().get('/aq_api/targets', {'regions': 'AT', 'years': '2020'},
+                                       HTTP_IF_MODIFIED_SINCE=last_modified)
+        response = aq_api_v1.targets(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['Last-Modified'], last_modified)
+
+        request = RequestFactory().get('/aq_api/targets', {'regions': 'AT', 'years': '2020'},
+                                       HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(aq_api_v1.targets(request).status_code, 304)
+
+    def test_batch_api(self):
+        queries = {'queries': [{'id': 'a', 'endpoint': 'targets', 'params': {'regions': ['AT'], 'years': [2020]}},
+                               {'id': 'b', 'endpoint': 'targets', 'params': {'regions': 'AT', 'years': '2020'}},
+                               {'id': 'c', 'endpoint': 'readings'}]}
+        request = RequestFactory().post('/aq_api/batch', json.dumps(queries), content_type='application/json')
+        self.assertEqual(aq_api_v1.batch(request).status_code, 400)
+
+        # identical queries are run once
+        request = RequestFactory().post('/aq_api/batch', json.dumps({'queries': queries['queries'][:2]}),
+                                        content_type='application/json')
+        response = json.loads(aq_api_v1.batch(request).content)
+        self.assertEqual(response['a'], response['b'])
+        self.assertEqual((response['a']['status'], response['a']['data']['AT']['2020']['O3']['m1']['value']),
+                         (200, 3.14))
+
+
+class ChartPrerenderTest(TestCase):
+    def test_prerender_charts(self):
+        url = "/daily_aq/?start_date=2020-04-01&end_date=2020-04-30"
+        ChartViz.objects.create(chart_id='1', url=url)
+
+        self.assertEqual(get_default_dashboard_urls(datetime.date(2020, 5, 20))[-1],
+                         '/pollution_regional_deltas_table?start_date=2020-05-10&end_date=2020-05-16')
+        self.assertEqual(prerender_charts(), 5)
+
+        # charts are rendered once per dataset version
+        self.assertEqual(prerender_charts(), 0)
+
+        # the chart route serves the stored rendering
+        response = Client().get(url)
+        chart = RenderedChart.objects.get(url=url)
+        self.assertEqual(response['ETag'], f'"{chart.etag}"')
+        self.assertEqual(response.content, RenderedChart.get_content(chart.etag)[0])
+
+
+class JsonEncodingTest(TestCase):
+    def test_json_encoding(self):
+        gdf = gpd.GeoDataFrame({'value': [np.float64(1.5), np.nan]},
+                               geometry=[Point(1.23456789, 2.5), Point(3.0, 4.987654321)])
+        geojson = json.loads(to_geojson(gdf, precision=3))
+        self.assertEqual([f['geometry']['coordinates'] for f in geojson['features']], [[1.235, 2.5], [3.0, 4.988]])
+        self.assertIsNone(geojson['features'][1]['properties']['value'])
+
+        response = ApiJsonResponse({2020: {'NO2': np.int64(3)}})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content), {'2020': {'NO2': 3}})
+
+        # non-finite values are serialized as null without orjson
+        def reject(constant):
+            raise ValueError(constant)
+
+        with mock.patch('airpollution.json_encoding.orjson', None):
+            content = dumps({'a': [np.nan, float('inf')], 'b': np.float64('-inf'), 'c': np.array([1.0, np.nan])})
+        self.assertEqual(json.loads(content, parse_constant=reject), {'a': [None, None], 'b': None, 'c': [1.0, None]})
@@ -2,8 +2,10 @@
 Author: Carly Gloge
 Test for the map of daily pollution data
 """
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
+from airpollution.models import NutsRegions, NutsRegionsSimplified, CURRENT_NUTS_VERSION
 from airpollution.views import daily_aq_map
+from airpollution.views.aq_api_v1 import flatten_daily_data
 from django.http import HttpRequest
 
 class TestDailyAQMap(TestCase):
@@ -21,6 +23,31 @@ class TestDailyAQMap(TestCase):
         response = daily_aq_map.draw_map(request)
         
         self.assertEqual(response.status_code, 200)
+
+        # sizes that are not integers fall back to the default size
+        request = RequestFactory().get('/daily_aq/', {'start_date': self.start_date, 'width': '600px', 'height': ''})
+        self.assertEqual(daily_aq_map.draw_map(request).status_code, 200)
+
+    def test_boundaries_df(self):
+        region = NutsRegions.objects.create(key='CY', year=CURRENT_NUTS_VERSION, id='CY', LEVL_CODE=0, NUTS_ID='CY',
+                                            CNTR_CODE='CY', NUTS_NAME='Cyprus', FID='CY', EU_MEMBER=True, geometry='')
+        NutsRegionsSimplified.objects.create(key='CY_0.01', region=region, tolerance=0.01,
+                                             geometry='POLYGON ((32 34.5, 34.5 34.5, 34.5 35.7, 32 35.7, 32 34.5))')
+
+        # boundaries are clipped to the window of the daily map
+        df = daily_aq_map._get_boundaries_df(0, 'cy', 0.01)
+        self.assertEqual(list(df.nuts_id), ['CY'])
+        self.assertEqual(tuple(df.total_bounds), (32, 35, 33, 35.7))
+
+    def test_flatten_daily_data(self):
+        daily_levels = {'de': {'2020-04-01': {'no2': {'day-avg-level': 10.123, 'prior-day_avg_level': None},
+                                              'o3': None}},
+                        'fr': {'2020-04-01': {'no2': {'day-avg-level': 5, 'prior-day_avg_level': 4}}}}
+
+        df = flatten_daily_data(daily_levels)
+        self.assertEqual(list(df.itertuples(index=False, name=None)),
+                         [('DE', '2020-04-01', 'NO2', 10.12, 0.0), ('FR', '2020-04-01', 'NO2', 5.0, 4.0)])
+        self.assertEqual(list(flatten_daily_data({}).columns), list(df.columns))
         
     
     
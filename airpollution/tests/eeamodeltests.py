@@ -2,8 +2,53 @@
 Author: Hemant Bajpai
 Test for EEA Data Model
 """
-from django.test import TestCase
-from airpollution.models import EEADataModel
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+
+from django.test import TestCase, RequestFactory
+from airpollution.models import EEADataModel, SectorGroup, EmissionsCube, Pollutant, NATIONAL_TOTAL
+from airpollution.views import sector_aq_plot
+from dataingestor.EEA.EEADataSource import EEADataSource, CSV_HEADER, SECTOR_GROUPS, get_partition_file, \
+    get_partition_files, get_file_chunks, iter_rdf_records, parse_years, process_file_chunk
+
+# records of the CLRTAP dump as typed nodes and as rdf:Description - the last record is incomplete
+RDF_FIXTURE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:clrtap="http://reference.eionet.europa.eu/clrtap_nec_unfccc/schema/">
+  <clrtap:clrtap_nfr09_gf rdf:about="http://reference.eionet.europa.eu/clrtap_nec_unfccc/data/1">
+    <clrtap:pollutant_name>NOx</clrtap:pollutant_name>
+    <clrtap:country_code rdf:resource="http://reference.eionet.europa.eu/clrtap_nec_unfccc/country/AT"/>
+    <clrtap:year>2017</clrtap:year>
+    <clrtap:sector_code rdf:resource="http://reference.eionet.europa.eu/clrtap_nec_unfccc/clrtap_nec_nfr09_sector/1A3bi"/>
+    <clrtap:unit>Gg</clrtap:unit>
+    <clrtap:emissions>1.5</clrtap:emissions>
+  </clrtap:clrtap_nfr09_gf>
+  <rdf:Description rdf:about="http://reference.eionet.europa.eu/clrtap_nec_unfccc/data/2">
+    <rdf:type rdf:resource="http://reference.eionet.europa.eu/clrtap_nec_unfccc/schema/clrtap_nfr09_gf"/>
+    <clrtap:pollutant_name>SOx</clrtap:pollutant_name>
+    <clrtap:country_code rdf:resource="http://reference.eionet.europa.eu/clrtap_nec_unfccc/country/DE"/>
+    <clrtap:year>2018</clrtap:year>
+    <clrtap:sector_code rdf:resource="http://reference.eionet.europa.eu/clrtap_nec_unfccc/clrtap_nec_nfr09_sector/NATIONAL_TOTAL"/>
+    <clrtap:unit>Gg</clrtap:unit>
+    <clrtap:emissions> 2.5 </clrtap:emissions>
+  </rdf:Description>
+  <rdf:Description rdf:about="http://reference.eionet.europa.eu/clrtap_nec_unfccc/data/3">
+    <clrtap:pollutant_name>CO</clrtap:pollutant_name>
+    <clrtap:year>2017</clrtap:year>
+  </rdf:Description>
+</rdf:RDF>
+"""
+
+RDF_FIXTURE_RECORDS = [
+    {'pollutant_name': 'NOx', 'country_code': 'AT', 'year': '2017', 'sector_code': '1A3bi', 'unit': 'Gg',
+     'emissions': '1.5'},
+    {'pollutant_name': 'SOx', 'country_code': 'DE', 'year': '2018', 'sector_code': 'NATIONAL_TOTAL', 'unit': 'Gg',
+     'emissions': '2.5'},
+]
 
 class EEAModelTests(TestCase):
     def setUp(self):
@@ -11,7 +56,7 @@ class EEAModelTests(TestCase):
             year=2020,
             pollutant_name='SOx',
             country='EU28',
-            sector_group='TOTAL_EMISSION',
+            sector_group=SectorGroup.objects.create(name='TOTAL_EMISSION'),
             emissions=100)
 
     def test_eeadatamodel_get_sectors_info(self):
@@ -24,3 +69,170 @@ class EEAModelTests(TestCase):
         rv = EEADataModel.get_sectors_info(2020)
         self.assertEqual(rv['EU28'][2020]['SOx']['TOTAL_EMISSION'], 100)
 
+
+    def test_eeadatamodel_get_sectors_df(self):
+        """Test EEADataModel.get_sectors_df"""
+        df = EEADataModel.get_sectors_df(years=[2020], pollutants=['SOx', 'NOx'])
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df.iloc[0].sector_group, 'TOTAL_EMISSION')
+        self.assertEqual(df.iloc[0].total_emissions, 100)
+        self.assertEqual(len(EEADataModel.get_sectors_df(years=[2019])), 0)
+
+    def test_emissionscube_rebuild(self):
+        """Test EmissionsCube.rebuild"""
+        Pollutant.objects.create(key='SO2', eea_key='SOx')
+        self.assertEqual(EmissionsCube.rebuild(), 1)
+        df = EmissionsCube.get_df(sector_groups=['TOTAL_EMISSION'])
+        self.assertEqual(df.iloc[0].pollutant, 'SO2')
+        self.assertEqual(df.iloc[0].total_emissions, 100)
+
+    def test_emissionscube_national_total(self):
+        """Test that memo items are not added to the national totals"""
+        group = SectorGroup.objects.create(name=NATIONAL_TOTAL)
+        EEADataModel.objects.create(year=2020, pollutant_name='SOx', country='AT', sector=NATIONAL_TOTAL,
+                                    sector_group=group, emissions=50)
+        EEADataModel.objects.create(year=2020, pollutant_name='SOx', country='AT', sector='1A3ai(ii)',
+                                    sector_group=group, emissions=7)
+        EmissionsCube.rebuild()
+
+        df = EmissionsCube.get_df(country_codes=['AT'], national_total=True)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df.iloc[0].total_emissions, 50)
+        self.assertEqual(EmissionsCube.objects.get(country='AT', is_national_total=False).emissions, 7)
+
+    def test_sector_aq_plot(self):
+        """Test the sector shares of the national totals in the sector plots"""
+        agriculture = SectorGroup.objects.create(name='Agriculture')
+        road = SectorGroup.objects.create(name='Road transport')
+        national = SectorGroup.objects.create(name=NATIONAL_TOTAL)
+        for pollutant, group, year, national_total, emissions in (('PM10', national, 2017, True, 200),
+                                                                  ('PM10', agriculture, 2017, False, 50),
+                                                                  ('PM10', road, 2017, False, 30),
+                                                                  ('NOx', agriculture, 2017, False, 10),
+                                                                  ('PM10', national, 2015, True, 100),
+                                                                  ('PM10', agriculture, 2015, False, 40),
+                                                                  ('PM10', agriculture, 2016, False, 20)):
+            EmissionsCube.objects.create(country='AT', pollutant_name=pollutant, sector_group=group, year=year,
+                                         is_national_total=national_total, emissions=emissions)
+
+        def get_data(response):
+            references = json.loads(response.content)['doc']['roots']['references']
+            return [r['attributes']['data'] for r in references if r['type'] == 'ColumnDataSource']
+
+        # sectors in percent of the national total of each pollutant - NOx has no total
+        response = sector_aq_plot.draw_plot(RequestFactory().get('/sector_aq_plot', {'countries': 'AT'}))
+        data = get_data(response)[0]
+        pm10 = data['pollutants'].index('PM10')
+        nox = data['pollutants'].index('NOx')
+        self.assertEqual((data['Agriculture'][pm10], data['Road transport'][pm10], data['Waste'][pm10],
+                          data['Other'][pm10]), (25, 15, 0, 60))
+        self.assertEqual((data['Agriculture'][nox], data['Other'][nox]), (0, 100))
+
+        # 'Other' is the remainder of the national total of each year - 2016 has no total
+        response = sector_aq_plot.draw_emission_distribution_plot(
+            RequestFactory().get('/sector_emission_distribution_plot', {'countries': 'AT', 'pollutant': 'PM10'}))
+        data = get_data(response)[0]
+        sectors = dict(zip(data['labels'], data['ys']))
+        years = data['xs'][0]
+        self.assertEqual([sectors['Agriculture'][years.index(year)] for year in (2015, 2016)], [40, 20])
+        self.assertEqual([sectors['Other'][years.index(year)] for year in (2015, 2016, 2014)], [60, 0, 0])
+
+    def test_eeadatasource_load_db_from_files(self):
+        """Test EEADataSource.load_db_from_files"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = get_partition_file(tmp_dir, 2019)
+            with open(filepath, 'w') as f:
+                f.write(','.join(CSV_HEADER) + '\n')
+                f.write('NOx,2019,AT,1A3bi,1.5,Gg\n')
+
+            # missing files fail before any records are deleted
+            with self.assertRaises(FileNotFoundError):
+                EEADataSource.load_db_from_files([filepath, get_partition_file(tmp_dir, 2020)], years=['2019', '2020'])
+            self.assertEqual(EEADataModel.objects.count(), 1)
+
+            # only the records of the loaded years are replaced
+            self.assertEqual(EEADataSource.load_db_from_files([filepath], years=['2019']), 1)
+            self.assertEqual(sorted(EEADataModel.objects.values_list('year', flat=True)), [2019, 2020])
+            self.assertEqual(EEADataModel.objects.get(year=2019).sector_group.name, 'Road transport')
+
+    def test_iter_rdf_records(self):
+        """Test iter_rdf_records"""
+        self.assertEqual(list(iter_rdf_records(io.BytesIO(RDF_FIXTURE))), RDF_FIXTURE_RECORDS)
+
+        # only the requested predicates are extracted
+        self.assertEqual(list(iter_rdf_records(io.BytesIO(RDF_FIXTURE), predicates=('pollutant_name', 'year'))),
+                         [{'pollutant_name': 'NOx', 'year': '2017'}, {'pollutant_name': 'SOx', 'year': '2018'},
+                          {'pollutant_name': 'CO', 'year': '2017'}])
+
+    def test_eeadatasource_write_csv_partitions(self):
+        """Test EEADataSource._write_csv_partitions_from_rdf"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counts = EEADataSource._write_csv_partitions_from_rdf(io.BytesIO(RDF_FIXTURE), tmp_dir, batch_size=1)
+            self.assertEqual(counts, {'2017': 1, '2018': 1})
+            self.assertEqual(get_partition_files(tmp_dir),
+                             [get_partition_file(tmp_dir, 2017), get_partition_file(tmp_dir, 2018)])
+            with open(get_partition_file(tmp_dir, 2018), newline='') as f:
+                self.assertEqual(list(csv.reader(f)), [CSV_HEADER, ['SOx', '2018', 'DE', 'NATIONAL_TOTAL', '2.5', 'Gg']])
+
+        # records are filtered by year, pollutant and country
+        for filters in ({'years': {'2017'}}, {'pollutants': {'NOx'}}, {'countries': {'AT'}}):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                counts = EEADataSource._write_csv_partitions_from_rdf(io.BytesIO(RDF_FIXTURE), tmp_dir, **filters)
+                self.assertEqual(counts, {'2017': 1})
+                self.assertEqual(get_partition_files(tmp_dir, years=['2017', '2018']),
+                                 [get_partition_file(tmp_dir, 2017)])
+
+    def test_eeadatasource_load_data(self):
+        """Test EEADataSource.load_data"""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source_file = os.path.join(tmp_dir, 'dump.rdf.gz')
+            with gzip.open(source_file, 'wb') as f:
+                f.write(RDF_FIXTURE)
+
+            # AT is not a default country
+            EEADataSource(name='EEA').load_data(target_dir=tmp_dir, source_file=source_file)
+            self.assertEqual(get_partition_files(tmp_dir), [])
+
+            EEADataSource(name='EEA').load_data(target_dir=tmp_dir, source_file=source_file, countries=['at'])
+            self.assertEqual(get_partition_files(tmp_dir), [get_partition_file(tmp_dir, 2017)])
+
+            EEADataSource(name='EEA').load_data(target_dir=tmp_dir, source_file=source_file, all=True)
+            self.assertEqual(len(get_partition_files(tmp_dir)), 2)
+
+    def test_parse_years(self):
+        """Test parse_years"""
+        self.assertIsNone(parse_years(None))
+        self.assertEqual(parse_years(['2013-2015', '2017']), ['2013', '2014', '2015', '2017'])
+        with self.assertRaises(ValueError):
+            parse_years(['20x7'])
+
+    def test_get_file_chunks(self):
+        """Test get_file_chunks and process_file_chunk"""
+        SectorGroup.get_group_ids(list(SECTOR_GROUPS))
+        lines = ['NOx,2019,AT,1A3bi,1.5,Gg', 'NOx,2019,AT,3F,x,Gg', 'SOx,2019,AT,NATIONAL_TOTAL,12.25,Gg']
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, 'emissions.csv')
+            with open(filepath, 'w') as f:
+                f.write('\n'.join([','.join(CSV_HEADER)] + lines) + '\n')
+
+            # chunks are whole lines after the header
+            chunks = get_file_chunks(filepath, chunk_bytes=1)
+            with open(filepath, 'rb') as f:
+                content = f.read()
+            self.assertEqual([content[start:end].decode() for _, start, end in chunks], [f'{l}\n' for l in lines])
+
+            chunks = get_file_chunks(filepath, chunk_bytes=30)
+            self.assertEqual(len(chunks), 2)
+            self.assertEqual(b''.join(content[start:end] for _, start, end in chunks).decode().splitlines(), lines)
+
+            # rows with emissions that are not numbers are dropped
+            with self.assertLogs(level='ERROR'):
+                self.assertEqual(sum(process_file_chunk(c) for c in chunks), 2)
+            self.assertEqual(sorted(EEADataModel.objects.filter(year=2019).values_list('sector', flat=True)),
+                             ['1A3bi', 'NATIONAL_TOTAL'])
+
+            # files without a header start at the first byte
+            with open(filepath, 'w') as f:
+                f.write('\n'.join(lines))
+            self.assertEqual(get_file_chunks(filepath, chunk_bytes=1000), [(filepath, 0, len('\n'.join(lines)))])
@@ -2,8 +2,12 @@
 Author: Hemant Bajpai
 Test for EuroStat Data Model
 """
+import os
+import tempfile
+
 from django.test import TestCase
-from airpollution.models import EurostatDataModel
+from airpollution.models import EurostatDataModel, NutsRegions, DatasetVersion, DATASET_POPULATION
+from dataingestor.Eurostat.EurostatDataSource import EurostatDataSource
 
 class EurostatModelTests(TestCase):
     def setUp(self):
@@ -19,4 +23,62 @@ class EurostatModelTests(TestCase):
         self.assertEqual(eurostatData.population, 200)
         self.assertEqual(eurostatData.nutsRegionStr, 'AL01')
         rv = EurostatDataModel.get_population_info('AL01', 2020)
-        self.assertEqual(rv['AL01'], 200)
\ No newline at end of file
+        self.assertEqual(rv['AL01'], 200)
+
+    def test_eurostatdatamodel_get_latest_population(self):
+        """Test EurostatDataModel.get_latest_population"""
+        EurostatDataModel.objects.create(year=2019, population=150, nutsRegionStr='AL01')
+        population = EurostatDataModel.get_latest_population()
+        self.assertEqual(population['AL01'], 200)
+
+        # the cached pivot is rebuilt when records change
+        EurostatDataModel.objects.create(year=2021, population=250, nutsRegionStr='AL01')
+        population = EurostatDataModel.get_latest_population()
+        self.assertEqual(population['AL01'], 250)
+
+    def test_eurostatdatamodel_population_cache(self):
+        """Test that the cached population is rebuilt when the dataset is loaded by another process"""
+        self.assertEqual(EurostatDataModel.get_latest_population()['AL01'], 200)
+
+        # the versions are compared once per request
+        with self.assertNumQueries(0):
+            EurostatDataModel.get_latest_population()
+
+        # updated values do not change the number of records
+        EurostatDataModel.objects.update(population=300)
+        DatasetVersion.bump(DATASET_POPULATION)
+        self.assertEqual(EurostatDataModel.get_latest_population()['AL01'], 300)
+
+    def test_eurostatdatasource_load_db_from_file(self):
+        """Test EurostatDataSource.load_db_from_file"""
+        NutsRegions.objects.create(key='2016_2_AT11', year='2016', id='AT11', LEVL_CODE=2, NUTS_ID='AT11',
+                                   CNTR_CODE='AT', NUTS_NAME='Burgenland', FID='AT11', EU_MEMBER=True, geometry='')
+
+        years = '\t'.join(f'{y} ' for y in range(2008, 2020))
+        values = '\t'.join(['280257 p'] + ['290000 '] * 10 + [': '])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, 'tgs00096.tsv')
+            with open(filepath, 'w') as f:
+                f.write(f"unit,sex,age,geo\\time\t{years}\n")
+                f.write(f"NR,T,TOTAL,AT11\t{values}\n")
+                f.write(f"NR,T,TOTAL,XX11\t{values}\n")
+
+            self.assertEqual(EurostatDataSource.load_db_from_file(filepath), 11)
+
+            # existing records are replaced, regions that are not loaded and values that are not available are skipped
+            self.assertFalse(EurostatDataModel.objects.filter(nutsRegionStr='AL01').exists())
+            self.assertFalse(EurostatDataModel.objects.filter(year=2019).exists())
+            record = EurostatDataModel.objects.get(year=2008)
+            self.assertEqual((record.population, record.flags, record.nutsRegion_id), (280257, 'p', '2016_2_AT11'))
+
+            # only changed values are written when the file is loaded again
+            years += '\t2020 '
+            with open(filepath, 'w') as f:
+                f.write(f"unit,sex,age,geo\\time\t{years}\n")
+                f.write(f"NR,T,TOTAL,AT11\t{values}\t300000 \n")
+
+            version = DatasetVersion.get_versions([DATASET_POPULATION])[DATASET_POPULATION]
+            self.assertEqual(EurostatDataSource.load_db_from_file(filepath), 1)
+            self.assertEqual(EurostatDataModel.objects.get(year=2020).population, 300000)
+            self.assertEqual(DatasetVersion.get_versions([DATASET_POPULATION])[DATASET_POPULATION], version + 1)
+            self.assertEqual(EurostatDataModel.objects.get(year=2008).id, record.id)
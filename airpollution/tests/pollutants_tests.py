@@ -3,8 +3,9 @@ Author: Alan Martinson
 Test for models_pollutants
 """
 import pandas as pd
+from django.core.signals import request_started
 from django.test import TestCase
-from airpollution.models import Measurement, Pollutant, Target
+from airpollution.models import Measurement, Pollutant, Target, DatasetVersion, DATASET_POLLUTANTS
 import json
 
 
@@ -78,6 +79,28 @@ class PollutantsPollutantTest(TestCase):
             theResults += key + "-" + observationpollutants[key].key + "-"
         self.assertEqual(theResults, "O3o-O3-PM25o-PM25-")
 
+    def test_PollutantRegistry(self):
+        # names are resolved without querying once the registry is loaded
+        Pollutant.get_keys()
+        with self.assertNumQueries(0):
+            self.assertEqual(Pollutant.get('pm25O'), 'PM25')
+            self.assertEqual(Pollutant.get('O3e'), 'O3')
+            self.assertIsNone(Pollutant.get('NO2'))
+            self.assertEqual(set(Pollutant.get_observation_pollutants(['O3c'])), {'O3o'})
+
+        # the registry is reloaded when pollutants change
+        Pollutant.objects.create(key='NO2', eea_key='NOx')
+        self.assertEqual(Pollutant.get('nox'), 'NO2')
+        Pollutant.objects.filter(key='NO2').first().delete()
+        self.assertIsNone(Pollutant.get('NOx'))
+
+        # pollutants loaded by another process are used from the next request
+        Pollutant.objects.bulk_create([Pollutant(key='CO', eea_key='COe')])
+        self.assertIsNone(Pollutant.get('COe'))
+        DatasetVersion.objects.create(name=DATASET_POLLUTANTS, version=1)
+        request_started.send(sender=None)
+        self.assertEqual(Pollutant.get('COe'), 'CO')
+
 
 class PollutantsTargetTest(TestCase):
     # print(">Testing PollutantsTargetTest")
@@ -124,3 +147,21 @@ class PollutantsTargetTest(TestCase):
         # get_pollutant_dayavg_by_station_df
         df = Pollutant.get_pollutant_dayavg_by_station_df(date_from='2020-01-01', date_to='2020-12-31', pollutant='O3')
         self.assertEqual(type(df), pd.DataFrame)
+
+    def test_get_targets_df(self):
+        df = Pollutant.get_targets_df(years=[2019, 2020], country_codes=['AT', 'DE'])
+        self.assertEqual(len(df), 4)
+        self.assertEqual(list(df[['country', 'year']].itertuples(index=False, name=None)),
+                         [('AT', 2019), ('AT', 2020), ('DE', 2019), ('DE', 2020)])
+        self.assertTrue((df.value == 3.14).all())
+
+        # the cached targets are reloaded when targets change
+        Target.objects.all().update(value=1)
+        Target.objects.first().save()
+        self.assertTrue((Pollutant.get_targets_df(years=[2019]).value == 1).all())
+
+        # targets loaded by another process are used from the next request
+        Target.objects.all().update(value=2)
+        DatasetVersion.objects.create(name=DATASET_POLLUTANTS, version=1)
+        request_started.send(sender=None)
+        self.assertTrue((Pollutant.get_targets_df(years=[2019]).value == 2).all())
@@ -1,10 +1,14 @@
 import os
+import tempfile
 from unittest.mock import patch
 
 import netCDF4
+import numpy as np
 from django.test import TestCase
 
-from airpollution.models import SatelliteImageFiles, Pollutant
+from airpollution.models import SatelliteImageFiles, Pollutant, GridLabels, get_zonal_statistics, \
+    get_grid_labels, reset_grid_labels
+from airpollution.models import models_copernicus
 from eugreendeal.settings import BASE_DIR
 
 
@@ -38,3 +42,45 @@ class SatelliteImageFilesTestCase(TestCase):
             self.assertEqual(image[0][0], 1.3150195)
             mock.assert_not_called()
 
+
+class ZonalStatisticsTestCase(TestCase):
+    def test_get_zonal_statistics(self):
+        """Test get_zonal_statistics"""
+        grid_labels = GridLabels(keys=np.array(['AT1', 'DE1']),
+                                 labels=np.array([0, 0, 1, -1]),
+                                 weights=np.ones(4))
+        image = np.array([[1.0, 3.0], [5.0, 100.0]])
+
+        stats = get_zonal_statistics(image, grid_labels, target=2.0)
+        self.assertEqual(list(stats['key']), ['AT1', 'DE1'])
+        self.assertEqual(list(stats['mean']), [2.0, 5.0])
+        self.assertEqual(list(stats['max']), [3.0, 5.0])
+        self.assertEqual(list(stats['area_over_target']), [0.5, 1.0])
+        self.assertEqual(list(stats['cell_count']), [2, 1])
+
+    def test_get_grid_labels(self):
+        """Test that grid labels are cached by the bounds of the grid"""
+        def create(shape, nuts_level, nuts_version, grid_bounds):
+            return GridLabels(keys=np.array([str(grid_bounds)]), labels=np.zeros(8, dtype=np.int32),
+                              weights=np.ones(8))
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                patch('airpollution.models.models_copernicus.GRID_LABELS_DIR', tmp_dir), \
+                patch.object(GridLabels, 'create', side_effect=create) as mock:
+            reset_grid_labels()
+            europe = get_grid_labels((2, 4), nuts_level=0, grid_bounds=(-24.95, 30.05, 44.95, 69.95))
+            self.assertIs(get_grid_labels((2, 4), nuts_level=0, grid_bounds=(-24.95, 30.05, 44.95, 69.95)), europe)
+
+            image = SatelliteImageFiles(bbox_minlon=335.05, bbox_minlat=30.05, bbox_maxlon=44.95, bbox_maxlat=69.95)
+            np.testing.assert_allclose(image.get_grid_bounds(), (-24.95, 30.05, 44.95, 69.95))
+
+            other = get_grid_labels((2, 4), nuts_level=0, grid_bounds=(0.05, 40.05, 10.05, 50.05))
+            self.assertEqual(list(other.keys), ['(0.05, 40.05, 10.05, 50.05)'])
+            self.assertEqual(mock.call_count, 2)
+
+            # labels are read from the files after the memory cache is cleared
+            models_copernicus._grid_labels.clear()
+            self.assertEqual(list(get_grid_labels((2, 4), nuts_level=0,
+                                                  grid_bounds=(0.05, 40.05, 10.05, 50.05)).keys), list(other.keys))
+            self.assertEqual(mock.call_count, 2)
+            reset_grid_labels()
@@ -2,8 +2,14 @@
 Author: Alan Martinson
 Test for nuts_regions
 """
+import json
+import tempfile
+from unittest import mock
+
 from django.test import TestCase
-from airpollution.models import NutsRegions, EUCountries
+from airpollution import nuts_geojson_cache
+from airpollution.models import NutsRegions, NutsRegionsSimplified, EUCountries, NutsLocator, SIMPLIFY_TOLERANCES, \
+    get_simplify_tolerance, DatasetVersion, DATASET_NUTS
 
 class NutsRegionsTest(TestCase):
     def setUp(self):
@@ -45,4 +51,73 @@ class NutsRegionsTest(TestCase):
 
         NUTScountry_lookup = NutsRegions.get_country_code_lookup()
         NUTScountry_code = NUTScountry_lookup.get('AT')
-        self.assertEqual(NUTScountry_code.NUTS_ID, 'AT')
\ No newline at end of file
+        self.assertEqual(NUTScountry_code.NUTS_ID, 'AT')
+
+    def test_simplified_boundaries(self):
+        NutsRegionsSimplified.objects.create(
+            key='0_0.01',
+            region=NutsRegions.objects.get(key='0'),
+            tolerance=0.01,
+            geometry='POLYGON ((10 47, 17 47, 17 49, 10 49, 10 47))'
+        )
+
+        df = NutsRegionsSimplified.get_geoframe(nuts_level=0, tolerance=0.01, country_codes=['AT'], nuts_version=2016)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df.iloc[0]['NUTS_ID'], 'AT')
+        self.assertEqual(df.iloc[0]['geometry'].bounds, (10, 47, 17, 49))
+
+        # small maps use the coarsest boundaries and large maps the finest
+        self.assertEqual(get_simplify_tolerance(width=100, height=100), SIMPLIFY_TOLERANCES[-1])
+        self.assertEqual(get_simplify_tolerance(width=4000, height=4000), SIMPLIFY_TOLERANCES[0])
+
+    def test_geojson_cache(self):
+        simplified = NutsRegionsSimplified.objects.create(
+            key='0_0.01',
+            region=NutsRegions.objects.get(key='0'),
+            tolerance=0.01,
+            geometry='POLYGON ((10 47, 17 47, 17 49, 10 49, 10 47))'
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(nuts_geojson_cache, 'GEOJSON_CACHE_DIR', tmp_dir):
+            nuts_geojson_cache.clear_geojson_cache()
+            geojson = nuts_geojson_cache.get_geojson(0, tolerance=0.01, nuts_version=2016)
+            self.assertEqual(len(json.loads(geojson)['features']), 1)
+
+            # maps of the same request are served without queries
+            with self.assertNumQueries(0):
+                self.assertEqual(nuts_geojson_cache.get_geojson(0, tolerance=0.01, nuts_version=2016), geojson)
+
+            # boundaries loaded by another process are served once the dataset version changes
+            simplified.geometry = 'POLYGON ((10 47, 12 47, 12 49, 10 49, 10 47))'
+            simplified.save()
+            self.assertEqual(nuts_geojson_cache.get_geojson(0, tolerance=0.01, nuts_version=2016), geojson)
+            DatasetVersion.bump(DATASET_NUTS)
+            self.assertNotEqual(nuts_geojson_cache.get_geojson(0, tolerance=0.01, nuts_version=2016), geojson)
+
+            nuts_geojson_cache.clear_geojson_cache()
+
+    def test_locator(self):
+        NutsRegions.objects.create(
+            key='AT1_2016',
+            year='2016',
+            id='AT1',
+            LEVL_CODE=1,
+            NUTS_ID='AT1',
+            CNTR_CODE='AT',
+            NUTS_NAME='AT1',
+            FID='AT1',
+            EU_MEMBER=True,
+            geometry='POLYGON ((10 47, 17 47, 17 49, 10 49, 10 47))'
+        )
+
+        locator = NutsLocator(nuts_version=2016)
+        self.assertEqual(locator.locate(48, 15, nuts_level=1), 'AT1_2016')
+        self.assertIsNone(locator.locate(52, 13, nuts_level=1))
+
+        keys = locator.locate_many([48, 52, 47.5], [15, 13, 11], nuts_level=1)
+        self.assertEqual(list(keys), ['AT1_2016', None, 'AT1_2016'])
+
+        records = locator.locate_records([48, 52], [15, 13], nuts_level=1)
+        self.assertEqual(records[0].NUTS_ID, 'AT1')
+        self.assertIsNone(records[1])
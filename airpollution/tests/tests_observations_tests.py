@@ -1,3 +1,4 @@
+import json
 import logging
 import datetime
 import pytz
@@ -5,9 +6,10 @@ from dateutil.tz import *
 
 import pandas as pd
 import geopandas as gpd
-from django.test import TestCase
+from django.test import TestCase, Client
 from django.db.models import Avg
-from airpollution.models import Pollutant, ObservationStation, ObservationStationReading, NutsRegions, EUCountries
+from airpollution.models import Pollutant, ObservationStation, ObservationStationReading, NutsRegions, EUCountries, \
+    DAILY_DF_COLUMNS
 
 
 class ObservationStationTest(TestCase):
@@ -126,3 +128,77 @@ class ObservationStationTest(TestCase):
         logger = logging.Logger(name='tester')
         test_dict = ObservationStationReading.annual(countries=['AT'], years=[2020], pollutants=['O3'], logger=logger)
         self.assertEqual(test_dict.get('AT').get(2020).get('O3'), 123.123)
+
+    def test_daily_annual_df(self):
+        logger = logging.Logger(name='tester')
+        daily_df = ObservationStationReading.daily_df(start_date='2020-01-01', end_date='2020-12-31', logger=logger)
+        self.assertEqual(list(daily_df.columns), DAILY_DF_COLUMNS)
+        self.assertEqual(daily_df.iloc[0][['country_code', 'pollutant', 'day-avg-level']].tolist(),
+                         ['AT', 'O3', 123.123])
+
+        annual_df = ObservationStationReading.annual_df(countries=['AT'], years=[2020], pollutants=['O3'],
+                                                        logger=logger)
+        self.assertEqual(annual_df.values.tolist(), [['AT', 2020, 'O3', 123.123]])
+
+    def test_export(self):
+        response = Client().get('/aq_api/annual?countries=AT&years=2020&pollutants=O3&format=csv')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="annual.csv"')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines(),
+                         ['country_code,year,pollutant,value', 'AT,2020,O3,123.123'])
+
+        response = Client().get('/aq_api/daily?start-date=2020-04-15&end-date=2020-04-15&format=csv')
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[1],
+                         'AT,2020-04-15,O3,123.123,123.123,0,0')
+
+        response = Client().get('/aq_api/annual?format=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_readings(self):
+        for hour in range(1, 4):
+            ObservationStationReading.objects.create(
+                key=f'1-{hour}',
+                date_time=datetime.datetime(year=2020, month=4, day=16, hour=hour, tzinfo=pytz.utc),
+                country_code=EUCountries.objects.get(pk='AT'),
+                air_quality_network='aq_network',
+                air_quality_station=ObservationStation.objects.get(pk='1'),
+                pollutant=Pollutant.objects.get(pk='O3'),
+                value=hour,
+                unit='unit',
+                validity=1,
+                verification=1
+            )
+
+        # pages are linked by the cursor of the last reading
+        response = Client().get('/aq_api/readings?regions=AT11&pollutants=o3&start-date=2020-04-16T01:00&limit=2')
+        self.assertEqual([r['value'] for r in json.loads(b''.join(response.streaming_content))], [1, 2])
+        response = Client().get(f"/aq_api/readings?regions=AT11&pollutants=o3&start-date=2020-04-16T01:00&limit=2"
+                                f"&cursor={response['X-Next-Cursor']}")
+        self.assertEqual([r['value'] for r in json.loads(b''.join(response.streaming_content))], [3])
+        self.assertFalse(response.has_header('Link'))
+
+        # a full page that is the last page has no cursor
+        response = Client().get('/aq_api/readings?regions=AT11&pollutants=o3&start-date=2020-04-16T01:00&limit=3')
+        self.assertEqual([r['value'] for r in json.loads(b''.join(response.streaming_content))], [1, 2, 3])
+        self.assertFalse(response.has_header('X-Next-Cursor'))
+
+        response = Client().get('/aq_api/readings?mode=rolling&start-date=2020-04-16T03:00')
+        self.assertEqual([(r['value'], r['hours']) for r in json.loads(b''.join(response.streaming_content))],
+                         [(2, 3)])
+
+        response = Client().get('/aq_api/readings?mode=day_mean&countries=at&start-date=2020-04-16')
+        self.assertEqual([(r['date'], r['value'], r['hours']) for r in json.loads(b''.join(response.streaming_content))],
+                         [('2020-04-16', 2, 3)])
+
+    def test_get_stations(self):
+        with self.assertNumQueries(1):
+            rows = list(ObservationStation.get_stations(regions=['AT11'], pollutants=['o3'], bbox=(120, 120, 125, 125)))
+        self.assertEqual([r[:2] for r in rows], [('1', 'AT')])
+        self.assertEqual(rows[0][9:12], ('AT1', 'AT11', 'AT111'))
+        self.assertEqual(list(ObservationStation.get_stations(area_types=['rural'])), [])
+
+        response = Client().get('/get_stations?countries=at&bbox=120,120,125,125&format=geojson')
+        feature = json.loads(response.content)['features'][0]
+        self.assertEqual((feature['id'], feature['geometry']['coordinates']), ('1', [123.123, 123.123]))
+        self.assertEqual(feature['properties']['nuts_3'], 'AT111')
+        self.assertEqual(Client().get('/get_stations?bbox=1,2').status_code, 400)
@@ -22,6 +22,9 @@ urlpatterns = [
     path("aq_api/annual", aq_api_v1.annual, name="annual"),
     path("aq_api/sectors", aq_api_v1.sectors, name="sectors"),
     path("aq_api/targets", aq_api_v1.targets, name="targets"),
+    path("aq_api/exposure", aq_api_v1.exposure, name="exposure"),
+    path("aq_api/readings", aq_api_v1.readings, name="readings"),
+    path("aq_api/batch", aq_api_v1.batch, name="batch"),
 
     #Region Routes
     path("aq_api/region_info", aq_api_v1.region_info, name="region_info"),
@@ -0,0 +1,186 @@
+"""
+Cache and conditional GET support of the /aq_api responses and charts.
+Data only changes when a data source loads a dataset, so responses are cached without expiry.
+The key of a response includes the normalized query parameters and the versions of the datasets
+the response is built from.  Data sources increase the version of a dataset when it is loaded
+(see DataSource.bump_dataset_versions()) so responses built from earlier data are never served.
+The same key is sent to clients as a strong ETag so that unchanged responses are answered with 304 Not Modified.
+Chart views also serve the responses pre-rendered after each ingest (see chart_prerender.py).
+"""
+import functools
+import hashlib
+
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from airpollution.models import DatasetVersion, RenderedChart
+
+# alias of the cache in settings.CACHES
+AQ_API_CACHE = 'aq_api'
+
+# query parameters that do not change the response
+IGNORED_PARAMETERS = ('verbosity',)
+
+
+def _get_version_info(request, datasets: tuple) -> dict:
+    """
+    Return the versions of datasets.  The versions are queried once per request.
+    :param request: Django request
+    :param datasets: Names of the datasets
+    :return: dictionary of {name: (version, updated)}
+    """
+    if not hasattr(request, '_dataset_versions'):
+        request._dataset_versions = {}
+
+    key = tuple(sorted(datasets))
+    if key not in request._dataset_versions:
+        request._dataset_versions[key] = DatasetVersion.get_version_info(key)
+
+    return request._dataset_versions[key]
+
+
+def _get_digest(request, datasets: tuple, view_name: str = '', view_kwargs: dict = None) -> str:
+    """
+    Return a digest of a request and the versions of the datasets its response is built from.
+    Parameters are sorted and spaces around comma separated values are removed so that
+    equivalent requests share a digest.
+    """
+    params = sorted((k, ','.join(v.strip() for v in value.split(',')))
+                    for k, values in request.GET.lists() if k not in IGNORED_PARAMETERS
+                    for value in values)
+    versions = sorted((name, version) for name, (version, updated) in _get_version_info(request, datasets).items())
+    kwargs = sorted((view_kwargs or {}).items())
+
+    return hashlib.md5(f"{view_name}|{request.path}|{kwargs}|{params}|{versions}".encode()).hexdigest()
+
+
+def get_cache_key(request, datasets: tuple) -> str:
+    """
+    Return the cache key of an api request.
+    :param request: Django request
+    :param datasets: Names of the datasets the response is built from
+    :return: String key
+    """
+    return f"aq_api:{_get_digest(request, datasets)}"
+
+
+def get_last_modified(request, datasets: tuple):
+    """
+    Return the time the most recently loaded dataset of a response was loaded.
+    :param request: Django request
+    :param datasets: Names of the datasets the response is built from
+    :return: datetime or None if none of the datasets were loaded
+    """
+    updated = [updated for version, updated in _get_version_info(request, datasets).values() if updated is not None]
+
+    return max(updated) if updated else None
+
+
+def _conditional(view, datasets: tuple, prerendered: bool = False):
+    """
+    Wrap a view with conditional GET support.  See conditional_api().
+    :param view: The view
+    :param datasets: Names of the datasets the response is built from
+    :param prerendered: If True, responses pre-rendered by chart_prerender are served when available.
+    :return: wrapped view
+    """
+    view_name = f"{view.__module__}.{view.__qualname__}"
+
+    def etag_func(request, *args, **kwargs):
+        return _get_digest(request, datasets, view_name, kwargs)
+
+    def last_modified_func(request, *args, **kwargs):
+        return get_last_modified(request, datasets)
+
+    def prerendered_view(request, *args, **kwargs):
+        if request.method == 'GET':
+            chart = RenderedChart.get_content(etag_func(request, *args, **kwargs))
+            if chart is not None:
+                content, content_type = chart
+                return HttpResponse(content, content_type=content_type)
+
+        return view(request, *args, **kwargs)
+
+    conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(
+        prerendered_view if prerendered else view)
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        # views that call other views directly do not need the headers
+        if request is None:
+            return view(request, *args, **kwargs)
+
+        response = conditional_view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+
+        return response
+
+    # used by chart_prerender to render the view and identify the rendering
+    wrapper.datasets = datasets
+    wrapper.prerendered = prerendered
+    wrapper.get_etag = etag_func
+
+    return wrapper
+
+
+def conditional_api(*datasets):
+    """
+    Decorator that adds a strong ETag, Last-Modified and Cache-Control to the response of a view.
+    Requests with a matching If-None-Match or If-Modified-Since are answered with 304 Not Modified
+    without running the view.  Shared caches (eg: a reverse proxy) may store the response but must
+    revalidate it on every request so that responses are never stale after an ingest.
+    :param datasets: Names of the datasets the response is built from (eg: DATASET_OBSERVATIONS)
+    :return: decorated view
+    """
+    def decorator(view):
+        return _conditional(view, datasets)
+
+    return decorator
+
+
+def prerendered_chart(*datasets):
+    """
+    Decorator of chart views that supports conditional GET (see conditional_api()) and serves the
+    responses rendered by chart_prerender.prerender_charts() after each ingest.
+    :param datasets: Names of the datasets the chart is built from (eg: DATASET_OBSERVATIONS)
+    :return: decorated view
+    """
+    def decorator(view):
+        return _conditional(view, datasets, prerendered=True)
+
+    return decorator
+
+
+def cached_api(*datasets):
+    """
+    Decorator that caches the response of an api view and supports conditional GET (see conditional_api()).
+    :param datasets: Names of the datasets the response is built from (eg: DATASET_OBSERVATIONS)
+    :return: decorated view
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def cached_view(request, *args, **kwargs):
+            # views that call the api directly with arguments are not cached
+            if args or kwargs or request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            cache = caches[AQ_API_CACHE]
+            key = get_cache_key(request, datasets)
+
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request)
+            if response.status_code == 200 and not response.streaming:
+                cache.set(key, (response.content, response['Content-Type']))
+
+            return response
+
+        return conditional_api(*datasets)(cached_view)
+
+    return decorator
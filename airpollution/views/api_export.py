@@ -0,0 +1,187 @@
+"""
+Columnar exports and streamed JSON of the /aq_api data.
+Rows are streamed with StreamingHttpResponse in chunks of EXPORT_CHUNK_SIZE rows so that large
+exports are never held in memory.  CSV is always available.  Parquet and Arrow IPC require pyarrow.
+"""
+import csv
+import io
+
+from django.http import StreamingHttpResponse
+
+from airpollution.json_encoding import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+JSON_FORMAT = 'json'
+
+# content type and file extension of each export format
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+# number of rows written per CSV chunk, Arrow record batch and Parquet row group
+EXPORT_CHUNK_SIZE = 10000
+
+# schemas of the exports.  Types are pyarrow type aliases.
+DAILY_EXPORT_SCHEMA = [('country_code', 'string'), ('date', 'string'), ('pollutant', 'string'),
+                       ('day-avg-level', 'float64'), ('ytd-avg-level', 'float64'),
+                       ('prior-day-avg-level', 'float64'), ('prior-ytd-avg-level', 'float64')]
+ANNUAL_EXPORT_SCHEMA = [('country_code', 'string'), ('year', 'int32'), ('pollutant', 'string'),
+                        ('value', 'float64')]
+
+# date_time values are exported in UTC
+READINGS_EXPORT_SCHEMA = [('date_time', 'timestamp[us]'), ('air_quality_station', 'string'),
+                          ('country_code', 'string'), ('pollutant', 'string'), ('value', 'float64'),
+                          ('unit', 'string'), ('validity', 'int8'), ('verification', 'int8')]
+ROLLING_EXPORT_SCHEMA = [('date_time', 'timestamp[us]'), ('air_quality_station', 'string'),
+                         ('country_code', 'string'), ('pollutant', 'string'), ('value', 'float64'),
+                         ('unit', 'string'), ('hours', 'int8')]
+DAY_MEAN_EXPORT_SCHEMA = [('date', 'date32'), ('air_quality_station', 'string'), ('country_code', 'string'),
+                          ('pollutant', 'string'), ('value', 'float64'), ('unit', 'string'), ('hours', 'int8')]
+
+
+def get_export_formats() -> list:
+    """
+    Return the export formats supported by the installed packages.
+    :return: list of format names
+    """
+    return [f for f in EXPORT_FORMATS if f == 'csv' or pa is not None]
+
+
+class _StreamSink(io.RawIOBase):
+    """
+    Write-only file object that holds the bytes written since the last drain().
+    """
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _iter_chunks(rows, size: int = EXPORT_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _stream_csv(rows, schema: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([name for name, t in schema])
+    for chunk in _iter_chunks(rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    # the header of exports without rows
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _get_arrow_schema(schema: list):
+    return pa.schema([(name, pa.type_for_alias(t)) for name, t in schema])
+
+
+def _to_record_batch(chunk: list, arrow_schema):
+    columns = list(zip(*chunk))
+    return pa.RecordBatch.from_arrays([pa.array(values, type=field.type, from_pandas=True)
+                                       for values, field in zip(columns, arrow_schema)],
+                                      schema=arrow_schema)
+
+
+def _stream_arrow(rows, schema: list):
+    arrow_schema = _get_arrow_schema(schema)
+    sink = _StreamSink()
+
+    writer = pa.ipc.new_stream(sink, arrow_schema)
+    for chunk in _iter_chunks(rows):
+        writer.write_batch(_to_record_batch(chunk, arrow_schema))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def _stream_parquet(rows, schema: list):
+    arrow_schema = _get_arrow_schema(schema)
+    sink = _StreamSink()
+
+    # each chunk is written as a row group.  The footer is written when the writer is closed.
+    writer = pq.ParquetWriter(sink, arrow_schema)
+    for chunk in _iter_chunks(rows):
+        writer.write_table(pa.Table.from_batches([_to_record_batch(chunk, arrow_schema)]))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def _stream_json(rows, schema: list):
+    columns = [name for name, t in schema]
+
+    yield b'['
+    separator = b''
+    for chunk in _iter_chunks(rows):
+        # the array brackets of each chunk are removed
+        yield separator + dumps([dict(zip(columns, row)) for row in chunk])[1:-1]
+        separator = b','
+    yield b']'
+
+
+def json_stream_response(rows, schema: list) -> StreamingHttpResponse:
+    """
+    Stream rows as a JSON array of objects keyed by the schema column names.
+    :param rows: Iterable of tuples in the order of the schema columns
+    :param schema: List of (column name, pyarrow type alias) tuples
+    :return: StreamingHttpResponse
+    """
+    return StreamingHttpResponse(_stream_json(rows, schema), content_type='application/json')
+
+
+def export_response(rows, schema: list, export_format: str, filename: str) -> StreamingHttpResponse:
+    """
+    Stream rows as a file download.
+    :param rows: Iterable of tuples in the order of the schema columns (eg: a values_list() QuerySet iterator)
+    :param schema: List of (column name, pyarrow type alias) tuples
+    :param export_format: One of get_export_formats()
+    :param filename: Name of the downloaded file without extension
+    :return: StreamingHttpResponse
+    """
+    streams = {'csv': _stream_csv, 'parquet': _stream_parquet, 'arrow': _stream_arrow}
+    content_type, extension = EXPORT_FORMATS[export_format]
+
+    response = StreamingHttpResponse(streams[export_format](rows, schema), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+
+    return response
@@ -15,17 +15,35 @@ Responses
     UNKNOWN_ERROR       unknown error
 
 """
+import base64
+import binascii
+import collections
+import datetime
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 from bokeh.models import GeoJSONDataSource
-from django.http import JsonResponse
+from django.db import connections
+from django.db.models import Avg
+from django.http import HttpRequest, HttpResponse, QueryDict
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 
 from airpollution.models import ObservationStationReading, ObservationStation, Pollutant, NutsRegions, \
-    CURRENT_NUTS_VERSION, EEADataModel, EurostatDataModel
+    CURRENT_NUTS_VERSION, EEADataModel, EurostatDataModel, SatelliteRegionalAggregate, Target, EU_ISOCODES, \
+    DATASET_OBSERVATIONS, DATASET_STATIONS, DATASET_EMISSIONS, DATASET_POPULATION, DATASET_NUTS, DATASET_POLLUTANTS, \
+    DATASET_COPERNICUS, READINGS_KEY
+from airpollution.views.api_cache import cached_api, conditional_api
+from airpollution.views.api_export import JSON_FORMAT, EXPORT_CHUNK_SIZE, DAILY_EXPORT_SCHEMA, ANNUAL_EXPORT_SCHEMA, \
+    READINGS_EXPORT_SCHEMA, ROLLING_EXPORT_SCHEMA, DAY_MEAN_EXPORT_SCHEMA, get_export_formats, export_response, \
+    json_stream_response
+from airpollution.json_encoding import ApiJsonResponse, to_geojson, dumps
+from eugreendeal.settings import AQ_API_BATCH_WORKERS
 
 
 def _get_api_logger(name: str, verbosity: int = 0) -> logging.Logger:
@@ -42,6 +60,8 @@ def _get_api_logger(name: str, verbosity: int = 0) -> logging.Logger:
 def _get_annual_data(years: list, countries: list = None, pollutants: list = None, verbosity: int = 0) -> dict:
     logger = _get_api_logger("daily_logger", verbosity=verbosity)
 
+    if type(years) == str:
+        years = years.replace(' ', '').split(',')
     if type(countries) == str:
         countries = countries.replace(' ', '').split(',')
     if type(pollutants) == str:
@@ -53,7 +73,46 @@ def _get_annual_data(years: list, countries: list = None, pollutants: list = Non
                                             logger=logger)
 
 
-def annual(request, years:list=None, countries:list=None, pollutants:list=None, verbosity:int = 0) -> JsonResponse:
+def _get_annual_rows(years: list, countries: list = None, pollutants: list = None):
+    if type(years) == str:
+        years = years.replace(' ', '').split(',')
+    if type(countries) == str:
+        countries = countries.replace(' ', '').split(',')
+    if type(pollutants) == str:
+        pollutants = pollutants.replace(' ', '').split(',')
+
+    # rows are fetched from the database in chunks while the response is streamed
+    return ObservationStationReading.annual_values(years=years,
+                                                   countries=countries,
+                                                   pollutants=pollutants).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _get_daily_rows(countries, pollutants, start_date, end_date, verbosity: int = 0):
+    logger = _get_api_logger("daily_logger", verbosity=verbosity)
+
+    if type(countries) == str:
+        countries = countries.replace(' ', '').split(',')
+    if type(pollutants) == str:
+        pollutants = pollutants.replace(' ', '').split(',')
+
+    df = ObservationStationReading.daily_df(start_date=start_date,
+                                            end_date=end_date,
+                                            countries=countries,
+                                            pollutants=pollutants, logger=logger)
+
+    # missing levels are exported as empty values
+    df = df.astype(object).where(df.notnull(), None)
+
+    return df.itertuples(index=False, name=None)
+
+
+def _unsupported_format(export_format: str) -> ApiJsonResponse:
+    formats = ', '.join([JSON_FORMAT] + get_export_formats())
+    return ApiJsonResponse(f"Unsupported format '{export_format}'. Supported formats: {formats}.", status=400)
+
+
+@cached_api(DATASET_OBSERVATIONS, DATASET_POLLUTANTS)
+def annual(request, years:list=None, countries:list=None, pollutants:list=None, verbosity:int = 0) -> ApiJsonResponse:
     """
     /aq_api/annual
     Provides pollutant levels in units of micro g/m3 by pollutant, country, and year.
@@ -67,11 +126,17 @@ def annual(request, years:list=None, countries:list=None, pollutants:list=None,
 
     For a set of countries, pollutants and/or years:
     http://localhost:8000/aq_api/annual?version=v1&countries=de,fr,be&years=2016,2017,2018&pollutants=o3,co
+
+    As a table of country_code, year, pollutant and value in csv, parquet or arrow format:
+    http://localhost:8000/aq_api/annual?version=v1&years=2016,2017,2018&format=parquet
     :param request:
     :return:
     """
+    export_format = JSON_FORMAT
+
     if request is not None:
         version = request.GET.get('version', None)
+        export_format = request.GET.get('format', JSON_FORMAT).lower()
         if pollutants is None:
             pollutants = request.GET.get('pollutants', None)
         if countries is None:
@@ -81,12 +146,20 @@ def annual(request, years:list=None, countries:list=None, pollutants:list=None,
         if verbosity is None:
             verbosity = request.GET.get('verbosity', 0)
 
+    if export_format != JSON_FORMAT:
+        if export_format not in get_export_formats():
+            return _unsupported_format(export_format)
+
+        return export_response(_get_annual_rows(years, countries, pollutants), ANNUAL_EXPORT_SCHEMA,
+                               export_format, 'annual')
+
     results = _get_annual_data(years, countries, pollutants, verbosity=verbosity)
 
-    return JsonResponse(results, safe=False)
+    return ApiJsonResponse(results)
 
 
-def daily(request) -> JsonResponse:
+@cached_api(DATASET_OBSERVATIONS, DATASET_POLLUTANTS)
+def daily(request) -> ApiJsonResponse:
     """
     /aq_api/daily
     Provides pollutant levels in units of micro g/m3 by region, pollutant, and date.
@@ -96,6 +169,8 @@ def daily(request) -> JsonResponse:
     Example to get all data available (gets all data in a development environment - will be large for production):
     http://localhost:8000/aq_api/daily?version=v1&start-date=2020-01-01&end-date=2020-12-31
 
+    As a table with a row per country, date and pollutant in csv, parquet or arrow format:
+    http://localhost:8000/aq_api/daily?version=v1&start-date=2020-01-01&end-date=2020-12-31&format=csv
 
     :param request:
     :return: Dictionary.
@@ -106,17 +181,25 @@ def daily(request) -> JsonResponse:
     start_date = request.GET.get('start-date', None)
     end_date = request.GET.get('end-date', None)
     verbosity = request.GET.get('verbosity', 0)
+    export_format = request.GET.get('format', JSON_FORMAT).lower()
 
     if end_date is None and start_date is not None:
         end_date = start_date
 
     # TODO: Make this a 404 error
     if start_date is None or end_date is None:
-        return JsonResponse("Both 'start-date' and 'end-date' are required parameters.", safe=False)
+        return ApiJsonResponse("Both 'start-date' and 'end-date' are required parameters.")
+
+    if export_format != JSON_FORMAT:
+        if export_format not in get_export_formats():
+            return _unsupported_format(export_format)
+
+        return export_response(_get_daily_rows(countries, pollutants, start_date, end_date, verbosity),
+                               DAILY_EXPORT_SCHEMA, export_format, 'daily')
 
     results = get_daily_data(countries, pollutants, start_date, end_date, verbosity)
 
-    return JsonResponse(results, safe=False)
+    return ApiJsonResponse(results)
 
 
 def get_daily_data(countries, pollutants, start_date, end_date, verbosity: int = 0):
@@ -132,20 +215,98 @@ def get_daily_data(countries, pollutants, start_date, end_date, verbosity: int =
                                            pollutants=pollutants, logger=logger)
 
 
-def _get_nuts2_population_series():
-    # get nuts2 region population of most recent year
-    df = pd.DataFrame(EurostatDataModel.objects.all().values('year', 'nutsRegionStr',
-                                                             'population'))  # .drop(columns=['id', 'nutsRegion'])
-    df = df.rename(columns={'nutsRegionStr': 'nuts_2_id'})
-    df_pivot = df.pivot_table(columns=['year'], index=['nuts_2_id'])
-    df_pivot.columns = df_pivot.columns.get_level_values(1)
+# columns of the DataFrames returned by get_daily_df() and flatten_daily_data()
+DAILY_COLUMNS = ['nuts_id', 'date', 'pollutant', 'pollutant_level', 'yoy_level']
+
+
+def _format_daily_df(df: pd.DataFrame) -> pd.DataFrame:
+    df['nuts_id'] = df['nuts_id'].str.upper()
+    df['pollutant'] = df['pollutant'].str.upper()
+    df[['pollutant_level', 'yoy_level']] = df[['pollutant_level', 'yoy_level']].astype(float).fillna(0).round(2)
 
-    # get most recent year
-    pop_year = df_pivot.columns[df_pivot.columns.argmax()]
-    population = df_pivot[pop_year]
-    population.name = 'population'
+    return df
 
-    return population
+
+def get_daily_df(countries, pollutants, start_date, end_date, verbosity: int = 0) -> pd.DataFrame:
+    """
+    Tabular form of get_daily_data() for views that build tables, maps and charts.
+    Each country has a row for every pollutant reported by the country on each date.
+    :param countries: List or comma separated string of country codes
+    :param pollutants: List or comma separated string of pollutant keys
+    :param start_date: YYYY-MM-DD string of start date
+    :param end_date: YYYY-MM-DD string of end date
+    :param verbosity: Optional. Logging verbosity.
+    :return: DataFrame with columns nuts_id, date, pollutant, pollutant_level and yoy_level.
+             Region and pollutant keys are upper case and missing levels are 0.
+    """
+    logger = _get_api_logger("daily_logger", verbosity=verbosity)
+
+    if type(countries) == str:
+        countries = countries.replace(' ', '').split(',')
+    if type(pollutants) == str:
+        pollutants = pollutants.replace(' ', '').split(',')
+
+    df = ObservationStationReading.daily_df(start_date=start_date,
+                                            end_date=end_date,
+                                            countries=countries,
+                                            pollutants=pollutants, logger=logger)
+
+    # missing pollutants of a country on a date have empty levels
+    grid = df[['country_code', 'date']].drop_duplicates() \
+        .merge(df[['country_code', 'pollutant']].drop_duplicates(), on='country_code')
+    df = grid.merge(df, on=['country_code', 'date', 'pollutant'], how='left') \
+        .rename(columns={'country_code': 'nuts_id',
+                         'day-avg-level': 'pollutant_level',
+                         'prior-day-avg-level': 'yoy_level'})
+
+    return _format_daily_df(df[DAILY_COLUMNS].copy())
+
+
+def flatten_daily_data(daily_levels: dict) -> pd.DataFrame:
+    """
+    Flatten the nested dictionary returned by get_daily_data() into a DataFrame in a single pass.
+    :param daily_levels: {region: {date: {pollutant: {'day-avg-level': x, 'prior-day_avg_level': y}}}}
+    :return: DataFrame with columns nuts_id, date, pollutant, pollutant_level and yoy_level.
+             Region and pollutant keys are upper case and missing levels are 0.
+    """
+    rows = [(region_key, date_key, pollutant_key,
+             pollutant_value.get("day-avg-level"), pollutant_value.get("prior-day_avg_level"))
+            for region_key, region_value in daily_levels.items()
+            for date_key, date_value in region_value.items()
+            for pollutant_key, pollutant_value in date_value.items()
+            if pollutant_value is not None]
+
+    return _format_daily_df(pd.DataFrame.from_records(rows, columns=DAILY_COLUMNS))
+
+
+def get_annual_df(years: list = None, countries: list = None, pollutants: list = None,
+                  verbosity: int = 0) -> pd.DataFrame:
+    """
+    Tabular form of the /aq_api/annual data.
+    :param years: Optional. List or comma separated string of years.  Includes all years if not provided.
+    :param countries: Optional. List or comma separated string of country codes.
+    :param pollutants: Optional. List or comma separated string of pollutant keys.
+    :param verbosity: Optional. Logging verbosity.
+    :return: DataFrame with columns country_code, year, pollutant and value
+    """
+    logger = _get_api_logger("daily_logger", verbosity=verbosity)
+
+    if type(years) == str:
+        years = years.replace(' ', '').split(',')
+    if type(countries) == str:
+        countries = countries.replace(' ', '').split(',')
+    if type(pollutants) == str:
+        pollutants = pollutants.replace(' ', '').split(',')
+
+    return ObservationStationReading.annual_df(years=years,
+                                               countries=countries,
+                                               pollutants=pollutants,
+                                               logger=logger)
+
+
+def _get_nuts2_population_series():
+    # get nuts2 region population of most recent year - pivot is cached by the model
+    return EurostatDataModel.get_latest_population()
 
 
 def get_target_bubblemap_data(start_date: str, end_date: str, pollutants: list = ('PM25', 'PM10', 'NO2')):
@@ -197,12 +358,157 @@ def get_target_bubblemap_data(start_date: str, end_date: str, pollutants: list =
     rv = {}
     for p in pollutants:
         p_gdf = rs_gdf[rs_gdf['pollutant_id'] == p]
-        p_geo = GeoJSONDataSource(geojson=json.dumps(p_gdf.__geo_interface__))
+        p_geo = GeoJSONDataSource(geojson=to_geojson(p_gdf))
         rv.update({p: p_geo})
 
     return rv
 
 
+# sources of regional pollutant levels for exposure calculations
+EXPOSURE_SOURCES = ('stations', 'satellite')
+
+
+@cached_api(DATASET_OBSERVATIONS, DATASET_STATIONS, DATASET_COPERNICUS, DATASET_POPULATION, DATASET_NUTS,
+            DATASET_POLLUTANTS)
+def exposure(request) -> ApiJsonResponse:
+    """
+    /aq_api/exposure
+    Provides population-weighted pollutant exposure and the population living in NUTS 2 regions
+    above the calendar year target by pollutant, region (EU and countries) and year.
+    NUTS 2 populations are from the most recent Eurostat year.
+    Regional pollutant levels are from observation stations (source=stations) or satellite images (source=satellite).
+
+    Example requests:
+    For all pollutants, all countries, all years:
+    http://localhost:8000/aq_api/exposure?version=v1
+
+    For a set of countries, pollutants and/or years:
+    http://localhost:8000/aq_api/exposure?version=v1&countries=de,fr&years=2019,2020&pollutants=pm25,no2&source=satellite
+    :param request:
+    :return: Dictionary of exposure by pollutant, region and year.
+    """
+    version = request.GET.get('version', '')
+    countries = request.GET.get('countries', None)
+    years = request.GET.get('years', None)
+    pollutants = request.GET.get('pollutants', None)
+    source = request.GET.get('source', 'stations')
+
+    if source not in EXPOSURE_SOURCES:
+        return ApiJsonResponse(f"'source' must be one of {list(EXPOSURE_SOURCES)}.")
+
+    results = get_exposure_data(years=years, countries=countries, pollutants=pollutants, source=source)
+
+    return ApiJsonResponse(results)
+
+
+def _get_nuts2_levels_df(pollutants: list, years: list, countries: list, source: str) -> pd.DataFrame:
+    """
+    Returns the annual average pollutant level of each NUTS 2 region.
+    :param pollutants: List of pollutant keys
+    :param years: List of years.  If None, all years are included.
+    :param countries: List of country codes
+    :param source: One of EXPOSURE_SOURCES
+    :return: Dataframe with columns nuts_2_id, country, pollutant, year, value
+    """
+    if source == 'satellite':
+        qs = SatelliteRegionalAggregate.objects.filter(nuts_level=2, pollutant__in=pollutants,
+                                                       region__CNTR_CODE__in=countries)
+        if years is not None:
+            qs = qs.filter(date_time__year__in=years)
+        rs = qs.values('region__NUTS_ID', 'region__CNTR_CODE', 'pollutant_id', 'date_time__year').annotate(Avg('mean'))
+        columns = {'region__NUTS_ID': 'nuts_2_id', 'region__CNTR_CODE': 'country', 'mean__avg': 'value'}
+    else:
+        qs = ObservationStationReading.objects.filter(validity=1, pollutant__in=pollutants,
+                                                      air_quality_station__nuts_2__CNTR_CODE__in=countries)
+        if years is not None:
+            qs = qs.filter(date_time__year__in=years)
+        rs = qs.values('air_quality_station__nuts_2__NUTS_ID', 'air_quality_station__nuts_2__CNTR_CODE',
+                       'pollutant_id', 'date_time__year').annotate(Avg('value'))
+        columns = {'air_quality_station__nuts_2__NUTS_ID': 'nuts_2_id',
+                   'air_quality_station__nuts_2__CNTR_CODE': 'country', 'value__avg': 'value'}
+
+    columns.update({'pollutant_id': 'pollutant', 'date_time__year': 'year'})
+
+    return pd.DataFrame(rs, columns=list(columns.keys())).rename(columns=columns)
+
+
+def get_exposure_df(years: list = None, countries: list = None, pollutants: list = None,
+                    source: str = 'stations') -> pd.DataFrame:
+    """
+    Returns population-weighted exposure for the EU and each country.
+    :param years: Optional. List of years.  If None, all years are included.
+    :param countries: Optional. List of country codes.  If None, all EU countries are included.
+    :param pollutants: Optional. List of pollutant keys.  If None, all pollutants with a calendar year target are included.
+    :param source: Optional. One of EXPOSURE_SOURCES.  Defaults to 'stations'.
+    :return: Dataframe with columns region, pollutant, year, population, exposure, population_above_target,
+             share_above_target
+    """
+    targets = dict(Target.objects.filter(measurement='calendar_year').values_list('pollutant_id', 'value'))
+
+    if countries is None:
+        countries = EU_ISOCODES
+    if pollutants is None:
+        pollutants = list(targets.keys())
+
+    countries = [c.upper() for c in countries]
+    pollutants = [p.upper() for p in pollutants]
+
+    columns = ['region', 'pollutant', 'year', 'population', 'exposure', 'population_above_target',
+               'share_above_target']
+
+    df = _get_nuts2_levels_df(pollutants, years, countries, source)
+    df = df.merge(_get_nuts2_population_series(), left_on='nuts_2_id', right_index=True)
+
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+
+    df['weighted_value'] = df['value'] * df['population']
+    df['target'] = df['pollutant'].map(targets)
+    df['population_above_target'] = df['population'].where(df['value'] > df['target'], 0)
+    df.loc[df['target'].isna(), 'population_above_target'] = np.nan
+
+    def _summarize(group_df: pd.DataFrame, region_columns: list) -> pd.DataFrame:
+        rv = group_df.groupby(region_columns + ['pollutant', 'year']).agg(
+            population=('population', 'sum'),
+            weighted_value=('weighted_value', 'sum'),
+            population_above_target=('population_above_target', lambda x: x.sum(min_count=1)))
+        rv['exposure'] = rv['weighted_value'] / rv['population']
+        rv['share_above_target'] = rv['population_above_target'] / rv['population']
+        return rv.reset_index()
+
+    eu_df = _summarize(df.assign(region='EU'), ['region'])
+    country_df = _summarize(df, ['country']).rename(columns={'country': 'region'})
+
+    return pd.concat([eu_df, country_df], ignore_index=True)[columns]
+
+
+def get_exposure_data(years: list = None, countries: list = None, pollutants: list = None,
+                      source: str = 'stations') -> dict:
+    """
+    Returns a dictionary of population-weighted exposure.  See get_exposure_df().
+    :return: Dictionary of exposure by pollutant, region and year.
+    """
+    if type(countries) == str:
+        countries = countries.replace(' ', '').split(',')
+    if type(years) == str:
+        years = [int(y) for y in years.split(',')]
+    if type(pollutants) == str:
+        pollutants = pollutants.replace(' ', '').split(',')
+
+    df = get_exposure_df(years=years, countries=countries, pollutants=pollutants, source=source)
+
+    rv_dict = {}
+    for r in df.itertuples():
+        rv_dict.setdefault(r.pollutant, {}).setdefault(r.region, {}).update({int(r.year): {
+            'population': int(r.population),
+            'exposure': float(r.exposure),
+            'population_above_target': None if pd.isna(r.population_above_target)
+            else int(r.population_above_target),
+            'share_above_target': None if pd.isna(r.share_above_target) else float(r.share_above_target)}})
+
+    return rv_dict
+
+
 def get_target_data(years, regions, pollutants):
     # convert years, regions and pollutants to lists
     if type(regions) == str:
@@ -217,7 +523,8 @@ def get_target_data(years, regions, pollutants):
                                      pollutants=pollutants)
 
 
-def region_boundaries(request) -> JsonResponse:
+@cached_api(DATASET_NUTS)
+def region_boundaries(request) -> ApiJsonResponse:
     """
     /aq_api/region-boundaries
     Returns NUTS region boundaries.
@@ -244,7 +551,7 @@ def region_boundaries(request) -> JsonResponse:
 
     results = get_region_boundaries_data(level, regions, year)
 
-    return JsonResponse(results, safe=False)
+    return ApiJsonResponse(results)
 
 
 def get_region_boundaries_data(level, regions, year=CURRENT_NUTS_VERSION):
@@ -261,7 +568,8 @@ def get_region_boundaries_data(level, regions, year=CURRENT_NUTS_VERSION):
 
 
 # def region_info(request, nuts_level: int = None, year: int = CURRENT_NUTS_VERSION) -> JsonResponse:
-def region_info(request) -> JsonResponse:
+@cached_api(DATASET_NUTS)
+def region_info(request) -> ApiJsonResponse:
     """
     /aq_api/region-info
     Provides a list of NUTS regions and associated information.
@@ -288,7 +596,7 @@ def region_info(request) -> JsonResponse:
 
     results = get_region_info_data(level, year)
 
-    return JsonResponse(results, safe=False)
+    return ApiJsonResponse(results)
 
 
 def get_region_info_data(level, year=CURRENT_NUTS_VERSION):
@@ -301,7 +609,8 @@ def get_region_info_data(level, year=CURRENT_NUTS_VERSION):
     return results
 
 
-def sectors(request) -> JsonResponse:
+@cached_api(DATASET_EMISSIONS, DATASET_POLLUTANTS)
+def sectors(request) -> ApiJsonResponse:
     """
     /aq_api/sectors
     Provides emissions data by sector, pollutant, country, and year.
@@ -354,10 +663,11 @@ def sectors(request) -> JsonResponse:
 
     results = EEADataModel.get_sectors_info(year=years, country_code=countries, sector_group=sects,
                                             pollutant=pollutants)
-    return JsonResponse(results, safe=False)
+    return ApiJsonResponse(results)
 
 
-def targets(request) -> JsonResponse:
+@cached_api(DATASET_POLLUTANTS, DATASET_NUTS)
+def targets(request) -> ApiJsonResponse:
     """
     /aq_api/targets
     Provides a list of target emission levels by region, pollutant type, and year.
@@ -391,4 +701,303 @@ def targets(request) -> JsonResponse:
 
     results = Pollutant.get_all_targets(years=years, country_codes=regions, pollutants=pollutants)
 
-    return JsonResponse(results, safe=False)
+    return ApiJsonResponse(results)
+
+
+# readings returned per page by /aq_api/readings.  A page is fetched before it is streamed.
+READINGS_PAGE_SIZE = 10000
+READINGS_MAX_PAGE_SIZE = 100000
+
+READINGS_MODES = ('hourly', 'day_mean', 'rolling')
+
+# hours included in each rolling mean
+ROLLING_HOURS = 8
+
+
+def _parse_readings_time(value: str, end: bool = False) -> datetime.datetime:
+    """
+    Parse a YYYY-MM-DD or YYYY-MM-DDTHH[:MM] string.  Dates of the end of a range include all hours of the day.
+    Times without a time zone are in the current time zone.
+    """
+    dt = datetime.datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        dt = datetime.datetime.combine(dt.date(), datetime.time.max)
+
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+def _encode_cursor(mode: str, key: tuple) -> str:
+    first, station, pollutant = key
+    return base64.urlsafe_b64encode(json.dumps([mode, first.isoformat(), station, pollutant]).encode()).decode()
+
+
+def _decode_cursor(mode: str, cursor: str) -> tuple:
+    """
+    Return the key of a cursor returned by /aq_api/readings.
+    :raises ValueError: if the cursor is malformed or was returned for another mode
+    """
+    try:
+        cursor_mode, first, station, pollutant = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, binascii.Error, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor '{cursor}'.") from e
+
+    if cursor_mode != mode:
+        raise ValueError(f"The cursor was returned for mode '{cursor_mode}'.")
+
+    if mode == 'day_mean':
+        return datetime.date.fromisoformat(first), station, pollutant
+
+    return datetime.datetime.fromisoformat(first), station, pollutant
+
+
+def _get_rolling_rows(rows, start: datetime.datetime = None, after: tuple = None, limit: int = None):
+    """
+    Compute the rolling mean of each reading from the readings of the same station and pollutant
+    in the ROLLING_HOURS hours up to and including the hour of the reading.
+    Only the windows of the stations and pollutants are held in memory.
+    :param rows: READINGS_COLUMNS tuples ordered by READINGS_KEY that start ROLLING_HOURS - 1 hours before the page
+    :param start: Optional. Readings before start are only used for the means.
+    :param after: Optional. Readings up to this READINGS_KEY are only used for the means.
+    :param limit: Optional. Maximum number of rows.
+    :return: generator of ROLLING_EXPORT_SCHEMA tuples
+    """
+    window_size = datetime.timedelta(hours=ROLLING_HOURS)
+    windows = {}
+    count = 0
+
+    for date_time, station, country_code, pollutant, value, unit, validity, verification in rows:
+        window = windows.setdefault((station, pollutant), collections.deque())
+        window.append((date_time, value))
+        while window[0][0] <= date_time - window_size:
+            window.popleft()
+
+        if after is not None and (date_time, station, pollutant) <= after:
+            continue
+        if start is not None and date_time < start:
+            continue
+
+        yield date_time, station, country_code, pollutant, sum(v for d, v in window) / len(window), unit, len(window)
+
+        count += 1
+        if limit is not None and count == limit:
+            return
+
+
+@conditional_api(DATASET_OBSERVATIONS, DATASET_STATIONS, DATASET_NUTS)
+def readings(request):
+    """
+    /aq_api/readings
+    Provides the readings of the EEA observation stations.  The readings are streamed in pages ordered by
+    date_time, station and pollutant.  The response of a page that is followed by another page has a
+    'Link: <url>; rel="next"' header and the cursor of the next page in an 'X-Next-Cursor' header.
+
+    Parameters:
+    start-date, end-date    YYYY-MM-DD or YYYY-MM-DDTHH:MM.  Dates of end-date include all hours of the day.
+    mode                    'hourly' | 'day_mean' | 'rolling'.  Defaults to 'hourly'.
+                            'hourly' - all available readings including their validity and verification
+                            'day_mean' - a mean value for all available and valid hours for each day
+                            'rolling' - An 8-hour rolling mean.  Each hour value provided is the mean of the
+                                        valid readings of that hour and the previous 7.
+    stations                Optional. Comma separated station codes.
+    countries               Optional. Comma separated country codes.
+    regions                 Optional. Comma separated NUTS ids of any level.  Takes precedence over countries.
+    pollutants              Optional. Comma separated pollutant keys.  If none, all are returned.
+    limit                   Optional. Readings per page.  Defaults to READINGS_PAGE_SIZE.
+    cursor                  Optional. Cursor of the next page returned by the previous page.
+    format                  Optional. 'json' | 'csv' | 'parquet' | 'arrow'.  Defaults to 'json'.
+
+    Example request:
+    http://localhost:8000/aq_api/readings?version=v1&start-date=2020-04-01&end-date=2020-04-30&regions=DE1&pollutants=no2
+
+    :param request:
+    :return: StreamingHttpResponse
+    """
+    mode = request.GET.get('mode', 'hourly').lower()
+    export_format = request.GET.get('format', JSON_FORMAT).lower()
+    stations, countries, regions, pollutants = [
+        [v.strip() for v in request.GET[p].split(',') if v.strip()] if request.GET.get(p) else None
+        for p in ('stations', 'countries', 'regions', 'pollutants')]
+
+    if mode not in READINGS_MODES:
+        return ApiJsonResponse(f"Unsupported mode '{mode}'. Supported modes: {', '.join(READINGS_MODES)}.",
+                               status=400)
+    if export_format != JSON_FORMAT and export_format not in get_export_formats():
+        return _unsupported_format(export_format)
+
+    try:
+        start = _parse_readings_time(request.GET['start-date']) if request.GET.get('start-date') else None
+        end = _parse_readings_time(request.GET['end-date'], end=True) if request.GET.get('end-date') else None
+        limit = min(int(request.GET.get('limit', READINGS_PAGE_SIZE)), READINGS_MAX_PAGE_SIZE)
+        after = _decode_cursor(mode, request.GET['cursor']) if request.GET.get('cursor') else None
+    except ValueError as e:
+        return ApiJsonResponse(str(e), status=400)
+
+    if limit < 1:
+        return ApiJsonResponse("'limit' must be a positive number.", status=400)
+
+    filters = {'end': end, 'stations': stations, 'countries': countries, 'regions': regions,
+               'pollutants': pollutants}
+
+    # a page is fetched with the first row of the next page to know whether the next page exists
+    if mode == 'day_mean':
+        qs = ObservationStationReading.day_means(start=start, after=after, **filters)
+        rows = list(qs[:limit + 1])
+        schema = DAY_MEAN_EXPORT_SCHEMA
+    else:
+        schema = READINGS_EXPORT_SCHEMA
+
+        if mode == 'hourly':
+            page = ObservationStationReading.readings(start=start, after=after, **filters)
+            rows = list(page[:limit + 1])
+        else:
+            # the means of the first readings of the page include the readings of the previous hours
+            first = after[0] if after is not None else start
+            window_start = first - datetime.timedelta(hours=ROLLING_HOURS - 1) if first is not None else None
+            window = ObservationStationReading.readings(start=window_start, valid_only=True, **filters)
+            rows = list(_get_rolling_rows(window.iterator(chunk_size=EXPORT_CHUNK_SIZE), start=start, after=after,
+                                          limit=limit + 1))
+            schema = ROLLING_EXPORT_SCHEMA
+
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    if export_format == JSON_FORMAT:
+        response = json_stream_response(rows, schema)
+    else:
+        response = export_response(rows, schema, export_format, f"readings_{mode}")
+
+    # the key (date or date_time, station, pollutant) of the last row of the page is the cursor of the next page
+    if has_next:
+        cursor = _encode_cursor(mode, (rows[-1][0], rows[-1][1], rows[-1][3]))
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        response['Link'] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+        response['X-Next-Cursor'] = cursor
+
+    return response
+
+
+# endpoints that can be queried by /aq_api/batch
+BATCH_ENDPOINTS = {
+    'daily': daily,
+    'annual': annual,
+    'targets': targets,
+    'sectors': sectors,
+    'exposure': exposure,
+    'region_info': region_info,
+    'region_boundaries': region_boundaries,
+}
+
+# maximum number of sub-queries of a batch
+BATCH_MAX_QUERIES = 50
+
+
+def _get_batch_queries(request) -> list:
+    """
+    Return the sub-queries of a batch request as a list of (id, endpoint, params) tuples.
+    :raises ValueError: if the queries are malformed
+    """
+    try:
+        if request.method == 'POST':
+            body = json.loads(request.body or b'{}')
+        else:
+            body = {'queries': json.loads(request.GET.get('queries', '[]'))}
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Queries are not valid JSON. {e}") from e
+
+    queries = body.get('queries') if isinstance(body, dict) else body
+    if not isinstance(queries, list) or not queries:
+        raise ValueError("'queries' must be a list of {'id', 'endpoint', 'params'} objects.")
+    if len(queries) > BATCH_MAX_QUERIES:
+        raise ValueError(f"A batch is limited to {BATCH_MAX_QUERIES} queries.")
+
+    rv = []
+    for i, q in enumerate(queries):
+        if not isinstance(q, dict) or q.get('endpoint') not in BATCH_ENDPOINTS:
+            raise ValueError(f"Query {i} must have an endpoint of: {', '.join(BATCH_ENDPOINTS)}.")
+
+        # lists of values are sent to the endpoints as comma separated strings
+        params = {k: ','.join(str(v) for v in value) if isinstance(value, list) else str(value)
+                  for k, value in (q.get('params') or {}).items() if k != 'format'}
+        rv.append((str(q.get('id', i)), q['endpoint'], params))
+
+    if len({query_id for query_id, endpoint, params in rv}) != len(rv):
+        raise ValueError("Query ids must be unique.")
+
+    return rv
+
+
+def _run_batch_query(request, endpoint: str, params: dict, dataset_versions: dict, threaded: bool = False):
+    """
+    Run a sub-query of a batch through the view of its endpoint so that it is served from the api cache.
+    :return: tuple of (status code, JSON bytes)
+    """
+    sub_request = HttpRequest()
+    sub_request.method = 'GET'
+    sub_request.path = f"/aq_api/{endpoint}"
+    sub_request.META = {k: v for k, v in request.META.items() if not k.startswith('HTTP_IF_')}
+    sub_request.GET = QueryDict(mutable=True)
+    sub_request.GET.update(params)
+
+    # dataset versions are queried once for the batch (see api_cache)
+    sub_request._dataset_versions = dataset_versions
+
+    try:
+        response = BATCH_ENDPOINTS[endpoint](sub_request)
+        return response.status_code, response.content
+    except Exception as e:
+        logging.getLogger("batch_logger").exception(f"Batch query '{endpoint}' failed.")
+        return 500, dumps(f"{type(e).__name__}: {e}")
+    finally:
+        # threads open their own database connections
+        if threaded:
+            connections.close_all()
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def batch(request) -> HttpResponse:
+    """
+    /aq_api/batch
+    Runs several /aq_api queries in one request.  Identical queries are run once, the versions of the datasets
+    are queried once for all queries and each query is served from the api cache when possible.
+    Queries are run in a pool of AQ_API_BATCH_WORKERS threads when the parallel parameter is true.
+
+    The queries are posted as JSON:
+    {"queries": [{"id": "no2", "endpoint": "daily",
+                  "params": {"start-date": "2020-04-01", "end-date": "2020-04-30", "pollutants": ["NO2"]}},
+                 {"id": "targets", "endpoint": "targets", "params": {"pollutants": "NO2"}}]}
+
+    or sent as a JSON list in the queries parameter:
+    http://localhost:8000/aq_api/batch?version=v1&queries=[{"endpoint":"region_info","params":{"levels":0}}]
+
+    :param request:
+    :return: JSON dictionary of {id: {"status": status code, "data": response of the query}}
+    """
+    try:
+        queries = _get_batch_queries(request)
+    except ValueError as e:
+        return ApiJsonResponse(str(e), status=400)
+
+    parallel = request.GET.get('parallel', '').lower() in ('1', 'true')
+    dataset_versions = getattr(request, '_dataset_versions', {})
+
+    # identical queries share a result
+    unique = list(dict.fromkeys((endpoint, tuple(sorted(params.items()))) for query_id, endpoint, params in queries))
+
+    if parallel and len(unique) > 1:
+        with ThreadPoolExecutor(max_workers=min(AQ_API_BATCH_WORKERS, len(unique))) as executor:
+            results = list(executor.map(
+                lambda q: _run_batch_query(request, q[0], dict(q[1]), dataset_versions, threaded=True), unique))
+    else:
+        results = [_run_batch_query(request, endpoint, dict(params), dataset_versions) for endpoint, params in unique]
+
+    results = dict(zip(unique, results))
+
+    # the JSON of each query is included without decoding it
+    parts = []
+    for query_id, endpoint, params in queries:
+        status, content = results[(endpoint, tuple(sorted(params.items())))]
+        parts.append(dumps(query_id) + b':{"status":' + str(status).encode() + b',"data":' + content + b'}')
+
+    return HttpResponse(b'{' + b','.join(parts) + b'}', content_type='application/json')
@@ -0,0 +1,123 @@
+"""
+Pre-rendering of the charts shown on the persona and default dashboards.
+After each ingest the Bokeh json_item payload of every chart url referenced by ChartViz and the
+default dashboards is rendered and stored compressed in RenderedChart.  Chart views decorated with
+prerendered_chart() serve the stored payload instead of rendering the chart in the request.
+"""
+import datetime
+import logging
+from urllib.parse import urlsplit
+
+from django.test import RequestFactory
+from django.urls import resolve, Resolver404
+
+from airpollution.models import ChartViz, RenderedChart
+
+# charts of the default dashboards that are rendered with the dates of the previous week
+DEFAULT_DASHBOARD_CHARTS = [
+    '/pollution_over_time?pollutant=PM25&start_date={start_date}&end_date={end_date}',
+    '/pollution_over_time?pollutant=NO2&start_date={start_date}&end_date={end_date}',
+    '/daily_aq?start_date={start_date}&end_date={end_date}',
+    '/pollution_regional_deltas_table?start_date={start_date}&end_date={end_date}',
+]
+
+
+def get_default_dashboard_urls(today: datetime.date = None) -> list:
+    """
+    Return the chart urls of the default dashboards.
+    The dashboards show the previous week (Sunday to Saturday).
+    :param today: Optional. Defaults to today.
+    :return: list of urls
+    """
+    if today is None:
+        today = datetime.date.today()
+
+    # weeks start on Sunday
+    start_date = today - datetime.timedelta(days=(today.weekday() + 1) % 7 + 7)
+    end_date = start_date + datetime.timedelta(days=6)
+
+    return [url.format(start_date=start_date.isoformat(), end_date=end_date.isoformat())
+            for url in DEFAULT_DASHBOARD_CHARTS]
+
+
+def get_chart_urls() -> list:
+    """
+    Return the urls of the charts of the persona dashboards and the default dashboards.
+    :return: list of unique urls
+    """
+    urls = ChartViz.objects.exclude(url__isnull=True).exclude(url='').values_list('url', flat=True)
+
+    return list(dict.fromkeys(list(urls) + get_default_dashboard_urls()))
+
+
+def prerender_chart(url: str, datasets: list = None, logger: logging.Logger = logging.getLogger()) -> bool:
+    """
+    Render a chart url and store the response.
+    :param url: Url of the chart including the query string
+    :param datasets: Optional. Only charts built from these datasets are rendered.  If None, all charts are rendered.
+    :param logger: Optional. Logger to display log results.
+    :return: True if the chart was rendered
+    """
+    parts = urlsplit(url)
+    path = parts.path if parts.path.startswith('/') else '/' + parts.path
+
+    # browsers are redirected to the url with a trailing slash when the url does not match a route
+    match = None
+    for p in (path, path + '/'):
+        try:
+            match = resolve(p)
+            path = p
+            break
+        except Resolver404:
+            continue
+
+    if match is None:
+        logger.info(f"No route for chart '{url}'")
+        return False
+
+    view = match.func
+    if not getattr(view, 'prerendered', False):
+        logger.info(f"Chart '{url}' is not pre-rendered")
+        return False
+
+    if datasets is not None and not set(datasets) & set(view.datasets):
+        return False
+
+    request = RequestFactory().get(f"{path}?{parts.query}" if parts.query else path)
+    etag = view.get_etag(request, *match.args, **match.kwargs)
+
+    # the chart was already rendered from the current data
+    if RenderedChart.objects.filter(etag=etag).exists():
+        return False
+
+    try:
+        response = view(request, *match.args, **match.kwargs)
+    except Exception as e:
+        logger.error(f"Chart '{url}' could not be rendered. {e}")
+        return False
+
+    if response.status_code != 200 or response.streaming:
+        logger.error(f"Chart '{url}' returned status {response.status_code}")
+        return False
+
+    RenderedChart.store(url, etag, response.content, response['Content-Type'])
+
+    return True
+
+
+def prerender_charts(datasets: list = None, logger: logging.Logger = logging.getLogger()) -> int:
+    """
+    Render the charts of the persona and default dashboards.  Called after a data source loads a dataset.
+    Renderings of urls that are no longer on a dashboard are removed.
+    :param datasets: Optional. Only charts built from these datasets are rendered.  If None, all charts are rendered.
+    :param logger: Optional. Logger to display log results.
+    :return: Number of charts rendered
+    """
+    urls = get_chart_urls()
+
+    count = sum(prerender_chart(url, datasets=datasets, logger=logger) for url in urls)
+
+    RenderedChart.objects.exclude(url__in=urls).delete()
+    logger.info(f"Rendered {count} of {len(urls)} charts.")
+
+    return count
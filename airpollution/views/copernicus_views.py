@@ -11,8 +11,11 @@ from PIL import Image
 from django.shortcuts import render
 
 from airpollution.models import SatelliteImageFiles
+from airpollution.models.models_datasets import DATASET_COPERNICUS
+from airpollution.views.api_cache import conditional_api
 
 
+@conditional_api(DATASET_COPERNICUS)
 def get_sat_image(request, pollutant: str, year: int, month: int, day: int, category: str = 'ANALYSIS', hour: int = 12,
                   level: int = 0):
     """
@@ -1,16 +1,62 @@
 import json
 import geopandas as gpd
-import shapely.wkt
 from bokeh.embed import json_item
 from bokeh.models import GeoJSONDataSource, LinearColorMapper, Panel, Tabs, BasicTicker, ContinuousTicker, PrintfTickFormatter, FixedTicker, NumeralTickFormatter, ColorBar, HoverTool, WheelZoomTool, ResetTool, PanTool
 from bokeh.palettes import RdYlGn11
 from bokeh.plotting import figure
 from django.http import JsonResponse
-from shapely.geometry import Polygon
+from shapely.geometry import box
 
-from airpollution.views.aq_api_v1 import get_daily_data, get_region_boundaries_data
+from airpollution.models import NutsRegionsSimplified, EU_ISOCODES, get_simplify_tolerance
+from airpollution.views.aq_api_v1 import get_daily_df, flatten_daily_data
+from airpollution.models.models_datasets import DATASET_OBSERVATIONS, DATASET_NUTS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
+from airpollution.json_encoding import to_geojson
 
+# window of the daily map - (minlon, minlat, maxlon, maxlat)
+DAILY_MAP_BOUNDS = (-25, 35, 33, 70)
 
+# rendered size of the map in pixels when the request does not provide a valid size
+DEFAULT_MAP_SIZE = 600
+
+
+def _get_map_size(request, name: str) -> int:
+    """
+    Returns the width or height of the rendered map.  Values that are not integers fall back to DEFAULT_MAP_SIZE.
+    """
+    try:
+        return int(request.GET.get(name, DEFAULT_MAP_SIZE))
+    except ValueError:
+        return DEFAULT_MAP_SIZE
+
+
+def _get_boundaries_df(nuts_level, countries, tolerance: float) -> gpd.GeoDataFrame:
+    """
+    Returns the boundaries of the NUTS regions to be mapped.
+    Boundaries are simplified and clipped to the EU bounds by load_nuts_data.  The simplified boundaries
+    are clipped to the window of the daily map.
+    :param nuts_level: The nuts level of the regions
+    :param countries: The country codes of the regions (eg: de, nl, fr).  If None, all EU countries are returned.
+    :param tolerance: The simplification tolerance of the boundaries
+    :return: GeoPandas dataframe with the nuts_id, name, country and geometry of each region
+    """
+    if type(countries) == str:
+        countries = countries.replace(' ', '').split(',')
+    if countries is None:
+        countries = EU_ISOCODES
+
+    df = NutsRegionsSimplified.get_geoframe(nuts_level=int(nuts_level), tolerance=tolerance, country_codes=countries)
+    df = df.rename(columns={'NUTS_ID': 'nuts_id', 'NUTS_NAME': 'name', 'CNTR_CODE': 'country'})
+    df['nuts_id'] = df['nuts_id'].str.upper()
+    df['country'] = df['country'].str.upper()
+
+    if len(df) > 0:
+        df = gpd.clip(df, box(*DAILY_MAP_BOUNDS))
+
+    return df[['nuts_id', 'name', 'country', 'geometry']]
+
+
+@prerendered_chart(DATASET_OBSERVATIONS, DATASET_POLLUTANTS, DATASET_NUTS)
 def draw_map(request):
     """
     Returns a rendered map with a script and div object.
@@ -27,13 +73,16 @@ def draw_map(request):
     start_date = request.GET.get('start_date', None)
     end_date = request.GET.get('end_date', None)
 
+    # pick the boundary resolution for the rendered size of the map
+    tolerance = get_simplify_tolerance(width=_get_map_size(request, 'width'), height=_get_map_size(request, 'height'))
+
     if start_date is None:
         return JsonResponse("'start_date' is a required parameter.", safe=False)
 
     if end_date is None:
         end_date = start_date
 
-    daily_levels = get_daily_data(countries=countries, pollutants=None, start_date=start_date, end_date=end_date)
+    daily_df = get_daily_df(countries=countries, pollutants=None, start_date=start_date, end_date=end_date)
 
     # Uncomment this to use dummy data for testing
     """
@@ -41,49 +90,14 @@ def draw_map(request):
     from eugreendeal.settings import MEDIA_ROOT
     json_dir = os.path.join(MEDIA_ROOT, "media", "mock_api_payloads")
     with open(json_dir + "/daily.json") as f:
-        daily_levels = json.load(f)
+        daily_df = flatten_daily_data(json.load(f))
     """
 
-    daily_df = gpd.GeoDataFrame()
-
-    for region_key, region_value in daily_levels.items():
-        for date_key, date_value in region_value.items():
-            for pollutant_key, pollutant_value in date_value.items():
-
-                if pollutant_value is None:
-                    continue
-
-                day = pollutant_value.get("day-avg-level", 0)
-                if day is None:
-                    day = 0
-
-                dictionary = {
-                    "nuts_id": region_key.upper(),
-                    "date": date_key,
-                    "pollutant": pollutant_key.upper(),
-                    "pollutant_level": round(day, 2)
-                }
-
-                daily_df = daily_df.append(dictionary, ignore_index=True)
-
     if len(daily_df) > 0:
         # Aggregate daily pollutant data over date range
-        daily_df = daily_df.groupby(["nuts_id", 'pollutant']).mean().reset_index()
-
-        nuts_boundaries = get_region_boundaries_data(level=nuts_level, regions=countries)
-        df = gpd.GeoDataFrame()
-
-        level = nuts_boundaries.get(str(nuts_level))
-        for key, record in level.items():
-            dictionary = {
-                "nuts_id": key.upper(),
-                "name": record["name"],
-                "country": record["country_code"].upper(),
-                "geometry": gpd.GeoSeries(shapely.wkt.loads(record["geography"]))}
-
-            df = df.append(gpd.GeoDataFrame(dictionary), ignore_index=True)
+        daily_df = daily_df.groupby(["nuts_id", 'pollutant'])[['pollutant_level']].mean().reset_index()
 
-        df.crs = 4326
+        df = _get_boundaries_df(nuts_level, countries, tolerance)
 
         # Merge NUTS data frame with daily pollutant level dataframe
         df = df.merge(daily_df)
@@ -91,9 +105,6 @@ def draw_map(request):
         #Reverse the list order of the spectrum since all the online tools put them in the oppposite order to what we want
         colors = ["#a50026", "#d3322b", "#f16d43", "#fcab63", "#fedc8c", "#f9f7ae", "#d7ee8e", "#a4d86f", "#64bc61"][::-1] 
 
-        # Define the bounds of the EU's main territories (excluding far off islands)
-        eu_bounds = Polygon([(-25, 35), (33, 35), (33, 70), (-25, 70), (-25, 35)])
-
         # Unique pollutants in df
         unique_pollutants = df.pollutant.unique()
 
@@ -126,9 +137,6 @@ def draw_map(request):
                     ("Avg " + pollutant + " level", "@pollutant_level{0.0}")
                 ]
             ), WheelZoomTool(), PanTool(), ResetTool()]
-        
-            # Clip the polygons to the EU bounds
-            filtered_df = gpd.clip(filtered_df, eu_bounds)
 
             bokeh_figure = figure(title="Air quality by region",
                                 sizing_mode='scale_both',
@@ -143,7 +151,7 @@ def draw_map(request):
             bokeh_figure.xgrid.grid_line_color = None
             bokeh_figure.ygrid.grid_line_color = None
 
-            geo_json_data_source = GeoJSONDataSource(geojson=json.dumps(filtered_df.__geo_interface__))
+            geo_json_data_source = GeoJSONDataSource(geojson=to_geojson(filtered_df))
             # don't use a line color. the map consists of numerous patches, so you will only see the line color
             bokeh_figure.patches(xs="xs", ys="ys",
                                 source=geo_json_data_source,
@@ -169,30 +177,11 @@ def draw_map(request):
         return JsonResponse(item)
 
     else:
-        nuts_boundaries = get_region_boundaries_data(level=nuts_level, regions=countries)
-        df = gpd.GeoDataFrame()
-
-        level = nuts_boundaries.get(str(nuts_level))
-        for key, record in level.items():
-            dictionary = {
-                "nuts_id": key.upper(),
-                "name": record["name"],
-                "country": record["country_code"].upper(),
-                "geometry": gpd.GeoSeries(shapely.wkt.loads(record["geography"]))}
-
-            df = df.append(gpd.GeoDataFrame(dictionary), ignore_index=True)
-
-        df.crs = 4326
+        df = _get_boundaries_df(nuts_level, countries, tolerance)
         
         #Filter down to a pretty set of countries as background
         blank_countries = ["NL", "BE", "LU", "FR", "DE"]
-        df = df[df.nuts_id.isin(blank_countries)]
-        
-        # Define the bounds of the EU's main territories (excluding far off islands)
-        eu_bounds = Polygon([(-25, 35), (33, 35), (33, 70), (-25, 70), (-25, 35)])
-    
-        # Clip the polygons to the EU bounds
-        filtered_df = gpd.clip(df, eu_bounds)
+        filtered_df = df[df.nuts_id.isin(blank_countries)]
 
         bokeh_figure = figure(title="No air quality data for the selected dates",
                             sizing_mode='scale_both',
@@ -206,7 +195,7 @@ def draw_map(request):
         bokeh_figure.xgrid.grid_line_color = None
         bokeh_figure.ygrid.grid_line_color = None
 
-        geo_json_data_source = GeoJSONDataSource(geojson=json.dumps(filtered_df.__geo_interface__))
+        geo_json_data_source = GeoJSONDataSource(geojson=to_geojson(filtered_df))
         # don't use a line color. the map consists of numerous patches, so you will only see the line color
         bokeh_figure.patches(xs="xs", ys="ys",
                             source=geo_json_data_source,
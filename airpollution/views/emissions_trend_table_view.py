@@ -3,8 +3,11 @@ from bokeh.models import ColumnDataSource
 from bokeh.models.widgets import DataTable, TableColumn, HTMLTemplateFormatter
 
 from airpollution.models import *
+from airpollution.models.models_datasets import DATASET_EMISSIONS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
 
 
+@prerendered_chart(DATASET_EMISSIONS, DATASET_POLLUTANTS)
 def draw_plot(request) -> JsonResponse:
     """
     Draws a table with emissions by year by country for most recent 5 years available.
@@ -16,29 +19,14 @@ def draw_plot(request) -> JsonResponse:
     # get Target pollutants
     pollutants = [x.get('pollutant_id') for x in Target.objects.filter(measurement='calendar_year').values('pollutant_id')]
 
-    # get the EEA pollutant names for selected pollutants
-    eea_lookup = {k: v.key for k, v in Pollutant.get_eea_pollutants().items() if v.key in pollutants}
-    eea_pollutants = list(eea_lookup.keys())
+    # get national totals of countries for selected pollutants - pollutants in the cube are application keys
+    rs = EmissionsCube.objects.filter(country__in=EU_ISOCODES, is_national_total=True,
+                                      pollutant__in=pollutants).values_list('country', 'pollutant', 'year', 'emissions')
 
-    # get data for countries for selected pollutats
-    rs = EEADataModel.objects.filter(country__in=EU_ISOCODES, sector='NATIONAL_TOTAL', sector_group='NATIONAL_TOTAL', pollutant_name__in=eea_pollutants).values()
-
-    rs_df = pd.DataFrame(rs)
-
-    # drop unneeded columns
-    rs_df = rs_df[['year', 'pollutant_name', 'country', 'emissions']]
-
-    # rename pollutant to application key values
-    rs_df['pollutant_name'] = rs_df.apply(lambda s: eea_lookup.get(s.pollutant_name), axis=1)
-
-    # rename columns
-    rs_df.rename(columns={'pollutant_name':'pollutant', 'emissions':'value'}, inplace=True)
+    rs_df = pd.DataFrame.from_records(rs, columns=['country', 'pollutant', 'year', 'value'])
 
     # turn years into strings
-    rs_df['year'] = rs_df.apply(lambda s: str(s.year), axis=1)
-
-    # format
-    rs_df['value'] = rs_df['value'].astype(float)
+    rs_df['year'] = rs_df.year.astype(str)
 
     # create formatted pivot table for bokeh
     rs_df_pivot = rs_df.pivot_table(index=['country', 'pollutant'], columns=['year'], values='value')
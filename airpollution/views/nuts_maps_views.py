@@ -1,10 +1,8 @@
-import json
 import logging
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
-import shapely.wkt
 from bokeh.embed import components, json_item
 from bokeh.models import GeoJSONDataSource, CategoricalColorMapper, Panel, Tabs, LinearColorMapper, \
     NumeralTickFormatter, ColorBar, FixedTicker, Label
@@ -13,68 +11,36 @@ from bokeh.palettes import RdYlGn11
 from bokeh.plotting import figure
 from django.http import JsonResponse
 from django.shortcuts import render
-from shapely.geometry import Polygon
 
-from airpollution.models import NutsRegions
+from airpollution.models import NutsRegions, NutsRegionsSimplified, EU_BOUNDS, SIMPLIFY_TOLERANCES, \
+    CURRENT_NUTS_VERSION, get_eu_bounds_polygon, get_simplify_tolerance
 from airpollution.views.aq_api_v1 import get_target_bubblemap_data
+from airpollution.nuts_geojson_cache import get_geojson
+from airpollution.models.models_datasets import DATASET_OBSERVATIONS, DATASET_STATIONS, DATASET_NUTS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
+from airpollution.json_encoding import to_geojson
 
 
 class MapData:
     def __init__(self, crs: int = 4326):
         self.crs = crs
-        self.df = None
-        minx = -24.95
-        miny = 30.05
-        maxx = 44.95
-        maxy = 71.95
-        self.eu_bounds = Polygon([(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)])
+        self.dfs = {}
+        self.regions = None
+        minx, miny, maxx, maxy = EU_BOUNDS
+        self.eu_bounds = get_eu_bounds_polygon()
         self.aspect_ratio = ((maxx-minx)/(maxy-miny))*.8
 
-    def _get_geoframe(self) -> gpd.GeoDataFrame:
+    def _get_geoframe(self, tolerance: float = SIMPLIFY_TOLERANCES[0]) -> gpd.GeoDataFrame:
         """
         Return GeoDataFrame object based on crs.
+        The simplified boundaries are already clipped to the EU bounds by load_nuts_data.
+        :param tolerance: One of SIMPLIFY_TOLERANCES
         :return: GeoPandas GeoDataFrame
         """
-        if self.df is None:
-            df = gpd.GeoDataFrame()
+        if self.dfs.get(tolerance) is None:
+            self.dfs[tolerance] = NutsRegionsSimplified.get_geoframe(tolerance=tolerance, crs=self.crs)
 
-            qs = NutsRegions.objects.all()
-
-            for record in qs:
-                d = {'key': record.key,
-                     'year': record.year,
-                     'id': record.id,
-                     'LEVL_CODE': record.LEVL_CODE,
-                     'NUTS_ID': record.NUTS_ID,
-                     'CNTR_CODE': record.CNTR_CODE,
-                     'NUTS_NAME': record.NUTS_NAME,
-                     'FID': record.FID,
-                     # adding buffer(0) will correct any self-overlapping objects
-                     'geometry': gpd.GeoSeries(shapely.wkt.loads(record.geometry).buffer(0))}
-
-                df = df.append(gpd.GeoDataFrame(d), ignore_index=True)
-
-            df.crs = self.crs  # set the projection
-
-            df = self._crop_map(df)
-            self.df = df
-
-        return self.df
-
-    # @staticmethod
-    def _crop_map(self, df, minx=-24.95, miny=30.05, maxx=44.95, maxy=71.95) -> pd.DataFrame:
-        """
-        Will crop a geopandas dataframe to the area defined by the x and y boundaries provided.
-        :param df:
-        :param minx: Minimum longitude
-        :param miny: Minimum latitude
-        :param maxx: Maximum longitude
-        :param maxy: Maximum latitude
-        :return: A cropped Geopandas dataframe
-        """
-        # eu_bounds = Polygon([(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)])
-
-        return gpd.clip(df, self.eu_bounds)
+        return self.dfs[tolerance]
 
     @staticmethod
     def get_geosource(df: gpd.GeoDataFrame) -> GeoJSONDataSource:
@@ -83,7 +49,19 @@ class MapData:
         :param df: dataframe to convert to geo source
         :return: GeoJSONDataSource
         """
-        return GeoJSONDataSource(geojson=json.dumps(df.__geo_interface__))
+        return GeoJSONDataSource(geojson=to_geojson(df))
+
+    @staticmethod
+    def get_cached_geosource(nuts_level: int, tolerance: float = SIMPLIFY_TOLERANCES[0],
+                             exclude_countries: list = None) -> GeoJSONDataSource:
+        """
+        Define Bokeh datasource from the precomputed GeoJSON of a nuts level.
+        :param nuts_level: The nuts level of the regions
+        :param tolerance: One of SIMPLIFY_TOLERANCES
+        :param exclude_countries: Optional. Country codes to exclude from the map.
+        :return: GeoJSONDataSource
+        """
+        return GeoJSONDataSource(geojson=get_geojson(nuts_level, tolerance, exclude_countries))
 
     @staticmethod
     def get_bokeh_tools() -> list:
@@ -108,10 +86,11 @@ class MapData:
         Return a Categorial color mapper that will map a color to specified nuts region level.
         :return: Categorical color mapper
         """
-        df = self._get_geoframe()
-
         # get unique areas base on the region type selected
-        regions = np.unique(df['NUTS_ID'])
+        if self.regions is None:
+            self.regions = np.unique(list(NutsRegions.objects.filter(year=CURRENT_NUTS_VERSION)
+                                          .values_list('NUTS_ID', flat=True)))
+        regions = self.regions
 
         # assign color to each area (https://colorbrewer2.org/)
         colors = ['#b2182b', '#d6604d', '#f4a582', '#fddbc7', '#f7f7f7', '#d1e5f0', '#92c5de', '#4393c3', '#2166ac']
@@ -148,9 +127,9 @@ class MapData:
 
         return p
 
-    def get_map_df(self, nuts_level: int) -> gpd.GeoDataFrame:
+    def get_map_df(self, nuts_level: int, tolerance: float = SIMPLIFY_TOLERANCES[0]) -> gpd.GeoDataFrame:
 
-        df = self._get_geoframe()
+        df = self._get_geoframe(tolerance)
 
         rv = df[df['LEVL_CODE'] == nuts_level]
 
@@ -160,11 +139,11 @@ class MapData:
 
     def get_maps_script_and_div(self, nuts_level: int = 0, height: int = 600, width: int = 600, include_tools=True):
 
-        # restrict df to nuts region
-        df = self.get_map_df(nuts_level)
+        # pick the boundary resolution for the rendered size
+        tolerance = get_simplify_tolerance(width=width, height=height)
 
         # make geosource based on new level
-        geo_source = self.get_geosource(df)
+        geo_source = self.get_cached_geosource(nuts_level, tolerance)
 
         # get a color mapper
         color_mapper = self.get_color_mapper()
@@ -203,16 +182,11 @@ def get_nuts_map(nuts_level, height: int = 600, width: int = 600, outline_map=Fa
     :return: Returns a rendered map with a script and div object.
     """
 
-    # restrict df to nuts region
-    df = _md.get_map_df(nuts_level)
+    # pick the boundary resolution for the rendered size
+    tolerance = get_simplify_tolerance(width=width, height=height)
 
-    # filter out countries
-    if exclude_countries is None:
-        exclude_countries = []
-    df = df[~df.CNTR_CODE.isin(exclude_countries)]
-
-    # make geosource based on new level
-    geo_source = _md.get_geosource(df)
+    # make geosource based on new level - boundaries are serialized once and cached
+    geo_source = _md.get_cached_geosource(nuts_level, tolerance, exclude_countries)
 
     # get a color mapper
     if outline_map:
@@ -248,10 +222,15 @@ def get_nuts_map_view(request, nuts_level, height: int = 600, width: int = 600):
     return render(request, 'airpollution/test-maps.html')
 
 
+@prerendered_chart(DATASET_NUTS)
 def get_nuts_map_data(request):
-    p0 = get_nuts_map(0)
-    p1 = get_nuts_map(1)
-    p2 = get_nuts_map(2)
+    # rendered size of the map - used to pick the boundary resolution
+    height = int(request.GET.get('height', 600))
+    width = int(request.GET.get('width', 600))
+
+    p0 = get_nuts_map(0, height=height, width=width)
+    p1 = get_nuts_map(1, height=height, width=width)
+    p2 = get_nuts_map(2, height=height, width=width)
     tab0 = Panel(child=p0, title="NUTS1")
     tab1 = Panel(child=p1, title="NUTS2")
     tab2 = Panel(child=p2, title="NUTS3")
@@ -264,11 +243,15 @@ def get_nuts_map_data(request):
     return response
 
 
-def draw_bubble_map(request, start_date: str = None, end_date: str = None, pollutants: list = None):
+@prerendered_chart(DATASET_OBSERVATIONS, DATASET_STATIONS, DATASET_POLLUTANTS, DATASET_NUTS)
+def draw_bubble_map(request, start_date: str = None, end_date: str = None, pollutants: list = None,
+                    height: int = 600, width: int = 600):
     if request is not None:
         pollutants = request.GET.get('pollutants', ['PM25', 'PM10', 'NO2'])
         start_date = request.GET.get('start_date', None)
         end_date = request.GET.get('end_date', None)
+        height = int(request.GET.get('height', height))
+        width = int(request.GET.get('width', width))
 
         if start_date is None:
             return JsonResponse("'start_date' is a required parameter.", safe=False)
@@ -281,7 +264,8 @@ def draw_bubble_map(request, start_date: str = None, end_date: str = None, pollu
     # create bokeh elements
     _tabs = []
     for k, v in bubble_data.items():
-        p = get_nuts_map(0, outline_map=True, include_tools=False, exclude_countries=['TR'])
+        p = get_nuts_map(0, height=height, width=width, outline_map=True, include_tools=False,
+                         exclude_countries=['TR'])
 
         p.name = k
         # add annotation
@@ -1,4 +1,3 @@
-import json
 import math
 
 import pandas as pd
@@ -7,9 +6,12 @@ from bokeh.models import ColumnDataSource, HTMLTemplateFormatter, TableColumn, D
 from django.http import JsonResponse
 
 from airpollution.models import Target, Pollutant, EU_ISOCODES, ObservationStationReading
-from airpollution.views.aq_api_v1 import annual
+from airpollution.views.aq_api_v1 import get_annual_df
+from airpollution.models.models_datasets import DATASET_OBSERVATIONS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
 
 
+@prerendered_chart(DATASET_OBSERVATIONS, DATASET_POLLUTANTS)
 def draw_plot(request, years: list = None, countries: list = None, pollutants: list = None, verbosity: int = 0):
     """
     Returns a rendered map with a script and div object.
@@ -27,8 +29,8 @@ def draw_plot(request, years: list = None, countries: list = None, pollutants: l
         verbosity = request.GET.get('verbosity', 0)
 
     # get Target pollutants
-    t_pollutants = [x.get('pollutant_id') for x in
-                    Target.objects.filter(measurement='calendar_year').values('pollutant_id')]
+    targets_df = Target.get_targets_table()
+    t_pollutants = targets_df[targets_df.measurement_id == 'calendar_year'].pollutant_id.tolist()
 
     # get the Observation station readings pollutant names for selected target-relevant pollutants
     if pollutants is None:
@@ -49,17 +51,12 @@ def draw_plot(request, years: list = None, countries: list = None, pollutants: l
             years.append(list(item.values())[0])
     years.sort()
 
-    # get data for countries for selected pollutants
-    annual_dict = annual(request, years=years, countries=countries, pollutants=pollutants, verbosity=verbosity)
-    annual_dict = json.loads(annual_dict.content.decode())
-
-    # create a dataframe of actual pollutant averages per year, country and pollutant
-    annual_df = pd.DataFrame()
-    for c, years_dict in annual_dict.items():
-        xdf = pd.DataFrame(years_dict).reset_index().rename(columns={'index': 'pollutant'})
-        xdf.insert(0, 'country', c)
-        annual_df = annual_df.append(xdf)
-    annual_df = annual_df.reset_index(drop=True)
+    # create a dataframe of actual pollutant averages per country and pollutant with a column per year
+    annual_df = get_annual_df(years=years, countries=countries, pollutants=pollutants, verbosity=verbosity)
+    annual_df['year'] = annual_df['year'].astype(str)
+    annual_df = annual_df.pivot_table(index=['country_code', 'pollutant'], columns='year', values='value') \
+        .reindex(columns=[str(y) for y in years]).reset_index().rename(columns={'country_code': 'country'})
+    annual_df.columns.name = None
 
     # get targets
     t_df = Pollutant.get_targets_df(years=[years[-1]], pollutants=pollutants)
@@ -4,9 +4,12 @@ from bokeh.models import ColumnDataSource
 from bokeh.models.widgets import DataTable, TableColumn, HTMLTemplateFormatter
 from django.http import JsonResponse
 
-from airpollution.views.aq_api_v1 import get_daily_data
+from airpollution.views.aq_api_v1 import get_daily_df, DAILY_COLUMNS
+from airpollution.models.models_datasets import DATASET_OBSERVATIONS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
 
 
+@prerendered_chart(DATASET_OBSERVATIONS, DATASET_POLLUTANTS)
 def draw_plot(request):
     """
     Returns a rendered map with a script and div object.
@@ -26,41 +29,15 @@ def draw_plot(request):
     #Get daily pollution levels fom the air quality API
     #This data can also be requested using via REST requests (eg http://localhost:8000/aq_api/daily?nuts_level=0&countries=BU&start-date=2020-03-01&end-date=2020-03-31)
     try:
-        daily_levels = get_daily_data(countries, pollutant, start_date, end_date)
+        daily_df = get_daily_df(countries, pollutant, start_date, end_date)
     except:
         print("Malformed request to the air quality API")
-
-
-    #Create blank dataframe to be filled with JSON response values
-    daily_df = pd.DataFrame()
-
-    for region_key, region_value in daily_levels.items():
-        for date_key, date_value in region_value.items():
-            for pollutant_key, pollutant_value in date_value.items():
-                if pollutant_value is None:
-                    continue
-
-                day = pollutant_value.get("day-avg-level", 0)
-                yoy = pollutant_value.get("prior-day_avg_level", 0)
-                if day is None:
-                    day = 0
-                if yoy is None:
-                    yoy = 0
-
-                dictionary = {
-                    "nuts_id": region_key.upper(),
-                    "date": date_key,
-                    "pollutant": pollutant_key.upper(),
-                    "pollutant_level": round(day, 2),
-                    "yoy_level": round(yoy, 2)
-                }
-
-                daily_df = daily_df.append(dictionary, ignore_index=True)
+        daily_df = pd.DataFrame(columns=DAILY_COLUMNS)
                 
     if len(daily_df) > 0:
 
         # Aggregate daily pollutant data over date range
-        table_df = daily_df.groupby(["pollutant"]).mean().reset_index()
+        table_df = daily_df.groupby(["pollutant"])[["pollutant_level", "yoy_level"]].mean().reset_index()
         
         # Calculate year-over-year data and display it as a percentage
         table_df['yoy_change'] = 100 * ((table_df["pollutant_level"] / table_df["yoy_level"]) - 1)
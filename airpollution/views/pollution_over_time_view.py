@@ -5,9 +5,12 @@ from bokeh.plotting import figure
 from django.http import JsonResponse
 from pygam import LinearGAM, s
 
-from airpollution.views.aq_api_v1 import get_daily_data
+from airpollution.views.aq_api_v1 import get_daily_df
 from airpollution.views.aq_api_v1 import get_target_data
+from airpollution.models.models_datasets import DATASET_OBSERVATIONS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
 
+@prerendered_chart(DATASET_OBSERVATIONS, DATASET_POLLUTANTS)
 def draw_plot(request):
     """
     Returns a rendered map with a script and div object.
@@ -61,61 +64,30 @@ def draw_plot(request):
     #get target levels for the pollutant
     pollutant_targets = get_target_data(end_date[:-6], countries, pollutant)
 
-    #Create blank dataframe to be filled with JSON response values
-    targets_df = pd.DataFrame()
-
-    for region_key, region_value in pollutant_targets.items():
-        for year_key, year_value in region_value.items():
-            for pollutant_key, pollutant_value in year_value.items():
-                year_targets = pollutant_value.get("calendar_year", None)
-                if year_targets is not None:
-                    dictionary = {
-                        "nuts_id": region_key.upper(),
-                        "target": round(year_targets.get("value", 0), 2)
-                    }
-
-                    targets_df = targets_df.append(dictionary, ignore_index=True)
+    # flatten the targets into a dataframe
+    targets_df = pd.DataFrame([(region_key.upper(), round(pollutant_value["calendar_year"].get("value", 0), 2))
+                               for region_key, region_value in pollutant_targets.items()
+                               for year_key, year_value in region_value.items()
+                               for pollutant_key, pollutant_value in year_value.items()
+                               if pollutant_value.get("calendar_year", None) is not None],
+                              columns=["nuts_id", "target"])
 
     #Get daily pollution levels fom the air quality API
     #This data can also be requested using via REST requests: (eg http://localhost:8000/aq_api/daily?nuts_level=0&countries=BU&start-date=2020-03-01&end-date=2020-03-31)
     try:
-        daily_levels = get_daily_data(countries, pollutant, start_date, end_date)
+        daily_df = get_daily_df(countries, pollutant, start_date, end_date)
         daily_api_sucess = True
 
-        #If there are no nested items within the JSON payload, set it to false
-        if (sum(map(len, daily_levels.values())) == 0):
+        #If the API returned no rows, set it to false
+        if len(daily_df) == 0:
             daily_api_sucess = False
             print("ERROR: No data available for specified pollutant")
     except:
         daily_api_sucess = False
         print("ERROR: The Air Quality API request failed")
 
-    #Create blank dataframe to be filled with JSON response values
-    daily_df = pd.DataFrame()
-
     if daily_api_sucess:
 
-        for region_key, region_value in daily_levels.items():
-            for date_key, date_value in region_value.items():
-                for pollutant_key, pollutant_value in date_value.items():
-
-                    dal = pollutant_value.get("day-avg-level", 0)
-                    yoy = pollutant_value.get("prior-day_avg_level", 0)
-                    if dal is None:
-                        dal = 0
-                    if yoy is None:
-                        yoy = 0
-
-                    dictionary = {
-                        "nuts_id": region_key.upper(),
-                        "date": date_key,
-                        "pollutant": pollutant_key.upper(),
-                        "pollutant_level": round(dal, 2),
-                        "yoy_level": round(yoy, 2)
-                    }
-
-                    daily_df = daily_df.append(dictionary, ignore_index=True)
-
         if len(targets_df) > 0:
             daily_df = daily_df.merge(targets_df)
 
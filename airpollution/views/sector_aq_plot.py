@@ -9,8 +9,11 @@ from bokeh.models import Legend
 from bokeh.palettes import Spectral9, Spectral6
 from bokeh.plotting import figure
 from django.http import JsonResponse
-from airpollution.models import EEADataModel
+from airpollution.models import EmissionsCube
+from airpollution.models.models_datasets import DATASET_EMISSIONS, DATASET_POLLUTANTS
+from airpollution.views.api_cache import prerendered_chart
 
+@prerendered_chart(DATASET_EMISSIONS, DATASET_POLLUTANTS)
 def draw_plot(request):
     """
     Returns a rendered map with a script and div object.
@@ -32,96 +35,30 @@ def draw_plot(request):
     data = {}
     data['pollutants'] = pollutants
 
-    total_pm25 = 0
-    total_pm10 = 0
-    total_nox = 0
-    total_co = 0
-    total_sox = 0
-    total_nh3 = 0
-
     # Creating figure
     p = figure(x_range=pollutants, plot_height=500, plot_width=1200, sizing_mode='stretch_width',
                toolbar_location=None, tools="hover", tooltips="$name @pollutants: @$name")
 
     try:
-        response_pm25 = EEADataModel.get_sectors_info(year=year, country_code=country, pollutant='PM2.5')
-        response_pm10 = EEADataModel.get_sectors_info(year=year, country_code=country, pollutant='PM10')
-        response_nox = EEADataModel.get_sectors_info(year=year, country_code=country, pollutant='NOx')
-        response_co = EEADataModel.get_sectors_info(year=year, country_code=country, pollutant='CO')
-        response_sox = EEADataModel.get_sectors_info(year=year, country_code=country, pollutant='SOx')
-        response_nh3 = EEADataModel.get_sectors_info(year=year, country_code=country, pollutant='NH3')
-        sector_api_sucess = True
-
-        if not response_pm25:
-            sector_api_sucess = False
+        df = EmissionsCube.get_df(years=[year], country_codes=[country], pollutants=pollutants)
+        totals = df[df.is_national_total].groupby('pollutant_name').total_emissions.sum()
+        # sector_group x pollutant
+        df = df[~df.is_national_total].groupby(['sector_group', 'pollutant_name']).total_emissions.sum().unstack()
+        sector_api_sucess = len(totals) > 0
     except:
         sector_api_sucess = False
 
     if sector_api_sucess:
+        df = df.reindex(columns=pollutants)
+        totals = totals.reindex(pollutants)
+
+        # percentage of the national total of each sector - 'Other' is the remainder
+        pct = df.reindex([s for s in sectors if s != 'Other']).fillna(0) * 100 / totals
+        pct = pct.fillna(0)
+        pct.loc['Other'] = 100 - pct.sum()
+
         for sector in sectors:
-            list = []
-
-            if sector is 'Other':
-                list.append(100 - total_pm25)
-            else:
-                total = response_pm25[country][year]['PM2.5']['NATIONAL_TOTAL']
-                emission = 0
-                if sector in response_pm25[country][year]['PM2.5']:
-                    emission = response_pm25[country][year]['PM2.5'][sector] * 100 / total
-                total_pm25 += emission
-                list.append(emission)
-
-            if sector is 'Other':
-                list.append(100 - total_pm10)
-            else:
-                total = response_pm10[country][year]['PM10']['NATIONAL_TOTAL']
-                emission = 0
-                if sector in response_pm10[country][year]['PM10']:
-                    emission = response_pm10[country][year]['PM10'][sector] * 100 / total
-                total_pm10 += emission
-                list.append(emission)
-
-            if sector is 'Other':
-                list.append(100 - total_nox)
-            else:
-                total = response_nox[country][year]['NOx']['NATIONAL_TOTAL']
-                emission = 0
-                if sector in response_nox[country][year]['NOx']:
-                    emission = response_nox[country][year]['NOx'][sector] * 100 / total
-                total_nox += emission
-                list.append(emission)
-
-            if sector is 'Other':
-                list.append(100 - total_co)
-            else:
-                emission = 0
-                total = response_co[country][year]['CO']['NATIONAL_TOTAL']
-                if sector in response_co[country][year]['CO']:
-                    emission = response_co[country][year]['CO'][sector] * 100 / total
-                total_co += emission
-                list.append(emission)
-
-            if sector is 'Other':
-                list.append(100 - total_sox)
-            else:
-                emission = 0
-                total = response_sox[country][year]['SOx']['NATIONAL_TOTAL']
-                if sector in response_sox[country][year]['SOx']:
-                    emission = response_sox[country][year]['SOx'][sector] * 100 / total
-                total_sox += emission
-                list.append(emission)
-
-            if sector is 'Other':
-                list.append(100 - total_nh3)
-            else:
-                total = response_nh3[country][year]['NH3']['NATIONAL_TOTAL']
-                emission = 0
-                if sector in response_nh3[country][year]['NH3']:
-                    emission = response_nh3[country][year]['NH3'][sector] * 100 / total
-                total_nh3 += emission
-                list.append(emission)
-
-            data[sector] = list
+            data[sector] = pct.loc[sector].tolist()
 
         v = p.vbar_stack(sectors, x='pollutants', width=0.5, color=colors, source=data)
 
@@ -152,6 +89,7 @@ def draw_plot(request):
     return JsonResponse(item)
 
 
+@prerendered_chart(DATASET_EMISSIONS, DATASET_POLLUTANTS)
 def draw_yearly_emission_plot(request):
     """
     Returns a rendered yearly emissions plot with a script and div object.
@@ -165,33 +103,12 @@ def draw_yearly_emission_plot(request):
 
     pollutants = ['PM2.5', 'PM10', 'NOx', 'CO', 'SOx', 'NH3']
 
-    list_pm25 = []
-    list_pm10 = []
-    list_nox = []
-    list_co = []
-    list_sox = []
-    list_nh3 = []
-
-    years = []
-
     # Getting data from model
     try:
-        response_pm25 = EEADataModel.get_sectors_info(year="", country_code=country, pollutant='PM2.5',
-                                                      sector_group='NATIONAL_TOTAL')
-        response_pm10 = EEADataModel.get_sectors_info(year="", country_code=country, pollutant='PM10',
-                                                      sector_group='NATIONAL_TOTAL')
-        response_nox = EEADataModel.get_sectors_info(year="", country_code=country, pollutant='NOx',
-                                                     sector_group='NATIONAL_TOTAL')
-        response_co = EEADataModel.get_sectors_info(year="", country_code=country, pollutant='CO',
-                                                    sector_group='NATIONAL_TOTAL')
-        response_sox = EEADataModel.get_sectors_info(year="", country_code=country, pollutant='SOx',
-                                                     sector_group='NATIONAL_TOTAL')
-        response_nh3 = EEADataModel.get_sectors_info(year="", country_code=country, pollutant='NH3',
-                                                     sector_group='NATIONAL_TOTAL')
-        sector_api_sucess = True
-
-        if not response_pm25:
-            sector_api_sucess = False
+        df = EmissionsCube.get_df(country_codes=[country], pollutants=pollutants, national_total=True)
+        # year x pollutant
+        df = df.groupby(['year', 'pollutant_name']).total_emissions.sum().unstack()
+        sector_api_sucess = len(df) > 0
     except:
         sector_api_sucess = False
 
@@ -208,19 +125,13 @@ def draw_yearly_emission_plot(request):
     p.yaxis.minor_tick_line_color = None  # turn off y-axis minor ticks
 
     if sector_api_sucess:
-        for year in range(1990, 2017):
-            years.append(year)
-            list_pm25.append(response_pm25[country][year]['PM2.5']['NATIONAL_TOTAL'])
-            list_pm10.append(response_pm10[country][year]['PM10']['NATIONAL_TOTAL'])
-            list_nox.append(response_nox[country][year]['NOx']['NATIONAL_TOTAL'])
-            list_co.append(response_co[country][year]['CO']['NATIONAL_TOTAL'])
-            list_sox.append(response_sox[country][year]['SOx']['NATIONAL_TOTAL'])
-            list_nh3.append(response_nh3[country][year]['NH3']['NATIONAL_TOTAL'])
+        years = list(range(1990, 2017))
+        df = df.reindex(index=years, columns=pollutants)
 
         colors = Spectral6
         source = ColumnDataSource(data=dict(
-            xs=[years, years, years, years, years, years],
-            ys=[list_pm25, list_pm10, list_nox, list_co, list_sox, list_nh3],
+            xs=[years] * len(pollutants),
+            ys=[df[pollutant].tolist() for pollutant in pollutants],
             colors=colors,
             legends=pollutants
         ))
@@ -248,6 +159,7 @@ def draw_yearly_emission_plot(request):
     return JsonResponse(item)
 
 
+@prerendered_chart(DATASET_EMISSIONS, DATASET_POLLUTANTS)
 def draw_emission_distribution_plot(request):
     """
     Returns a rendered yearly emission distribution plot with a script and div object.
@@ -258,28 +170,16 @@ def draw_emission_distribution_plot(request):
     country = request.GET.get("countries", None)
     pollutant = request.GET.get('pollutant', None)
 
-    list_agriculture = []
-    list_commercial = []
-    list_energyP = []
-    list_energyU = []
-    list_industrial = []
-    list_nonroadT = []
-    list_roadT = []
-    list_waste = []
-    list_other = []
-
     sectors = ['Agriculture', 'Commercial, institutional and households', 'Energy production and distribution',
                'Energy use in industry', 'Industrial processes and product use', 'Non-road transport', 'Road transport',
                'Waste', 'Other']
 
-    years = []
-
     try:
-        response = EEADataModel.get_sectors_info(year="", country_code=country, pollutant=pollutant)
-        sector_api_sucess = True
-
-        if not response:
-            sector_api_sucess = False
+        df = EmissionsCube.get_df(country_codes=[country], pollutants=[pollutant])
+        sector_api_sucess = len(df) > 0
+        totals = df[df.is_national_total].groupby('year').total_emissions.sum()
+        # year x sector_group
+        df = df[~df.is_national_total].groupby(['year', 'sector_group']).total_emissions.sum().unstack()
     except:
         sector_api_sucess = False
 
@@ -295,51 +195,18 @@ def draw_emission_distribution_plot(request):
     p.yaxis.minor_tick_line_color = None  # turn off y-axis minor ticks
 
     if sector_api_sucess:
-        for year in range(1990, 2017):
-            years.append(year)
-            agriculture = 0
-            if 'Agriculture' in response[country][year][pollutant]:
-                agriculture = response[country][year][pollutant]['Agriculture']
-            list_agriculture.append(agriculture)
-            commercial = 0
-            if 'Commercial, institutional and households' in response[country][year][pollutant]:
-                commercial = response[country][year][pollutant]['Commercial, institutional and households']
-            list_commercial.append(commercial)
-            energyP = 0
-            if 'Energy production and distribution' in response[country][year][pollutant]:
-                energyP = response[country][year][pollutant]['Energy production and distribution']
-            list_energyP.append(energyP)
-            energyU = 0
-            if 'Energy use in industry' in response[country][year][pollutant]:
-                energyU = response[country][year][pollutant]['Energy use in industry']
-            list_energyU.append(energyU)
-            industrial = 0
-            if 'Industrial processes and product use' in response[country][year][pollutant]:
-                industrial = response[country][year][pollutant]['Industrial processes and product use']
-            list_industrial.append(industrial)
-            nonroadT = 0
-            if 'Non-road transport' in response[country][year][pollutant]:
-                nonroadT = response[country][year][pollutant]['Non-road transport']
-            list_nonroadT.append(nonroadT)
-            roadT = 0
-            if 'Road transport' in response[country][year][pollutant]:
-                roadT = response[country][year][pollutant]['Road transport']
-            list_roadT.append(roadT)
-            waste = 0
-            if 'Waste' in response[country][year][pollutant]:
-                waste = response[country][year][pollutant]['Waste']
-            list_waste.append(waste)
-            other = 0
-            if 'NATIONAL_TOTAL' in response[country][year][pollutant]:
-                other = response[country][year][pollutant][
-                            'NATIONAL_TOTAL'] - agriculture - commercial - energyP - energyU - industrial - nonroadT - roadT - waste
-            list_other.append(other)
+        years = list(range(1990, 2017))
+        df = df.reindex(index=years, columns=sectors)
+
+        # 'Other' is the remainder of the national total
+        named = [s for s in sectors if s != 'Other']
+        df[named] = df[named].fillna(0)
+        df['Other'] = (totals.reindex(years) - df[named].sum(axis=1)).fillna(0)
 
         colors = Spectral9
         source = ColumnDataSource(data=dict(
-            xs=[years, years, years, years, years, years, years, years, years],
-            ys=[list_agriculture, list_commercial, list_energyP, list_energyU,
-                list_industrial, list_nonroadT, list_roadT, list_waste, list_other],
+            xs=[years] * len(sectors),
+            ys=[df[sector].tolist() for sector in sectors],
             labels=sectors,
             colors=colors
         ))
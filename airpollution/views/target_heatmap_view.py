@@ -1,4 +1,3 @@
-import json
 import numpy as np
 import pandas as pd
 import geopandas as gpd
@@ -14,6 +13,12 @@ from bokeh.palettes import RdYlGn11
 
 from airpollution.models.models_copernicus import SatelliteImageFiles
 from airpollution.models.models_pollutants import Target
+from airpollution.models.models_datasets import DATASET_POLLUTANTS, DATASET_COPERNICUS
+from airpollution.views.api_cache import prerendered_chart
+from airpollution.json_encoding import to_geojson
+
+# decimal places of the web mercator coordinates (metres) of the heatmap points
+MERCATOR_COORDINATE_PRECISION = 0
 
 
 def get_bounds(bottom_left_latlon: tuple = (-24.95, 30.05), top_right_latlon: tuple = (44.95, 69.95)):
@@ -62,6 +67,7 @@ def _build_gdf_from_image(image, x_range, y_range, filter_val):
     return i_gdf_filtered
 
 
+@prerendered_chart(DATASET_COPERNICUS, DATASET_POLLUTANTS)
 def draw_heatmap(request, plot_date: str = None, pollutants: list = ['PM25', 'PM10', 'NO2']):
     """
 
@@ -135,7 +141,9 @@ def draw_heatmap(request, plot_date: str = None, pollutants: list = ['PM25', 'PM
         i_gdf_filtered = _build_gdf_from_image(i, x_range, y_range, min_val)
 
         # create geo source
-        p_geo = GeoJSONDataSource(geojson=json.dumps(i_gdf_filtered.__geo_interface__))
+        # only the value is shown - the point coordinates are in metres (web mercator)
+        i_gdf_filtered = i_gdf_filtered[['value', 'geometry']].round({'value': 3})
+        p_geo = GeoJSONDataSource(geojson=to_geojson(i_gdf_filtered, precision=MERCATOR_COORDINATE_PRECISION))
 
         # create figure (canvas)
         p = figure(title=f'Satellite Image Average from {day}-{month}-{year} (>50% of target is shown in overlay)',
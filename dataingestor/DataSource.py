@@ -4,6 +4,22 @@ Abstract class that is extended to add new data sources
 """
 from abc import ABC, abstractmethod
 
+from airpollution.models import DatasetVersion
+from airpollution.views.chart_prerender import prerender_charts
+
+
+def bump_dataset_versions(names: tuple) -> None:
+    """
+    Increase the versions of datasets after they were loaded so that cached API responses are rebuilt.
+    The dashboard charts built from the datasets are rendered again.
+    :param names: Names of the datasets (eg: DATASET_OBSERVATIONS)
+    :return: None
+    """
+    for name in names:
+        DatasetVersion.bump(name)
+
+    prerender_charts(datasets=names)
+
 
 class DataSource(ABC):
     """
@@ -11,7 +27,10 @@ class DataSource(ABC):
     This class is extended for every data source of the application
     required methods:
     >
+    DATASETS lists the names of the datasets (eg: DATASET_OBSERVATIONS) written by the data source.
     """
+    DATASETS = ()
+
     def __init__(self, name: str, description: str = None):
         self._name = name
         self._description = description
@@ -57,6 +76,13 @@ class DataSource(ABC):
     def load_dummy_data(self):
         ...
 
+    def bump_dataset_versions(self) -> None:
+        """
+        Increase the versions of the datasets of this data source.
+        Must be called when loading completes so that cached API responses are rebuilt.
+        """
+        bump_dataset_versions(self.DATASETS)
+
     # @abstractmethod
     # def get_data(self, **kwargs):
     #     """
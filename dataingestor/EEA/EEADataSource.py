@@ -5,22 +5,47 @@ RDF EEA Data source which has emissions value based on country, year, pollutant
 """
 import csv
 import gzip
+import io
 import logging
-import multiprocessing
 import os
 import urllib.request
-import mmap
+import xml.etree.ElementTree as ET
 from multiprocessing.pool import Pool
 
+import pandas as pd
 import rdflib
-from django.db import transaction
+from django.db import connections, transaction
 
-from airpollution.models.models_eea import EEADataModel
-from dataingestor.DataSource import DataSource
+from airpollution.models.models_datasets import DATASET_EMISSIONS
+from airpollution.models.models_eea import EEADataModel, EmissionsCube, SectorGroup
+from dataingestor.DataSource import DataSource, bump_dataset_versions
 
 logging.basicConfig(level=logging.INFO)
 
-sectors_map = {
+RDF_BASE_URL = "http://r.eionet.europa.eu/rdfdumps/clrtap_nec_unfccc/"
+RDF_FILENAME = "clrtap_nfr09_gf.rdf.gz"
+
+RDF_NAMESPACE = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+SCHEMA_NAMESPACE = "http://reference.eionet.europa.eu/clrtap_nec_unfccc/schema/"
+
+# records extracted by default - all records are extracted with all=True
+RDF_YEAR = '2017'
+RDF_POLLUTANTS = ('SOx', 'NOx', 'NMVOC', 'CO')
+RDF_COUNTRIES = ('EU28', 'TR', 'IS', 'NO', 'LI', 'CH')
+
+# predicates extracted from each record of the dump
+RDF_PREDICATES = ('pollutant_name', 'country_code', 'year', 'sector_code', 'unit', 'emissions')
+
+# csv files written from the dump - one file per year
+CSV_PARTITION_PREFIX = "EEA_RDF_DATA_"
+CSV_HEADER = ['pollutant_name', 'year', 'country', 'sector', 'emissions', 'unit']
+
+# csv files are loaded into the database in chunks of this many bytes
+CHUNK_BYTES = 4 * 1024 * 1024
+# maximum number of records in a single insert
+BATCH_RECORD_COUNT = 10000
+
+SECTOR_GROUPS = {
     "Agriculture": set(["3B1a", "3B1b", "3B2", "3B3", "3B4a", "3B4d", "3B4e", "3B4f", "3B4gi", "3B4gii", "3B4giii",
                         "3B4giv", "3B4h", "3Da1", "3Da2a", "3Da2b", "3Da2c", "3Da3", "3Da4", "3Db", "3Dc", "3Dd", "3De",
                         "3Df", "3F", "3I"]),
@@ -42,8 +67,15 @@ sectors_map = {
                   "5D2", "5D3", "5E"])
 }
 
+# sector codes that are not in SECTOR_GROUPS belong to this group
+DEFAULT_SECTOR_GROUP = "NATIONAL_TOTAL"
+
+# inverted SECTOR_GROUPS {sector_code: sector_group}
+SECTOR_GROUP_BY_CODE = {code: group for group, codes in SECTOR_GROUPS.items() for code in codes}
+
 
 class EEADataSource(DataSource):
+    DATASETS = (DATASET_EMISSIONS,)
 
     def __init__(self, name: str, description: str = None):
         """
@@ -53,75 +85,87 @@ class EEADataSource(DataSource):
 
     def load_data(self, **kwargs) -> None:
         """
-        Load RDF data from EEA data source
-        :param kwargs: kwargs.
+        Load RDF data from EEA data source.
+        The gzipped RDF/XML dump is streamed and parsed once.  Records of all requested years, pollutants
+        and countries are extracted in the same pass and written to one csv file per year in target_dir.
+        :param kwargs: kwargs.  target_dir - directory of the csv files.
+                                years - Optional. List of years to extract (def: RDF_YEAR).
+                                pollutants - Optional. List of pollutant names (eg: NOx, PM2.5) (def: RDF_POLLUTANTS).
+                                countries - Optional. List of country codes (eg: DE, EU28) (def: RDF_COUNTRIES).
+                                all - Optional. If True, the filters that are not given are not applied and all
+                                      years, pollutants or countries are extracted.
+                                source_file - Optional. Local copy of the gzipped dump to read instead of downloading.
         """
-
-        # getting the RDF file
         target_dir = kwargs.get('target_dir')
-        baseurl = "http://r.eionet.europa.eu/rdfdumps/clrtap_nec_unfccc/"
-        filename = "clrtap_nfr09_gf.rdf.gz"
-        outfilepath = filename[:-3]
-
-        response = urllib.request.urlopen(baseurl + filename)
-        with open(outfilepath, 'wb') as outfile:
-            outfile.write(gzip.decompress(response.read()))
-
-        # creating RDF graph
-        pollution_graph = rdflib.Graph()
-        pollution_graph.parse(file=open(outfilepath, 'r'), format='xml')
-
-        # performing SPARQL query
-        results = pollution_graph.query("""
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        PREFIX clrtap_nec_unfccc: <http://reference.eionet.europa.eu/clrtap_nec_unfccc/schema/>
-        PREFIX country: <http://reference.eionet.europa.eu/clrtap_nec_unfccc/country/>
-        PREFIX sector: <http://reference.eionet.europa.eu/clrtap_nec_unfccc/clrtap_nec_nfr09_sector/> 
-
-        SELECT
-        ?pollutant_name
-        ?country_code
-        ?year
-        ?sector_code
-        ?unit
-        ?emissions
-
-        WHERE {{  
-
-           #?clrtap_nfr09_gf clrtap_nec_unfccc:country_code ?country_code .
-           #?clrtap_nfr09_gf clrtap_nec_unfccc:pollutant_name ?pollutant_name .
-           #?clrtap_nfr09_gf clrtap_nec_unfccc:year ?year .
-              ?clrtap_nfr09_gf clrtap_nec_unfccc:country_code ?country_code .
-              ?clrtap_nfr09_gf clrtap_nec_unfccc:pollutant_name ?pollutant_name .
-              ?clrtap_nfr09_gf clrtap_nec_unfccc:sector_code ?sector_code .
-              ?clrtap_nfr09_gf clrtap_nec_unfccc:unit ?unit .
-              ?clrtap_nfr09_gf clrtap_nec_unfccc:year ?year .
-              ?clrtap_nfr09_gf clrtap_nec_unfccc:emissions ?emissions .  
-
-           FILTER (?year = '2017')
-           FILTER (?pollutant_name in ('SOx', 'NOx', 'NMVOC', 'CO'))
-           #to be changed with EEA33
-           FILTER (?country_code in (country:EU28, country:TR, country:IS, country:NO, country:LI, country:CH))
-           #FILTER (?country_code in (country:EEA33))
-
-         }
-         }
-
-         """)
-
-        # create a full path to save file to
-        fpath = os.path.join(target_dir, "EEA_RDF_Complete_DATA.csv")
-
-        with open(fpath, 'w', newline='') as file:
-            writer = csv.writer(file)
-            for row in results:
-                p = str(row.asdict()['pollutant_name'].toPython())
-                y = str(row.asdict()['year'].toPython())
-                u = str(row.asdict()['unit'].toPython())
-                e = str(row.asdict()['emissions'].toPython())
-                c = row.asdict()['country_code']
-                s = row.asdict()['sector_code']
-                writer.writerow([p, y, ext(c), ext(s), e, u])
+        source_file = kwargs.get('source_file')
+        extract_all = kwargs.get('all', False)
+
+        years = kwargs.get('years') or (None if extract_all else [RDF_YEAR])
+        pollutants = kwargs.get('pollutants') or (None if extract_all else RDF_POLLUTANTS)
+        countries = kwargs.get('countries') or (None if extract_all else RDF_COUNTRIES)
+
+        if source_file:
+            stream = open(source_file, 'rb')
+        else:
+            stream = urllib.request.urlopen(RDF_BASE_URL + RDF_FILENAME)
+
+        with stream, gzip.GzipFile(fileobj=stream) as rdf_stream:
+            counts = self._write_csv_partitions_from_rdf(rdf_stream, target_dir,
+                                                         years=None if years is None else {str(y) for y in years},
+                                                         pollutants=None if pollutants is None else set(pollutants),
+                                                         countries=None if countries is None else
+                                                         {c.upper() for c in countries})
+
+        for year, count in sorted(counts.items()):
+            logging.info(f"Saved {count} emission records for {year}")
+
+    @staticmethod
+    def _write_csv_partitions_from_rdf(rdf_stream, target_dir: str, years: set = None, pollutants: set = None,
+                                       countries: set = None, batch_size: int = 10000) -> dict:
+        """
+        Write the records of an RDF/XML stream that match the filters to a csv file per year.
+        :param rdf_stream: File-like object with the RDF/XML data
+        :param target_dir: Directory of the csv files
+        :param years: Optional. Years to write.  If None, all years are written.
+        :param pollutants: Optional. Pollutants to write.  If None, all pollutants are written.
+        :param countries: Optional. Countries to write.  If None, all countries are written.
+        :param batch_size: Number of rows written at a time to each file
+        :return: Dictionary with the number of rows written per year
+        """
+        files, writers, rows, counts = {}, {}, {}, {}
+
+        def _flush(year):
+            writers[year].writerows(rows[year])
+            counts[year] += len(rows[year])
+            rows[year] = []
+
+        try:
+            for r in iter_rdf_records(rdf_stream):
+                year = r['year']
+                if (years is not None and year not in years) \
+                        or (pollutants is not None and r['pollutant_name'] not in pollutants) \
+                        or (countries is not None and r['country_code'] not in countries):
+                    continue
+
+                if year not in writers:
+                    files[year] = open(get_partition_file(target_dir, year), 'w', newline='')
+                    writers[year] = csv.writer(files[year])
+                    writers[year].writerow(CSV_HEADER)
+                    rows[year], counts[year] = [], 0
+
+                rows[year].append([r['pollutant_name'], year, r['country_code'], r['sector_code'], r['emissions'],
+                                   r['unit']])
+
+                if len(rows[year]) >= batch_size:
+                    _flush(year)
+
+            for year in writers.keys():
+                _flush(year)
+        finally:
+            for f in files.values():
+                f.close()
+
+        return counts
 
     def load_dummy_data(self):
         """
@@ -135,61 +179,110 @@ class EEADataSource(DataSource):
         Loads data from file
         :param filepath: path of the file to load
         """
-        BATCH_RECORD_COUNT = 10000
+        EEADataSource.load_db_from_files([filepath])
 
-        for obj in EEADataModel.objects.all():
-            obj.delete()
+    @staticmethod
+    def load_db_from_files(filepaths: list, processes: int = 1, years: list = None) -> int:
+        """
+        Loads data from files.  Existing records of the loaded years are replaced.
+        Each file is split into chunks at line boundaries and every chunk is read once.
+        :param filepaths: paths of the files to load (eg: get_partition_files())
+        :param processes: Optional. Number of processes loading chunks in parallel.  Defaults to 1 (serial).
+        :param years: Optional. Years of the records in the files.  If None, all existing records are replaced.
+        :return: Number of records loaded
+        """
+        # missing files fail before any records are deleted
+        chunks = []
+        for filepath in filepaths:
+            chunks += get_file_chunks(filepath)
+
+        if years is None:
+            EEADataModel.objects.all().delete()
+        else:
+            EEADataModel.objects.filter(year__in=[int(y) for y in years]).delete()
+
+        # create the sector groups before the chunks are loaded
+        SectorGroup.get_group_ids(list(SECTOR_GROUPS) + [DEFAULT_SECTOR_GROUP])
+
+        if processes > 1:
+            # forked processes must open their own database connections
+            connections.close_all()
+            with Pool(processes=processes) as pool:
+                counts = pool.map(process_file_chunk, chunks)
+        else:
+            counts = [process_file_chunk(data) for data in chunks]
 
-        with open(filepath, "r+b") as f:
-            map_file = mmap.mmap(f.fileno(), 0)
-            record_line_number = []
-            for i, _ in enumerate(iter(map_file.readline, b"")):
-                if i == 0 or i % BATCH_RECORD_COUNT == 0:
-                    record_line_number.append((i, BATCH_RECORD_COUNT, filepath))
+        # the sectors and trend views read the pre-aggregated totals
+        EmissionsCube.rebuild()
 
-        ## Serial processing
-        for data in record_line_number:
-            process_file_chunk(data)
+        # load_data() only writes the csv files - the dataset changes when the files are loaded
+        bump_dataset_versions(EEADataSource.DATASETS)
 
+        return sum(counts)
 
-def process_file_chunk(data: tuple):
+
+def get_file_chunks(filepath: str, chunk_bytes: int = CHUNK_BYTES) -> list:
+    """
+    Split a csv file into chunks of whole lines.  The header line is excluded.
+    :param filepath: path of the csv file
+    :param chunk_bytes: approximate size of each chunk in bytes
+    :return: list of (filepath, start byte, end byte) tuples
+    """
+    chunks = []
+    with open(filepath, "rb") as f:
+        # files written by load_data() have a header line
+        first_line = f.readline()
+        start = len(first_line) if first_line.startswith(CSV_HEADER[0].encode()) else 0
+
+        file_size = os.fstat(f.fileno()).st_size
+        while start < file_size:
+            # extend the chunk to the end of the line
+            f.seek(min(start + chunk_bytes, file_size))
+            f.readline()
+            end = min(f.tell(), file_size)
+
+            chunks.append((filepath, start, end))
+            start = end
+
+    return chunks
+
+
+def process_file_chunk(data: tuple) -> int:
     """
     This is for batch loading
-    :param data: data to load
-    """
-    logging.info('Received data {} for processing'.format(str(data)))
-    filepath = data[2]
-    start_line_num = data[0]
-    end_line_num = start_line_num + data[1]
-
-    with open(filepath) as csv_file:
-        csv_reader = csv.reader(csv_file, delimiter=',')
-        records = []
-        for i, row in enumerate(csv_reader):
-            if i == 0 or i < start_line_num:
-                continue
-            if i >= end_line_num:
-                break
+    :param data: (filepath, start byte, end byte) of the chunk to load
+    :return: number of records loaded
+    """
+    filepath, start, end = data
+    logging.info(f'Processing bytes {start} to {end} of {filepath}')
 
-            try:
-                emission_value = float(row[4])
-            except:
-                logging.error('Error in converting to float. {}'.format(row))
-                continue
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        df = pd.read_csv(io.BytesIO(f.read(end - start)), header=None, names=CSV_HEADER, dtype=str,
+                         keep_default_na=False)
+
+    df['emissions'] = pd.to_numeric(df.emissions, errors='coerce')
+    for row in df[df.emissions.isna()].itertuples(index=False):
+        logging.error('Error in converting to float. {}'.format(list(row)))
+    df = df.dropna(subset=['emissions'])
+
+    group_ids = SectorGroup.get_group_ids()
+    df['sector_group_id'] = df.sector.map(SECTOR_GROUP_BY_CODE).fillna(DEFAULT_SECTOR_GROUP).map(group_ids)
 
-            record = EEADataModel.objects.create(year=row[1],
-                                                 pollutant_name=row[0],
-                                                 unit=row[5],
-                                                 country=row[2],
-                                                 sector=row[3],
-                                                 sector_group=get_sector_group(row[3]),
-                                                 emissions=emission_value)
-            records.append(record)
+    records = [EEADataModel(year=int(r.year),
+                            pollutant_name=r.pollutant_name,
+                            unit=r.unit,
+                            country=r.country,
+                            sector=r.sector,
+                            sector_group_id=int(r.sector_group_id),
+                            emissions=r.emissions)
+               for r in df.itertuples(index=False)]
 
-        logging.info('Processing lines {} to {}'.format(start_line_num, i - 1))
-        with transaction.atomic():
-            EEADataModel.objects.bulk_create(records, ignore_conflicts=True)
-        logging.info('Processed lines {} to {}'.format(start_line_num, i - 1))
+    with transaction.atomic():
+        EEADataModel.objects.bulk_create(records, batch_size=BATCH_RECORD_COUNT, ignore_conflicts=True)
+    logging.info(f'Processed bytes {start} to {end} of {filepath}')
+
+    return len(records)
 
 #######################
 # SUPPORT FUNCTIONS
@@ -202,26 +295,7 @@ def get_sector_group(sector_code) -> str:
     :param sector_code: sector code
     :return: returns the sector group information
     """
-    if sector_code in sectors_map["Agriculture"]:
-        return "Agriculture"
-    elif sector_code in sectors_map["Commercial, institutional and households"]:
-        return "Commercial, institutional and households"
-    elif sector_code in sectors_map["Energy production and distribution"]:
-        return "Energy production and distribution"
-    elif sector_code in sectors_map["Energy use in industry"]:
-        return "Energy use in industry"
-    elif sector_code in sectors_map["Industrial processes and product use"]:
-        return "Industrial processes and product use"
-    elif sector_code in sectors_map["Road transport"]:
-        return "Road transport"
-    elif sector_code in sectors_map["Non-road transport"]:
-        return "Non-road transport"
-    elif sector_code in sectors_map["Other"]:
-        return "Other"
-    elif sector_code in sectors_map["Waste"]:
-        return "Waste"
-    else:
-        return "NATIONAL_TOTAL"
+    return SECTOR_GROUP_BY_CODE.get(sector_code, DEFAULT_SECTOR_GROUP)
 
 
 def extract_name(uri) -> str:
@@ -244,6 +318,95 @@ def extract_name(uri) -> str:
     return uri
 
 
+def parse_years(years: list) -> list:
+    """
+    Expand a list of years and year ranges.
+    :param years: list of years (eg: 2017) and ranges of years (eg: 2013-2017)
+    :return: list of years
+    """
+    if years is None:
+        return None
+
+    rv = []
+    for y in years:
+        if '-' in y:
+            start, end = y.split('-')
+            rv += [str(x) for x in range(int(start), int(end) + 1)]
+        else:
+            rv.append(str(int(y)))
+
+    return rv
+
+
+def get_partition_file(target_dir: str, year) -> str:
+    """
+    Path of the csv file with the emissions records of a year
+    :param target_dir: directory of the csv files
+    :param year: year of the records
+    :return: full path of the file
+    """
+    return os.path.join(target_dir, f"{CSV_PARTITION_PREFIX}{year}.csv")
+
+
+def get_partition_files(target_dir: str, years: list = None) -> list:
+    """
+    Paths of the csv files written by EEADataSource.load_data()
+    :param target_dir: directory of the csv files
+    :param years: Optional. Years of the files to return.  If None, all files in target_dir are returned.
+    :return: sorted list of full paths of the files
+    """
+    if years is not None:
+        fpaths = [get_partition_file(target_dir, y) for y in years]
+        return sorted(f for f in fpaths if os.path.exists(f))
+
+    return sorted(os.path.join(target_dir, f) for f in os.listdir(target_dir)
+                  if f.startswith(CSV_PARTITION_PREFIX) and f.endswith('.csv'))
+
+
+def iter_rdf_records(rdf_stream, predicates: tuple = RDF_PREDICATES):
+    """
+    Generator of the records in an RDF/XML stream.
+    Each top-level element is a record and its children in the schema namespace are its predicates.
+    Elements are cleared once they are read so the whole document is never held in memory.
+    :param rdf_stream: File-like object with the RDF/XML data
+    :param predicates: The predicates to extract
+    :return: Yields a dictionary of the predicate values of each record that has all the predicates.
+             Resources (eg: country and sector codes) are reduced to their trailing name.
+    """
+    tags = {f"{{{SCHEMA_NAMESPACE}}}{p}": p for p in predicates}
+    resource_attrib = f"{{{RDF_NAMESPACE}}}resource"
+
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(rdf_stream, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+
+        # only top-level elements (children of rdf:RDF) are records
+        if depth != 1:
+            continue
+
+        record = {}
+        for child in elem:
+            p = tags.get(child.tag)
+            if p is None:
+                continue
+
+            resource = child.get(resource_attrib)
+            record[p] = ext(resource) if resource is not None else (child.text or '').strip()
+
+        elem.clear()
+        root.clear()
+
+        if len(record) == len(predicates):
+            yield record
+
+
 def ext(uri) -> str:
     """
     Shortcut function for extract_name()
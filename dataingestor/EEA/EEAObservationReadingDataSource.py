@@ -12,11 +12,13 @@ import requests
 from django.core.exceptions import ObjectDoesNotExist
 from tqdm import tqdm
 
-from airpollution.models import EU_ISOCODES, Pollutant, ObservationStation, EUCountries, ObservationStationReading
+from airpollution.models import EU_ISOCODES, Pollutant, ObservationStation, EUCountries, ObservationStationReading, \
+    DATASET_OBSERVATIONS
 from dataingestor.DataSource import DataSource
 
 
 class ReadingDataSource(DataSource):
+    DATASETS = (DATASET_OBSERVATIONS,)
 
     def __init__(self, name: str, logger: logging.Logger, description: str = None):
         DataSource.__init__(self, name, description)
@@ -84,6 +86,7 @@ class ReadingDataSource(DataSource):
         else:
             self._load_by_countries(country_codes, pollutants, year_from, year_to, since_date, month)
 
+        self.bump_dataset_versions()
         self.logger.info("Done loading Observation Readings.")
 
     def load_dummy_data(self, **kwargs):
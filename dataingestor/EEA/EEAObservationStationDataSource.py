@@ -7,12 +7,14 @@ import logging
 import requests
 
 from airpollution.models.models_observations import ObservationStation
-from airpollution.models.models_nuts import NutsRegions, EUCountries, CURRENT_NUTS_VERSION
+from airpollution.models.models_datasets import DATASET_STATIONS
+from airpollution.models.models_nuts import EUCountries, CURRENT_NUTS_VERSION, get_nuts_locator
 from eugreendeal.settings import MEDIA_ROOT
 from dataingestor.DataSource import DataSource
 
 
 class EEAStationDataSource(DataSource):
+    DATASETS = (DATASET_STATIONS,)
 
     def __init__(self, name: str, logger: logging.Logger, description: str = None):
         DataSource.__init__(self, name, description)
@@ -40,6 +42,8 @@ class EEAStationDataSource(DataSource):
         df = self._get_station_df(filename=fpath)
         self._load_db_from_df(df)
 
+        self.bump_dataset_versions()
+
     def load_dummy_data(self):
         pass
 
@@ -139,20 +143,17 @@ class EEAStationDataSource(DataSource):
         :return: The same dataframe with the addition of the nuts regions
         """
 
-        # get a NUTS geoframe for local speed
-        nuts_gdf = NutsRegions.get_nuts_geoframe(nuts_version=CURRENT_NUTS_VERSION)
+        locator = get_nuts_locator(CURRENT_NUTS_VERSION)
 
-        def add_nuts(s: gpd.GeoSeries) -> gpd.GeoSeries:
-            rv = nuts_gdf[nuts_gdf.contains(s.geometry)][['LEVL_CODE', 'db_record']]
-            rv.set_index('LEVL_CODE', drop=True, inplace=True)
-            rv.rename(index={0: 'NUTS_0', 1: 'NUTS_1', 2: 'NUTS_2', 3: 'NUTS_3'}, inplace=True)
-            return s.append(rv.T.iloc[0])
+        # make sure the stations_df has the same crs as the NUTS regions
+        gdf = gdf.to_crs(locator.crs)
 
-        # make sure the nuts_df and the stations_df have the same crs
-        gdf = gdf.to_crs(nuts_gdf.crs)
+        # locate all stations at once for each nuts level
+        lats, lons = gdf.geometry.y.values, gdf.geometry.x.values
+        for nuts_level in [0, 1, 2, 3]:
+            gdf[f'NUTS_{nuts_level}'] = locator.locate_records(lats, lons, nuts_level=nuts_level)
 
-        # apply the nuts columns based on location
-        return gdf.apply(add_nuts, axis=1)
+        return gdf
 
     def _load_db_from_df(self, stations_gdf: gpd.GeoDataFrame) -> str:
         """
@@ -4,17 +4,26 @@ Population data source, includes information of population based in nuts 2 regio
 by years.
 
 """
-import csv
 import gzip
 import logging
+import os
 
+import pandas as pd
 import requests
-from airpollution.models.models_nuts import NutsRegions
-from airpollution.models import EurostatDataModel
-from dataingestor.DataSource import DataSource
+from django.db import transaction
+
+from airpollution.models.models_nuts import NutsRegions, CURRENT_NUTS_VERSION
+from airpollution.models import EurostatDataModel, DATASET_POPULATION
+from dataingestor.DataSource import DataSource, bump_dataset_versions
+
+POPULATION_URL = "https://ec.europa.eu/eurostat/estat-navtree-portlet-prod/BulkDownloadListing?file=data/tgs00096.tsv.gz"
+
+# maximum number of records in a single insert
+BATCH_RECORD_COUNT = 5000
 
 
 class EurostatDataSource(DataSource):
+    DATASETS = (DATASET_POPULATION,)
 
     def __init__(self, name: str, description: str = None):
         """
@@ -25,97 +34,95 @@ class EurostatDataSource(DataSource):
     def load_data(self, **kwargs) -> None:
         """
         Load population data from eurostat data source based on nuts 2 region.
-        :param kwargs: kwargs.
+        :param kwargs: kwargs.  target_dir = directory where the downloaded file is saved.
         """
-        # erase everything first
-        for t in EurostatDataModel.objects.all():
-            t.delete()
-
         # downloading url
-        url = "https://ec.europa.eu/eurostat/estat-navtree-portlet-prod/BulkDownloadListing?file=data/tgs00096.tsv.gz"
+        r = requests.get(POPULATION_URL)
 
-        r = requests.get(url)
-
-        fname = url.split('/')[-1]
-        outfilepath = fname[:-3]
+        fname = POPULATION_URL.split('/')[-1]
+        outfilepath = os.path.join(kwargs.get('target_dir') or '', fname[:-3])
 
         try:
-            # putting data into model
             with open(outfilepath, "wb") as f:
                 f.write(gzip.decompress(r.content))
-            with open(outfilepath) as tsvfile:
-                reader = csv.reader(tsvfile, delimiter='\t')
-                next(reader)
-                for row in reader:
-                    nutsRegionStr = row[0].split(',')[3]
-
-                    if NutsRegions.objects.filter(NUTS_ID=nutsRegionStr).exists():
-                        nutsRegion = NutsRegions.objects.get(NUTS_ID=nutsRegionStr)
-
-                        record = EurostatDataModel.objects.create(year=2008,
-                                                              population=_get_pollution_value(row[1]),
-                                                              nutsRegionStr=nutsRegionStr,
-                                                              nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2009,
-                                                                  population=_get_pollution_value(row[2]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2010,
-                                                                  population=_get_pollution_value(row[3]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2011,
-                                                                  population=_get_pollution_value(row[4]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2012,
-                                                                  population=_get_pollution_value(row[5]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2013,
-                                                                  population=_get_pollution_value(row[6]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2014,
-                                                                  population=_get_pollution_value(row[7]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2015,
-                                                                  population=_get_pollution_value(row[8]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2016,
-                                                                  population=_get_pollution_value(row[9]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2017,
-                                                                  population=_get_pollution_value(row[10]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2018,
-                                                                  population=_get_pollution_value(row[11]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-                        record.save()
-                        record = EurostatDataModel.objects.create(year=2019,
-                                                                  population=_get_pollution_value(row[12]),
-                                                                  nutsRegionStr=nutsRegionStr,
-                                                                  nutsRegion=nutsRegion)
-
-                        record.save()
+
+            count = EurostatDataSource.load_db_from_file(outfilepath)
         except Exception as e:
             print(e)
-        logging.info("Loaded pollutants.")
+            return
+
+        logging.info(f"Loaded {count} population records.")
+
+    @staticmethod
+    def load_db_from_file(filepath: str) -> int:
+        """
+        Load the population of each nuts 2 region by year from a downloaded tsv file.
+        The years are read from the header of the file.  Only (region, year) values that are new or
+        changed are written and records that are no longer in the file are removed.
+        :param filepath: path of the tsv file
+        :return: Number of records created or updated
+        """
+        df = pd.read_csv(filepath, sep='\t', dtype=str, keep_default_na=False)
+
+        # first column is 'unit,sex,age,geo\time' - the year columns follow
+        df = df.rename(columns={df.columns[0]: 'geo'})
+        df['geo'] = df.geo.str.split(',').str[-1]
+        years = {c: int(c.strip()) for c in df.columns[1:] if c.strip().isdigit()}
+
+        # wide (a column per year) to long (a row per region and year)
+        df = df[['geo'] + list(years)].melt(id_vars='geo', var_name='year', value_name='value')
+        df['year'] = df.year.map(years)
+        df = pd.concat([df, _parse_values(df.value)], axis=1)
+
+        # only regions that are loaded and values that are available are kept
+        region_keys = _get_region_keys()
+        df['region_key'] = df.geo.map(region_keys)
+        df = df[df.region_key.notna() & df.population.notna()]
+
+        # existing records by (region, year) - duplicates are removed
+        existing = {}
+        stale_ids = []
+        for r in EurostatDataModel.objects.values_list('id', 'nutsRegionStr', 'year', 'population', 'flags',
+                                                       'nutsRegion_id'):
+            if (r[1], r[2]) in existing:
+                stale_ids.append(r[0])
+            else:
+                existing[(r[1], r[2])] = r
+
+        creates = []
+        updates = []
+        for r in df.itertuples(index=False):
+            record = EurostatDataModel(year=int(r.year),
+                                       population=int(r.population),
+                                       flags=r.flags,
+                                       nutsRegionStr=r.geo,
+                                       nutsRegion_id=r.region_key)
+
+            current = existing.pop((r.geo, record.year), None)
+            if current is None:
+                creates.append(record)
+            elif current[3:] != (record.population, record.flags, record.nutsRegion_id):
+                record.id = current[0]
+                updates.append(record)
+
+        # records that are not in the file
+        stale_ids += [r[0] for r in existing.values()]
+
+        with transaction.atomic():
+            for i in range(0, len(stale_ids), BATCH_RECORD_COUNT):
+                EurostatDataModel.objects.filter(id__in=stale_ids[i:i + BATCH_RECORD_COUNT]).delete()
+            EurostatDataModel.objects.bulk_update(updates, ['population', 'flags', 'nutsRegion'],
+                                                  batch_size=BATCH_RECORD_COUNT)
+            EurostatDataModel.objects.bulk_create(creates, batch_size=BATCH_RECORD_COUNT)
+
+        logging.info(f"Population records created: {len(creates)}, updated: {len(updates)}, "
+                     f"removed: {len(stale_ids)}.")
+
+        # the cached population of every process is stale
+        if creates or updates or stale_ids:
+            bump_dataset_versions(EurostatDataSource.DATASETS)
+
+        return len(creates) + len(updates)
 
     def load_dummy_data(self):
         """
@@ -130,15 +137,28 @@ class EurostatDataSource(DataSource):
 #######################
 
 
-def _get_pollution_value(value: str) -> int:
+def _parse_values(values: pd.Series) -> pd.DataFrame:
+    """
+    Split eurostat values into the number and its flags (eg: '1234 p' is 1234 and 'p').
+    Values that are not available are ':' (eg: ': c').
+    :param values: Series of strings which contain population information
+    :return: DataFrame with columns population (NaN if not available) and flags
+    """
+    parts = values.str.strip().str.split(n=1, expand=True).reindex(columns=[0, 1])
+
+    return pd.DataFrame({'population': pd.to_numeric(parts[0], errors='coerce'),
+                         'flags': parts[1].fillna('').str.strip()}, index=values.index)
+
+
+def _get_region_keys() -> dict:
     """
-    Shortcut function for extracting number
-    :param str: string which contains poppulation informatin
-    :return: int value of population
+    Map NUTS_ID to the key of the region.  Regions of the current nuts version are used
+    if a NUTS_ID is in more than one version.
+    :return: dictionary of {NUTS_ID: key}
     """
-    number = 0
-    array = [int(s) for s in value.split() if s.isdigit()]
-    if len(array) != 0:
-        number = array[0]
+    rs = NutsRegions.objects.order_by('year').values_list('NUTS_ID', 'key', 'year')
+
+    region_keys = {nuts_id: key for nuts_id, key, year in rs}
+    region_keys.update({nuts_id: key for nuts_id, key, year in rs if year == str(CURRENT_NUTS_VERSION)})
 
-    return number
+    return region_keys
@@ -12,11 +12,12 @@ If a new measurement is needed, a new Measurements sub class should be added.
 """
 import logging
 
-from airpollution.models import Target, Measurement, Pollutant
+from airpollution.models import Target, Measurement, Pollutant, reset_pollutant_registry, DATASET_POLLUTANTS
 from dataingestor.DataSource import DataSource
 
 
 class PollutantDataSource(DataSource):
+    DATASETS = (DATASET_POLLUTANTS,)
 
     def __init__(self, logger: logging.Logger):
         DataSource.__init__(self, "Pollutants", "Dictionary of Pollutants, mappings and measurements")
@@ -277,6 +278,9 @@ class PollutantDataSource(DataSource):
         #     eea_key=None)
         # pol.save()
 
+        # the registry is also reset by the post_save signal of each pollutant
+        reset_pollutant_registry()
+        self.bump_dataset_versions()
         self.logger.info("Loaded pollutants.")
 
     def load_dummy_data(self):
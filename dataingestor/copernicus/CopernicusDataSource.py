@@ -13,7 +13,8 @@ from scipy.io import netcdf_file
 
 from eugreendeal.settings import MEDIA_ROOT
 from dataingestor.DataSource import DataSource
-from airpollution.models.models_copernicus import SatelliteImageFiles
+from airpollution.models.models_copernicus import SatelliteImageFiles, SatelliteRegionalAggregate
+from airpollution.models.models_datasets import DATASET_COPERNICUS
 from airpollution.models.models_pollutants import Pollutant, Target
 
 # Global variable for the directory where NC files are saved
@@ -21,6 +22,7 @@ TARGET_DIR = os.path.join(MEDIA_ROOT, 'media', 'satellite_data')
 
 
 class CopernicusDataSource(DataSource):
+    DATASETS = (DATASET_COPERNICUS,)
 
     def __init__(self, logger: logging.Logger, name: str, description: str = None, token: str = None):
         DataSource.__init__(self, name, description)
@@ -74,6 +76,7 @@ class CopernicusDataSource(DataSource):
         # r_message = self.load_db_from_df(df)
         r_message = self._load_images_direct_to_db(reference_time)
 
+        self.bump_dataset_versions()
         self.logger.info(r_message)
 
     def load_dummy_data(self):
@@ -248,12 +251,20 @@ class CopernicusDataSource(DataSource):
                                                         image=img
                                                         )
             record.save()
-            return 1
 
         except Exception as e:
             self.logger.error(f"{e}")
             return 0
 
+        try:
+            # regional statistics of the image
+            count = SatelliteRegionalAggregate.load_for_image(record, image=surface_dayavg_image)
+            self.logger.debug(f"Loaded {count} regional aggregates for {record.key}")
+        except Exception as e:
+            self.logger.error(f"Regional aggregates not loaded for {record.key}. {e}")
+
+        return 1
+
 
 
     # def download_daily_files(self, token: str,
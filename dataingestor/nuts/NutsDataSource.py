@@ -9,7 +9,11 @@ from tqdm import tqdm
 import geopandas as gpd
 import pandas as pd
 
-from airpollution.models.models_nuts import NutsRegions, EU_ISOCODES, EUCountries
+from airpollution.models.models_copernicus import reset_grid_labels
+from airpollution.models.models_nuts import NutsRegions, EU_ISOCODES, EUCountries, NutsRegionsSimplified, \
+    SIMPLIFY_TOLERANCES, get_eu_bounds_polygon, reset_nuts_locators
+from airpollution.models.models_datasets import DATASET_NUTS
+from airpollution.nuts_geojson_cache import warm_geojson_cache
 from dataingestor.DataSource import DataSource
 from eugreendeal.settings import MEDIA_ROOT
 
@@ -17,6 +21,7 @@ DATA_DIR = os.path.join(MEDIA_ROOT, 'media', 'mapdata', 'ref-nuts-2016-60m')
 
 
 class NutsDataSource(DataSource):
+    DATASETS = (DATASET_NUTS,)
 
     def __init__(self, name: str, logger: logging.Logger, description: str = None):
         DataSource.__init__(self, name, description)
@@ -41,9 +46,22 @@ class NutsDataSource(DataSource):
             # load_db from the df
             self._load_data_from_df(df)
 
+            # load the simplified boundaries used to render maps
+            self._load_simplified_from_df(df, year=year, nuts_level=nuts_level)
+
         # Load EU countries
         self._load_EU_countries()
 
+        # point lookups must use the reloaded regions
+        reset_nuts_locators()
+        reset_grid_labels()
+
+        self.bump_dataset_versions()
+
+        # serialize the map boundaries of the new dataset version once so that map requests do not need to
+        self.logger.info("Caching NUTS map GeoJSON")
+        warm_geojson_cache(nuts_version=year)
+
         self.logger.info("Done Loading NUTS data.. ")
 
     def load_dummy_data(self):
@@ -103,6 +121,40 @@ class NutsDataSource(DataSource):
 
         self.logger.debug(f"Loaded {loaded} observations. Skipped {skipped}")
 
+    def _load_simplified_from_df(self, df: gpd.GeoDataFrame, year: str, nuts_level: int) -> None:
+        """
+        Load the simplified boundaries of the regions in the df for every tolerance in SIMPLIFY_TOLERANCES.
+        Geometries are clipped to the EU bounds here so that maps do not need to clip them per request.
+        :param df: GeoPandas dataframe created by _get_df_from_file()
+        :param year: The NUTS version year
+        :param nuts_level: The nuts level of the regions in the df
+        """
+        # erase the prior simplified boundaries for the level
+        NutsRegionsSimplified.objects.filter(region__year=year, region__LEVL_CODE=nuts_level).delete()
+
+        # adding buffer(0) will correct any self-overlapping objects
+        clipped_df = df.copy()
+        clipped_df['geometry'] = clipped_df.geometry.buffer(0)
+        clipped_df = gpd.clip(clipped_df, get_eu_bounds_polygon())
+
+        records = []
+        for tolerance in SIMPLIFY_TOLERANCES:
+            # preserve_topology keeps every simplified region a valid polygon
+            simplified = clipped_df.geometry.simplify(tolerance, preserve_topology=True)
+
+            for key, geometry in zip(clipped_df['key'], simplified):
+                if geometry is None or geometry.is_empty:
+                    continue
+
+                records.append(NutsRegionsSimplified(key=f'{key}_{tolerance}',
+                                                     region_id=key,
+                                                     tolerance=tolerance,
+                                                     geometry=geometry.wkt))
+
+        NutsRegionsSimplified.objects.bulk_create(records, batch_size=10000, ignore_conflicts=True)
+
+        self.logger.debug(f"Loaded {len(records)} simplified boundaries for NUTS level {nuts_level}.")
+
     def _get_df_from_file(self, year: str, crs: int, nuts_level: int) -> gpd.GeoDataFrame:
         """
         Get a GeoPandas dataframe based on a json file.
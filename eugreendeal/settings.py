@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # compresses JSON responses - must be before middleware that reads or changes the response content
+    'airpollution.middleware.CompressJsonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -128,6 +130,38 @@ if 'test' in sys.argv: #and 'keepdb' in sys.argv
         }
     }
 
+# Caches
+# The /aq_api responses are cached without expiry.  Cached responses are replaced when a data source
+# loads a dataset (see airpollution/views/api_cache.py).  The file cache is shared by the server processes.
+# Set AQ_API_CACHE_REDIS to a redis url (eg: redis://127.0.0.1:6379/1) to use django-redis instead.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'aq_api': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('AQ_API_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'aq_api')),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        }
+    }
+}
+
+if os.environ.get('AQ_API_CACHE_REDIS'):
+    CACHES['aq_api'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('AQ_API_CACHE_REDIS'),
+        'TIMEOUT': None,
+    }
+
+if 'test' in sys.argv:
+    CACHES['aq_api'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'aq_api',
+        'TIMEOUT': None,
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -186,3 +220,9 @@ if os.environ.get('WORKSPACE') == 'PROD':
 # Use local media folder storage for GRIB/NETCDF satellite images and maps
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(os.path.abspath(os.path.curdir), 'airpollution')
+
+# Decimal places of the coordinates (in degrees) of the GeoJSON sent to maps.  5 decimals is about 1 metre.
+GEOJSON_COORDINATE_PRECISION = 5
+
+# Threads that run the sub-queries of an /aq_api/batch request with parallel=true
+AQ_API_BATCH_WORKERS = int(os.environ.get('AQ_API_BATCH_WORKERS', 4))